@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 10:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0008_alter_patient_full_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patientassignment',
+            name='active_order_count',
+            field=models.PositiveIntegerField(default=0, help_text='Orders in PLACED, PREPARING or READY (maintained on write)', verbose_name='active order count'),
+        ),
+    ]
@@ -208,6 +208,11 @@ class PatientAssignment(models.Model):
         default=True,
         help_text=_('Whether patient can create new orders')
     )
+    active_order_count = models.PositiveIntegerField(
+        _('active order count'),
+        default=0,
+        help_text=_('Orders in PLACED, PREPARING or READY (maintained on write)')
+    )
     is_active = models.BooleanField(
         _('is active'),
         default=True,
@@ -156,13 +156,14 @@ class PatientAssignmentSerializer(serializers.ModelSerializer):
             'survey_enabled',
             'survey_enabled_at',
             'can_patient_order',
+            'active_order_count',
             'is_active',
             'started_at',
             'ended_at',
             'created_at',
             'updated_at'
         ]
-        read_only_fields = ['id', 'started_at', 'ended_at', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'active_order_count', 'started_at', 'ended_at', 'created_at', 'updated_at']
 
     def get_staff_details(self, obj):
         """Get staff member details"""
@@ -74,16 +74,16 @@ class PatientViewSet(viewsets.ModelViewSet):
         Get all orders for a patient
         GET /api/clinic/patients/{id}/orders/
         """
-        from orders.serializers import OrderSerializer
+        from orders.archive import patient_order_history, serialize_order_history
         
         patient = self.get_object()
-        orders = patient.orders.all().prefetch_related('items', 'items__product').order_by('-placed_at')
+        # Includes orders moved to the archive tables
+        total_orders, orders = patient_order_history(patient)
         
-        serializer = OrderSerializer(orders, many=True)
         return Response({
             'success': True,
-            'count': orders.count(),
-            'orders': serializer.data
+            'count': total_orders,
+            'orders': serialize_order_history(orders)
         })
 
     @action(detail=True, methods=['get'])
@@ -130,13 +130,13 @@ class PatientViewSet(viewsets.ModelViewSet):
         Get complete patient information including orders, feedbacks, and assignments
         GET /api/clinic/patients/{id}/full_details/
         """
-        from orders.serializers import OrderSerializer
+        from orders.archive import patient_order_history, serialize_order_history
         from feedbacks.serializers import FeedbackSerializer
         
         patient = self.get_object()
         
-        # Get orders
-        orders = patient.orders.all().prefetch_related('items', 'items__product').order_by('-placed_at')
+        # Get the last 10 orders (hot and archived)
+        total_orders, orders = patient_order_history(patient, limit=10)
         
         # Get feedbacks
         feedbacks = patient.feedbacks.all().select_related(
@@ -149,7 +149,6 @@ class PatientViewSet(viewsets.ModelViewSet):
         ).order_by('-started_at')
         
         # Calculate statistics
-        total_orders = orders.count()
         total_feedbacks = feedbacks.count()
         
         # Average ratings from feedbacks
@@ -165,7 +164,7 @@ class PatientViewSet(viewsets.ModelViewSet):
                 'avg_staff_rating': round(avg_staff_rating, 2),
                 'avg_stay_rating': round(avg_stay_rating, 2),
             },
-            'orders': OrderSerializer(orders[:10], many=True).data,  # Last 10 orders
+            'orders': serialize_order_history(orders),  # Last 10 orders
             'feedbacks': FeedbackSerializer(feedbacks[:10], many=True).data,  # Last 10 feedbacks
             'assignments': PatientAssignmentSerializer(assignments[:10], many=True).data,  # Last 10 assignments
         })
@@ -18,7 +18,10 @@ django_asgi_app = get_asgi_application()
 
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import OriginValidator
+from orders.outbox import start_dispatcher
+from orders.queue import start_read_model
 from orders.routing import websocket_urlpatterns
+from orders.sweeper import start_sweeper
 from django.conf import settings
 
 # Custom origin validator that uses WS_ALLOWED_ORIGINS from settings
@@ -26,9 +29,35 @@ class CustomOriginValidator(OriginValidator):
     def __init__(self, application):
         super().__init__(application, settings.WS_ALLOWED_ORIGINS)
 
+
+# Starts a background task on the server's event loop with the first
+# connection; start() must be idempotent (it runs on every connection)
+class BackgroundTaskStarter:
+    def __init__(self, application, start):
+        self.application = application
+        self.start = start
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] in ('http', 'websocket'):
+            self.start()
+        return await self.application(scope, receive, send)
+
+
 application = ProtocolTypeRouter({
     'http': django_asgi_app,
     'websocket': CustomOriginValidator(
         URLRouter(websocket_urlpatterns)
     ),
 })
+
+# Order outbox dispatcher: retries broadcasts that failed right after commit
+if settings.ORDER_OUTBOX_DISPATCHER == 'asgi':
+    application = BackgroundTaskStarter(application, start_dispatcher)
+
+# In-process order queue read model, kept current from staff_orders events
+if settings.ORDER_QUEUE_READ_MODEL:
+    application = BackgroundTaskStarter(application, start_read_model)
+
+# Cancels stale open orders every ORDER_STALE_SWEEP_INTERVAL seconds
+if settings.ORDER_STALE_SWEEP_INTERVAL > 0:
+    application = BackgroundTaskStarter(application, start_sweeper)
@@ -319,6 +319,7 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'idempotency-key',
 ]
 
 
@@ -344,6 +345,71 @@ else:
         },
     }
 
+# Inventory reservation engine for new orders:
+# 'pessimistic' locks the cart's products and balances (select_for_update),
+# 'optimistic' reserves with one conditional UPDATE per product, no up-front locks
+INVENTORY_RESERVATION_MODE = os.getenv('INVENTORY_RESERVATION_MODE', 'pessimistic')
+# Reserve hot products on striped counters (set up with the stripe_inventory command)
+INVENTORY_STRIPED_RESERVATIONS = os.getenv('INVENTORY_STRIPED_RESERVATIONS', 'False') == 'True'
+# Products per transaction of the daily snapshot_inventory command
+INVENTORY_SNAPSHOT_CHUNK_SIZE = int(os.getenv('INVENTORY_SNAPSHOT_CHUNK_SIZE', 500))
+# reconcile_inventory: products per transaction, and how recent a movement must
+# be to stay out of the ledger checkpoints (transactions that may still be open)
+INVENTORY_RECONCILE_BATCH_SIZE = int(os.getenv('INVENTORY_RECONCILE_BATCH_SIZE', 500))
+INVENTORY_RECONCILE_LAG_SECONDS = int(os.getenv('INVENTORY_RECONCILE_LAG_SECONDS', 300))
+# Low-stock alerts: level for products without a reorder level, and the
+# minimum interval between two low_stock alerts of the same product
+INVENTORY_LOW_STOCK_LEVEL = int(os.getenv('INVENTORY_LOW_STOCK_LEVEL', 10))
+INVENTORY_LOW_STOCK_DEBOUNCE_SECONDS = int(os.getenv('INVENTORY_LOW_STOCK_DEBOUNCE_SECONDS', 600))
+
+# Orders
+# How long a kiosk Idempotency-Key can replay the original order response (seconds)
+ORDER_IDEMPOTENCY_TTL = int(os.getenv('ORDER_IDEMPOTENCY_TTL', 24 * 60 * 60))
+
+# Broadcast outbox: 'asgi' runs the retry dispatcher inside the ASGI process,
+# 'command' leaves it to `python manage.py dispatch_outbox --loop`
+ORDER_OUTBOX_DISPATCHER = os.getenv('ORDER_OUTBOX_DISPATCHER', 'asgi')
+ORDER_OUTBOX_POLL_INTERVAL = float(os.getenv('ORDER_OUTBOX_POLL_INTERVAL', 1.0))
+ORDER_OUTBOX_MAX_ATTEMPTS = int(os.getenv('ORDER_OUTBOX_MAX_ATTEMPTS', 10))
+# Published (or given up) events older than this are purged by the dispatcher
+ORDER_OUTBOX_RETENTION_DAYS = int(os.getenv('ORDER_OUTBOX_RETENTION_DAYS', 7))
+
+# Rows each dashboard order status counter is split across (orders/counters.py)
+ORDER_COUNTER_SHARDS = int(os.getenv('ORDER_COUNTER_SHARDS', 8))
+
+# Archiving: delivered/cancelled orders older than this move to the archive
+# tables (`python manage.py archive_orders`)
+ORDER_ARCHIVE_AFTER_DAYS = int(os.getenv('ORDER_ARCHIVE_AFTER_DAYS', 90))
+ORDER_ARCHIVE_BATCH_SIZE = int(os.getenv('ORDER_ARCHIVE_BATCH_SIZE', 500))
+
+# In-process read model of the open order queue (ASGI only); reloads from the
+# database when a staff_orders event is missing for longer than the grace period
+ORDER_QUEUE_READ_MODEL = os.getenv('ORDER_QUEUE_READ_MODEL', 'True') == 'True'
+ORDER_QUEUE_RESYNC_GRACE = float(os.getenv('ORDER_QUEUE_RESYNC_GRACE', 5.0))
+
+# Admission control for order creation: at most MAX_IN_FLIGHT concurrent
+# requests per process, MAX_QUEUE more wait up to MAX_WAIT seconds, the rest
+# get 503 + Retry-After (MAX_IN_FLIGHT = 0 disables it)
+ORDER_ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ORDER_ADMISSION_MAX_IN_FLIGHT', 8))
+ORDER_ADMISSION_MAX_QUEUE = int(os.getenv('ORDER_ADMISSION_MAX_QUEUE', 32))
+ORDER_ADMISSION_MAX_WAIT = float(os.getenv('ORDER_ADMISSION_MAX_WAIT', 2.0))
+ORDER_ADMISSION_RETRY_AFTER = int(os.getenv('ORDER_ADMISSION_RETRY_AFTER', 2))
+
+# Order/stock write endpoints: lock_timeout per request (ms, 0 = none), retries
+# on deadlocks/serialization failures/lock timeouts, and the lock wait above
+# which the locked rows are reported as contended in /api/orders/metrics/
+DB_LOCK_TIMEOUT_MS = int(os.getenv('DB_LOCK_TIMEOUT_MS', 2000))
+DB_LOCK_TIMEOUT_MS_BY_ENDPOINT = {}
+DB_RETRY_MAX_ATTEMPTS = int(os.getenv('DB_RETRY_MAX_ATTEMPTS', 3))
+DB_RETRY_BACKOFF = float(os.getenv('DB_RETRY_BACKOFF', 0.05))
+DB_CONTENTION_THRESHOLD_MS = int(os.getenv('DB_CONTENTION_THRESHOLD_MS', 100))
+
+# Stale order sweeper: PLACED/PREPARING orders not updated for this long are
+# cancelled and their stock released (`python manage.py cancel_stale_orders`);
+# a sweep interval > 0 (seconds) also runs it inside the ASGI process
+ORDER_STALE_AFTER_MINUTES = int(os.getenv('ORDER_STALE_AFTER_MINUTES', 12 * 60))
+ORDER_STALE_SWEEP_INTERVAL = float(os.getenv('ORDER_STALE_SWEEP_INTERVAL', 0))
+
 # WebSocket Configuration
 WS_ALLOWED_ORIGINS = [
     origin.strip()
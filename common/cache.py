@@ -0,0 +1,14 @@
+from django.core.cache import cache
+from django.db import transaction
+
+
+def invalidate_now_and_on_commit(key):
+    """
+    Drop a cached value now and again after the current transaction commits
+
+    A read between the first delete and the commit can re-cache the old value
+    (it does not see this transaction's writes yet); the second delete drops
+    that stale copy. Outside a transaction on_commit runs immediately.
+    """
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
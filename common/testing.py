@@ -0,0 +1,120 @@
+"""
+Shared test helpers for the order and inventory apps
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from accounts.models import Role, UserRole
+from catalog.models import Product, ProductCategory
+from clinic.models import Device, Patient, PatientAssignment, Room
+from inventory.models import InventoryBalance
+
+User = get_user_model()
+
+# JWT auth, page-number pagination and no throttling
+TEST_REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework_simplejwt.authentication.JWTAuthentication',
+    ],
+    'DEFAULT_PERMISSION_CLASSES': [
+        'rest_framework.permissions.IsAuthenticated',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'PAGE_SIZE': 50,
+    'DEFAULT_THROTTLE_CLASSES': [],
+    'DEFAULT_THROTTLE_RATES': {},
+}
+
+
+def create_test_data(order_limits=None):
+    """Helper para crear los objetos necesarios para tests de ordenes"""
+    staff_user = User.objects.create_user(
+        email='staff@test.com', password='testpass123',
+        full_name='Staff Test', is_staff=True
+    )
+    # Assign STAFF role so IsStaffOrAdmin permission passes
+    staff_role, _ = Role.objects.get_or_create(name='STAFF')
+    UserRole.objects.create(user=staff_user, role=staff_role)
+
+    room = Room.objects.create(code='R101', is_active=True)
+    device = Device.objects.create(
+        device_uid='test-device-001',
+        device_type='IPAD',
+        room=room,
+        is_active=True
+    )
+    patient = Patient.objects.create(
+        full_name='Paciente Test',
+        phone_e164='+1234567890'
+    )
+    if order_limits is None:
+        order_limits = {'DRINK': 5, 'SNACK': 5}
+    assignment = PatientAssignment.objects.create(
+        patient=patient,
+        staff=staff_user,
+        room=room,
+        device=device,
+        is_active=True,
+        can_patient_order=True,
+        order_limits=order_limits
+    )
+    category = ProductCategory.objects.create(
+        name='Bebidas',
+        category_type='DRINK',
+        is_active=True
+    )
+    product = Product.objects.create(
+        name='Jugo de Naranja',
+        category=category,
+        is_active=True,
+        unit_label='vaso'
+    )
+    # Signal auto-creates InventoryBalance on Product creation, so update it
+    balance = InventoryBalance.objects.get(product=product)
+    balance.on_hand = 10
+    balance.reserved = 0
+    balance.save()
+    return {
+        'staff_user': staff_user,
+        'room': room,
+        'device': device,
+        'patient': patient,
+        'assignment': assignment,
+        'category': category,
+        'product': product,
+    }
+
+
+@override_settings(REST_FRAMEWORK=TEST_REST_FRAMEWORK)
+class KioskOrderTestCase(TestCase):
+    """
+    Base de los tests de ordenes e inventario: REST_FRAMEWORK de tests, cache
+    limpia, datos de create_test_data() como atributos y un APIClient
+    order_limits se pasa a create_test_data()
+    """
+    order_limits = None
+
+    def setUp(self):
+        super().setUp()
+        # Reset the anonymous throttle history (kiosk requests) and the cached policies between tests
+        cache.clear()
+        for name, value in create_test_data(order_limits=self.order_limits).items():
+            setattr(self, name, value)
+        self.client = APIClient()
+
+    def create_order(self, quantity=1, items=None):
+        """Crea una orden desde el kiosco; items es una lista de (producto, cantidad)"""
+        if items is None:
+            items = [(self.product, quantity)]
+        return self.client.post('/api/public/orders/create', {
+            'device_uid': self.device.device_uid,
+            'items': [{'product_id': product.id, 'quantity': q} for product, q in items]
+        }, format='json')
+
+    def place_order(self, quantity=1, items=None):
+        """create_order() que debe responder 201; devuelve el id de la orden"""
+        response = self.create_order(quantity, items)
+        self.assertEqual(response.status_code, 201)
+        return response.data['order']['id']
@@ -1,5 +1,6 @@
 import apiClient from './client';
 import axios from 'axios';
+import type { CursorPaginatedResponse, Order } from '../types/api';
 
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000';
 
@@ -59,7 +60,8 @@ export const ordersApi = {
     return response.data;
   },
 
-  getOrderQueue: async (statuses?: string, myOrders?: boolean) => {
+  // Cursor-paginated, newest first: follow "next" for older orders
+  getOrderQueue: async (statuses?: string, myOrders?: boolean): Promise<CursorPaginatedResponse<Order>> => {
     const params = new URLSearchParams();
     if (statuses) params.append('status', statuses);
     if (myOrders) params.append('my_orders', 'true');
@@ -1,12 +1,15 @@
 import React, { useState, useEffect } from 'react';
 import { useAuth } from '../../auth/AuthContext';
 import { adminApi } from '../../api/admin';
+import { useWebSocket } from '../../hooks/useWebSocket';
 import Sidebar from '../../components/admin/Sidebar';
 import {
   BarChart, Bar, PieChart, Pie, Cell,
   XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer
 } from 'recharts';
 
+const WS_BASE_URL = import.meta.env.VITE_WS_BASE_URL || 'ws://localhost:8000';
+
 const NewAdminDashboardPage: React.FC = () => {
   const { user, logout } = useAuth();
   const [stats, setStats] = useState<any>(null);
@@ -19,6 +22,29 @@ const NewAdminDashboardPage: React.FC = () => {
     return () => clearInterval(interval);
   }, []);
 
+  // Low-stock alerts are pushed by the staff WebSocket as products cross their level
+  const token = localStorage.getItem('access_token');
+  useWebSocket({
+    url: `${WS_BASE_URL}/ws/staff/orders/?token=${token}`,
+    onMessage: (message: any) => {
+      if (message.type !== 'low_stock' && message.type !== 'low_stock_cleared') {
+        return;
+      }
+      setStats((prev: any) => {
+        if (!prev?.products) {
+          return prev;
+        }
+        const others = (prev.products.low_stock || []).filter(
+          (item: any) => item.product_id !== message.product_id
+        );
+        const lowStock = message.type === 'low_stock'
+          ? [...others, message].sort((a: any, b: any) => a.available - b.available).slice(0, 5)
+          : others;
+        return { ...prev, products: { ...prev.products, low_stock: lowStock } };
+      });
+    },
+  });
+
   const loadDashboardStats = async () => {
     try {
       const data = await adminApi.getDashboardStats();
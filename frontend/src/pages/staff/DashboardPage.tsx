@@ -185,7 +185,7 @@ const DashboardPage: React.FC = () => {
       }
       const ordersResponse = await apiClient.get('/orders/queue/', { params });
       const ordersData = ordersResponse.data;
-      const orders = ordersData.orders || [];
+      const orders = ordersData.results || [];
 
       setStats({
         activeOrders: orders.filter((o: any) => o.status === 'PLACED' || o.status === 'PREPARING').length,
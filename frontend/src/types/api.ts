@@ -161,3 +161,9 @@ export interface PaginatedResponse<T> {
   previous?: string;
   results: T[];
 }
+
+export interface CursorPaginatedResponse<T> {
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import InventoryBalance, InventoryMovement
+from .striping import with_stripe_reserved
 
 
 @admin.register(InventoryBalance)
@@ -23,6 +24,9 @@ class InventoryBalanceAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        return with_stripe_reserved(super().get_queryset(request))
+
     def available_display(self, obj):
         return obj.available
     available_display.short_description = 'Available'
@@ -34,7 +38,7 @@ class InventoryBalanceAdmin(admin.ModelAdmin):
 
 @admin.register(InventoryMovement)
 class InventoryMovementAdmin(admin.ModelAdmin):
-    list_display = ['id', 'product', 'movement_type', 'quantity', 'order', 'created_by', 'created_at']
+    list_display = ['id', 'product', 'movement_type', 'direction', 'quantity', 'order', 'created_by', 'created_at']
     list_filter = ['movement_type', 'created_at', 'product__category']
     search_fields = ['product__name', 'note', 'created_by__email', 'order__id']
     readonly_fields = ['created_at']
@@ -42,7 +46,7 @@ class InventoryMovementAdmin(admin.ModelAdmin):
 
     fieldsets = (
         ('Movement Information', {
-            'fields': ('product', 'movement_type', 'quantity')
+            'fields': ('product', 'movement_type', 'direction', 'quantity')
         }),
         ('Related Information', {
             'fields': ('order', 'created_by', 'note')
@@ -0,0 +1,125 @@
+"""
+Low-stock alerts
+
+A product is low on stock when its available quantity (on_hand minus the
+reservations, stripes included) is at or below its reorder level, or below
+INVENTORY_LOW_STOCK_LEVEL when it has none.
+
+The paths that change available stock (order reservation and release, stock
+adjustments, bulk stock operations) pass their per-product deltas to
+check_low_stock(), which reads the touched balances with one query and
+detects threshold crossings:
+
+- falling to or below the level sends a `low_stock` event to the staff_orders
+  group (StaffOrderConsumer), at most once per product every
+  INVENTORY_LOW_STOCK_DEBOUNCE_SECONDS, so a product hovering around its
+  level does not flood the tablets. The last alert is stamped on the balance
+  (low_stock_alerted_at), so the debounce holds across processes;
+- rising back above it sends `low_stock_cleared`.
+
+Both are published after commit through the outbox. The list of low-stock
+products (low_stock_products(), read by the dashboard) is cached: a crossing
+drops it, and it expires after LOW_STOCK_CACHE_TIMEOUT seconds because the
+default cache is per process and its figures (on_hand, available) also
+change without a crossing. Dashboard refreshes within that window do not
+query the balances.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from common.cache import invalidate_now_and_on_commit
+from orders.outbox import enqueue_broadcast
+
+from .models import InventoryBalance
+from .striping import stripe_reserved
+
+LOW_STOCK_CACHE_KEY = 'inventory:low_stock'
+LOW_STOCK_CACHE_TIMEOUT = 60
+DEFAULT_LOW_STOCK_LEVEL = 10
+DEFAULT_DEBOUNCE_SECONDS = 600
+STAFF_GROUP = 'staff_orders'
+
+
+def low_stock_level():
+    return getattr(settings, 'INVENTORY_LOW_STOCK_LEVEL', DEFAULT_LOW_STOCK_LEVEL)
+
+
+def _balances_with_available():
+    return InventoryBalance.objects.annotate(
+        available_stock=F('on_hand') - F('reserved') - Coalesce(stripe_reserved(), 0),
+        threshold=Coalesce('reorder_level', Value(low_stock_level())),
+    )
+
+
+def _row(balance):
+    return {
+        'product_id': balance.product_id,
+        'product__name': balance.product.name,
+        'on_hand': balance.on_hand,
+        'available': balance.available_stock,
+        'reorder_level': balance.reorder_level,
+    }
+
+
+def low_stock_products():
+    """Low-stock products, lowest availability first (cached until the next crossing or the timeout)"""
+    rows = cache.get(LOW_STOCK_CACHE_KEY)
+    if rows is None:
+        rows = [
+            _row(balance)
+            for balance in _balances_with_available().filter(available_stock__lte=F('threshold')).select_related(
+                'product'
+            ).order_by('available_stock', 'product__name')
+        ]
+        cache.set(LOW_STOCK_CACHE_KEY, rows, LOW_STOCK_CACHE_TIMEOUT)
+    return rows
+
+
+def invalidate_low_stock():
+    invalidate_now_and_on_commit(LOW_STOCK_CACHE_KEY)
+
+
+def _debounced(balance, now):
+    """Whether a low_stock alert was sent for the product within the debounce window"""
+    window = getattr(settings, 'INVENTORY_LOW_STOCK_DEBOUNCE_SECONDS', DEFAULT_DEBOUNCE_SECONDS)
+    alerted_at = balance.low_stock_alerted_at
+    return alerted_at is not None and (now - alerted_at).total_seconds() < window
+
+
+def check_low_stock(available_deltas):
+    """
+    Detect low-stock crossings caused by {product_id: change of available}
+    (after the change was written, inside its transaction)
+    Returns the (product_id, is_low) crossings
+    """
+    deltas = {pid: delta for pid, delta in available_deltas.items() if delta}
+    if not deltas:
+        return []
+
+    now = timezone.now()
+    crossings = []
+    alerted = []
+    for balance in _balances_with_available().filter(product_id__in=deltas).select_related('product'):
+        before = balance.available_stock - deltas[balance.product_id]
+        is_low = balance.available_stock <= balance.threshold
+        if is_low == (before <= balance.threshold):
+            continue
+        crossings.append((balance.product_id, is_low))
+        if is_low and _debounced(balance, now):
+            continue
+        enqueue_broadcast(STAFF_GROUP, dict(
+            _row(balance),
+            type='low_stock' if is_low else 'low_stock_cleared',
+            threshold=balance.threshold,
+        ))
+        if is_low:
+            alerted.append(balance.product_id)
+
+    if alerted:
+        InventoryBalance.objects.filter(product_id__in=alerted).update(low_stock_alerted_at=now)
+    if crossings:
+        invalidate_low_stock()
+    return crossings
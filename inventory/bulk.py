@@ -0,0 +1,179 @@
+"""
+Bulk stock receipts and adjustments (POST /api/inventory/stock/bulk)
+
+A delivery of a few hundred SKUs is one request instead of one per product.
+Lines come as JSON ({"lines": [...]}) or as an uploaded CSV file with the
+columns product_id or sku, type (RECEIPT or ADJUSTMENT), quantity (receipts),
+delta (adjustments) and note.
+
+Every line is validated before anything is written, products are resolved
+with one query, the balances are locked once in product_id order, and the
+changes are written with one bulk_update plus one bulk_create of movements.
+The batch is all or nothing: when any line fails, nothing is applied and the
+per-line report says which lines to fix.
+"""
+import csv
+import io
+
+from django.db.models import Q
+from django.utils import timezone
+
+from catalog.models import Product
+
+from .alerts import check_low_stock
+from .models import InventoryBalance, InventoryMovement
+from .serializers import StockBulkLineSerializer
+from .services import lock_balances
+from .striping import fit_capacity, lock_stripes
+
+MAX_LINES = 1000
+
+
+class BulkStockError(Exception):
+    """The batch cannot be applied; report holds one entry per line"""
+
+    def __init__(self, report):
+        super().__init__('Bulk stock operation rejected')
+        self.report = report
+
+
+def read_csv(uploaded_file):
+    """Rows of an uploaded CSV file as dicts (blank cells dropped)"""
+    text = io.TextIOWrapper(uploaded_file, encoding='utf-8-sig')
+    return [
+        {key.strip().lower(): value.strip() for key, value in row.items() if key and value and value.strip()}
+        for row in csv.DictReader(text)
+    ]
+
+
+def _line_report(line, data, errors=None):
+    data = data if isinstance(data, dict) else {}
+    report = {
+        'line': line,
+        'product_id': data.get('product_id'),
+        'type': data.get('type'),
+        'status': 'error' if errors else 'valid',
+    }
+    if errors:
+        report['errors'] = errors
+    return report
+
+
+def validate_lines(raw_lines):
+    """
+    Validate the lines and resolve their products (one query)
+    Returns the validated lines (dicts with line, product, type, delta, note);
+    raises BulkStockError with the per-line report when any line is invalid
+    """
+    serializers = [StockBulkLineSerializer(data=raw) for raw in raw_lines]
+    valid = [serializer.is_valid() for serializer in serializers]
+
+    validated = [serializer.validated_data for serializer, ok in zip(serializers, valid) if ok]
+    product_ids = {data['product_id'] for data in validated if 'product_id' in data}
+    skus = {data['sku'] for data in validated if 'sku' in data}
+    products = list(Product.objects.filter(Q(id__in=product_ids) | Q(sku__in=skus), is_active=True))
+    by_id = {product.id: product for product in products}
+    by_sku = {product.sku: product for product in products if product.sku}
+
+    lines = []
+    report = []
+    for number, (serializer, ok) in enumerate(zip(serializers, valid), start=1):
+        if not ok:
+            report.append(_line_report(number, serializer.initial_data, serializer.errors))
+            continue
+        data = serializer.validated_data
+        product = by_id.get(data['product_id']) if 'product_id' in data else by_sku.get(data['sku'])
+        if product is None:
+            report.append(_line_report(number, data, {'product': ['Product not found or inactive']}))
+            continue
+        line = {
+            'line': number,
+            'product': product,
+            'type': data['type'],
+            'delta': data['quantity'] if data['type'] == 'RECEIPT' else data['delta'],
+            'note': data.get('note', ''),
+        }
+        lines.append(line)
+        report.append(_line_report(number, dict(data, product_id=product.id)))
+
+    if any(entry['status'] == 'error' for entry in report):
+        raise BulkStockError(report)
+    return lines
+
+
+def apply_lines(lines, user=None):
+    """
+    Apply validated lines in order; must run inside transaction.atomic()
+    Raises BulkStockError (nothing written) when an adjustment would leave a
+    product below zero or below its reserved quantity
+    Returns the per-line report with the resulting on_hand
+    """
+    product_ids = sorted({line['product'].id for line in lines})
+    InventoryBalance.objects.bulk_create(
+        [InventoryBalance(product_id=product_id, on_hand=0, reserved=0) for product_id in product_ids],
+        ignore_conflicts=True
+    )
+    balances = lock_balances(product_ids)
+    stripes = {
+        product_id: lock_stripes(product_id)
+        for product_id, balance in balances.items() if balance.stripe_count
+    }
+    initial = {product_id: balance.on_hand for product_id, balance in balances.items()}
+
+    report = []
+    failed = False
+    for line in lines:
+        product_id = line['product'].id
+        balance = balances[product_id]
+        new_on_hand = balance.on_hand + line['delta']
+        reserved = balance.reserved + sum(stripe.reserved for stripe in stripes.get(product_id, []))
+        entry = {'line': line['line'], 'product_id': product_id, 'type': line['type'], 'status': 'ok'}
+        if new_on_hand < 0:
+            entry.update(status='error', errors={'delta': [
+                f'Insufficient stock. Current: {balance.on_hand}, Requested delta: {line["delta"]}'
+            ]})
+        elif new_on_hand < reserved:
+            entry.update(status='error', errors={'delta': [
+                f'Cannot reduce stock below reserved quantity. Reserved: {reserved}, New on_hand would be: {new_on_hand}'
+            ]})
+        else:
+            balance.on_hand = new_on_hand
+            entry['on_hand'] = new_on_hand
+        failed = failed or entry['status'] == 'error'
+        report.append(entry)
+
+    if failed:
+        for entry in report:
+            entry.pop('on_hand', None)
+            if entry['status'] == 'ok':
+                entry['status'] = 'valid'
+        raise BulkStockError(report)
+
+    # Give back the stripes' capacity that no longer exists
+    for product_id, product_stripes in stripes.items():
+        if balances[product_id].on_hand < initial[product_id]:
+            fit_capacity(balances[product_id], product_stripes, balances[product_id].on_hand)
+
+    now = timezone.now()
+    changed = [balance for product_id, balance in balances.items() if balance.on_hand != initial[product_id]]
+    for balance in changed:
+        balance.updated_at = now
+    InventoryBalance.objects.bulk_update(changed, ['on_hand', 'updated_at'])
+    check_low_stock({balance.product_id: balance.on_hand - initial[balance.product_id] for balance in changed})
+
+    InventoryMovement.objects.bulk_create([
+        InventoryMovement(
+            product=line['product'],
+            movement_type='RECEIPT',
+            quantity=line['delta'],
+            created_by=user,
+            note=line['note']
+        ) if line['type'] == 'RECEIPT' else InventoryMovement.adjustment(
+            line['delta'],
+            line['note'],
+            product=line['product'],
+            created_by=user
+        )
+        for line in lines
+    ])
+    return report
@@ -0,0 +1,127 @@
+"""
+Management command to compare the pessimistic and optimistic reservation
+engines under contention on a single hot product
+Usage:
+    python manage.py benchmark_reservations
+    python manage.py benchmark_reservations --workers 16 --iterations 100
+
+Every iteration places one order the way the kiosk endpoint does: one
+transaction that (pessimistic mode) locks the balance and checks the stock,
+creates the order and its item, runs the '' -> PLACED hooks of the state
+machine (RESERVE movements, active order count, status counters) and writes
+the status event. The engine is selected with INVENTORY_RESERVATION_MODE for
+the duration of each run.
+
+A temporary product is created; its orders are deleted afterwards and the
+order status counters are rebuilt (reconcile_order_counters) to drop them.
+"""
+import statistics
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from catalog.models import Product, ProductCategory
+from inventory.models import InventoryBalance
+from inventory.services import OPTIMISTIC, PESSIMISTIC, InsufficientStock, lock_balances
+from orders.counters import rebuild_counters
+from orders.models import Order, OrderItem, OrderStatusEvent
+from orders.state_machine import run_hooks
+
+
+def _place_order(product_id, quantity, mode):
+    """One kiosk-like order for quantity units; False when the stock ran out"""
+    try:
+        with transaction.atomic():
+            if mode == PESSIMISTIC:
+                balance = lock_balances([product_id])[product_id]
+                if balance.available < quantity:
+                    return False
+            order = Order.objects.create(status='PLACED', item_count=1, total_quantity=quantity)
+            OrderItem.objects.create(order=order, product_id=product_id, quantity=quantity)
+            run_hooks('', 'PLACED', [order])
+            OrderStatusEvent.objects.create(order=order, from_status='', to_status='PLACED', note='Benchmark')
+            return True
+    except InsufficientStock:
+        return False
+
+
+class Command(BaseCommand):
+    help = 'Benchmark pessimistic vs optimistic inventory reservation under contention'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent kiosks (threads)')
+        parser.add_argument('--iterations', type=int, default=50, help='Orders per worker')
+        parser.add_argument('--quantity', type=int, default=1, help='Units reserved per order')
+        parser.add_argument('--stock', type=int, help='Units on hand (default: enough for every order)')
+        parser.add_argument(
+            '--modes', default=f'{PESSIMISTIC},{OPTIMISTIC}',
+            help='Comma-separated engines to run'
+        )
+
+    def handle(self, *args, **options):
+        modes = [m.strip() for m in options['modes'].split(',') if m.strip() in (PESSIMISTIC, OPTIMISTIC)]
+        total = options['workers'] * options['iterations']
+        stock = options['stock'] if options['stock'] is not None else total * options['quantity']
+
+        category = ProductCategory.objects.create(name=f'Benchmark {uuid.uuid4().hex[:8]}', is_active=False)
+        product = Product.objects.create(name=f'Benchmark {category.name}', category=category, is_active=False)
+        try:
+            self.stdout.write(f'{options["workers"]} workers x {options["iterations"]} orders, stock {stock}')
+            for mode in modes:
+                # reorder_level -1: draining the benchmark product never raises a low-stock alert
+                InventoryBalance.objects.filter(product=product).update(on_hand=stock, reserved=0, reorder_level=-1)
+                with override_settings(INVENTORY_RESERVATION_MODE=mode):
+                    result = self.run_engine(mode, product.id, options)
+                self.report(mode, product.id, *result)
+        finally:
+            Order.objects.filter(items__product=product).delete()
+            product.delete()
+            category.delete()
+            rebuild_counters()
+
+    def run_engine(self, mode, product_id, options):
+        latencies = []
+        results = []
+        errors = []
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                for _ in range(options['iterations']):
+                    started = time.perf_counter()
+                    try:
+                        ok = _place_order(product_id, options['quantity'], mode)
+                    except Exception as exc:
+                        with lock:
+                            errors.append(exc)
+                        continue
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed)
+                        results.append(ok)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['workers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started, latencies, results, errors
+
+    def report(self, mode, product_id, elapsed, latencies, results, errors):
+        reserved = InventoryBalance.objects.get(product_id=product_id).reserved
+        latencies = sorted(latencies) or [0]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.stdout.write(self.style.SUCCESS(
+            f'{mode:12} {len(results) / elapsed:8.1f} tx/s  '
+            f'p50 {statistics.median(latencies) * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms  '
+            f'max {latencies[-1] * 1000:7.1f} ms  '
+            f'reserved {sum(results)}  rejected {results.count(False)}  errors {len(errors)}  '
+            f'(balance.reserved={reserved})'
+        ))
@@ -0,0 +1,66 @@
+"""
+Management command to check inventory balances against the movement ledger
+Usage:
+    python manage.py reconcile_inventory                 # report mismatches (movements since the last run)
+    python manage.py reconcile_inventory --full          # recompute the ledger from the first movement
+    python manage.py reconcile_inventory --fix balance   # rewrite mismatched balances from the ledger
+    python manage.py reconcile_inventory --fix ledger    # record movements so the ledger matches the balances
+    python manage.py reconcile_inventory --products 3,7 --batch-size 200
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.reconcile import DEFAULT_BATCH_SIZE, FIX_MODES, reconcile_inventory
+
+
+class Command(BaseCommand):
+    help = 'Compare inventory balances with the sum of their movements and report or fix the drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Ignore the checkpoints and read every movement')
+        parser.add_argument('--fix', choices=FIX_MODES, help='Correct mismatches: from the ledger (balance) or with new movements (ledger)')
+        parser.add_argument('--products', help='Comma-separated product ids (default all inventoried products)')
+        parser.add_argument(
+            '--batch-size', type=int,
+            default=getattr(settings, 'INVENTORY_RECONCILE_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+            help='Products per transaction'
+        )
+        parser.add_argument('--lag', type=int, help='Seconds of recent movements left out of the checkpoints')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be 1 or more')
+        product_ids = None
+        if options['products']:
+            try:
+                product_ids = [int(pid) for pid in options['products'].split(',') if pid.strip()]
+            except ValueError:
+                raise CommandError('--products must be a comma-separated list of ids')
+
+        checked = 0
+        found = 0
+        fixed = 0
+        for batch_checked, mismatches in reconcile_inventory(
+            product_ids=product_ids,
+            full=options['full'],
+            fix=options['fix'],
+            batch_size=options['batch_size'],
+            lag_seconds=options['lag'],
+        ):
+            checked += batch_checked
+            found += len(mismatches)
+            for mismatch in mismatches:
+                fixed += mismatch['fixed']
+                self.stdout.write(
+                    f"Product {mismatch['product_id']}: "
+                    f"on_hand={mismatch['on_hand']} ledger={mismatch['ledger_on_hand']}, "
+                    f"reserved={mismatch['reserved']} ledger={mismatch['ledger_reserved']}"
+                    f"{' (fixed)' if mismatch['fixed'] else ''}"
+                )
+
+        if options['fix']:
+            self.stdout.write(self.style.SUCCESS(f'Checked {checked} products: {found} mismatches, {fixed} fixed'))
+        elif found:
+            self.stdout.write(self.style.WARNING(f'Checked {checked} products: {found} mismatches (nothing written)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Checked {checked} products: balances match the ledger'))
@@ -0,0 +1,58 @@
+"""
+Management command to write the daily inventory snapshots (closing stock per product)
+Usage:
+    python manage.py snapshot_inventory                          # yesterday
+    python manage.py snapshot_inventory --date 2026-09-30
+    python manage.py snapshot_inventory --date 2026-09-30 --days 30   # backfill the 30 days up to that date
+    python manage.py snapshot_inventory --products 3,7 --chunk-size 200
+
+Run it once a day after midnight; reruns overwrite the snapshots of the same day.
+"""
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from inventory.snapshots import DEFAULT_CHUNK_SIZE, take_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Write per-product closing stock snapshots for past days'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Last day to snapshot (YYYY-MM-DD, default yesterday)')
+        parser.add_argument('--days', type=int, default=1, help='Number of days up to --date')
+        parser.add_argument('--products', help='Comma-separated product ids (default all inventoried products)')
+        parser.add_argument(
+            '--chunk-size', type=int,
+            default=getattr(settings, 'INVENTORY_SNAPSHOT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE),
+            help='Products per transaction'
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        if options['date']:
+            try:
+                last_day = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError('--date must be a date (YYYY-MM-DD)')
+        else:
+            last_day = today - timedelta(days=1)
+        if last_day >= today:
+            raise CommandError('--date must be a past day (today is not closed yet)')
+        if options['days'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--days and --chunk-size must be 1 or more')
+
+        product_ids = None
+        if options['products']:
+            try:
+                product_ids = [int(pid) for pid in options['products'].split(',') if pid.strip()]
+            except ValueError:
+                raise CommandError('--products must be a comma-separated list of ids')
+
+        first_day = last_day - timedelta(days=options['days'] - 1)
+        written = take_snapshots(first_day, last_day, product_ids=product_ids, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} snapshots from {first_day.isoformat()} to {last_day.isoformat()}'
+        ))
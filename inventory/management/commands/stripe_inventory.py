@@ -0,0 +1,63 @@
+"""
+Management command to set up striped reservation counters for hot products
+Usage:
+    python manage.py stripe_inventory --products 3,7 --stripes 8
+    python manage.py stripe_inventory --top 5 --stripes 4     # most reserved products (last 7 days)
+    python manage.py stripe_inventory --products 3 --stripes 0 # back to a single row
+
+Requires INVENTORY_STRIPED_RESERVATIONS. Fold every product back
+(--stripes 0) before disabling it.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+from django.utils import timezone
+
+from inventory.models import InventoryBalance, InventoryMovement
+from inventory.striping import set_stripes
+
+
+class Command(BaseCommand):
+    help = 'Split the reservations of hot products across striped counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', help='Comma-separated product ids')
+        parser.add_argument('--top', type=int, help='Stripe the N most reserved products of the last --days days')
+        parser.add_argument('--days', type=int, default=7, help='Window used by --top')
+        parser.add_argument('--stripes', type=int, required=True, help='Number of stripes (0 removes striping)')
+
+    def handle(self, *args, **options):
+        if options['stripes'] < 0:
+            raise CommandError('--stripes must be 0 or more')
+        if options['stripes'] and not getattr(settings, 'INVENTORY_STRIPED_RESERVATIONS', False):
+            raise CommandError('Enable INVENTORY_STRIPED_RESERVATIONS before striping products')
+
+        if options['products']:
+            try:
+                product_ids = [int(pid) for pid in options['products'].split(',') if pid.strip()]
+            except ValueError:
+                raise CommandError('--products must be a comma-separated list of ids')
+        elif options['top']:
+            product_ids = list(InventoryMovement.objects.filter(
+                movement_type='RESERVE',
+                created_at__gte=timezone.now() - timedelta(days=options['days'])
+            ).values('product_id').annotate(
+                total=Sum('quantity')
+            ).order_by('-total').values_list('product_id', flat=True)[:options['top']])
+        else:
+            raise CommandError('Pass --products or --top')
+
+        tracked = set(InventoryBalance.objects.filter(product_id__in=product_ids).values_list('product_id', flat=True))
+        for product_id in product_ids:
+            if product_id not in tracked:
+                self.stdout.write(self.style.WARNING(f'Product {product_id} has no inventory balance, skipped'))
+                continue
+            balance = set_stripes(product_id, options['stripes'])
+            self.stdout.write(
+                f'Product {product_id}: {balance.stripe_count} stripes, '
+                f'on_hand {balance.on_hand}, reserved {balance.reserved_total}'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Done'))
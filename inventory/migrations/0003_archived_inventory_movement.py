@@ -0,0 +1,36 @@
+# Generated by Django 5.2.3 on 2026-10-17 10:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_alter_product_is_active_alter_product_name_and_more'),
+        ('inventory', '0002_inventorymovement_order'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedInventoryMovement',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('movement_type', models.CharField(choices=[('RECEIPT', 'Receipt'), ('ADJUSTMENT', 'Adjustment'), ('WASTE', 'Waste'), ('RESERVE', 'Reserve'), ('RELEASE', 'Release'), ('CONSUME', 'Consume')], max_length=20, verbose_name='movement type')),
+                ('quantity', models.IntegerField(verbose_name='quantity')),
+                ('order_id', models.BigIntegerField(blank=True, db_index=True, null=True, verbose_name='order id')),
+                ('note', models.TextField(blank=True, verbose_name='note')),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='created by')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='catalog.product', verbose_name='product')),
+            ],
+            options={
+                'verbose_name': 'archived inventory movement',
+                'verbose_name_plural': 'archived inventory movements',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2026-10-17 11:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_alter_product_is_active_alter_product_name_and_more'),
+        ('inventory', '0003_archived_inventory_movement'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventorybalance',
+            name='stripe_count',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Number of reservation stripes (0 = reservations go to this row)', verbose_name='stripe count'),
+        ),
+        migrations.CreateModel(
+            name='InventoryStripe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField(verbose_name='index')),
+                ('capacity', models.IntegerField(default=0, help_text='Units of on_hand allotted to this stripe', verbose_name='capacity')),
+                ('reserved', models.IntegerField(default=0, help_text='Quantity reserved through this stripe', verbose_name='reserved quantity')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_stripes', to='catalog.product', verbose_name='product')),
+            ],
+            options={
+                'verbose_name': 'inventory stripe',
+                'verbose_name_plural': 'inventory stripes',
+                'ordering': ['product', 'index'],
+                'constraints': [models.UniqueConstraint(fields=('product', 'index'), name='uniq_inventory_stripe')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.3 on 2026-10-17 11:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_alter_product_is_active_alter_product_name_and_more'),
+        ('inventory', '0004_inventory_stripes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='date')),
+                ('on_hand', models.IntegerField(help_text='Quantity in stock at the end of the day', verbose_name='on hand quantity')),
+                ('reserved', models.IntegerField(help_text='Quantity reserved at the end of the day', verbose_name='reserved quantity')),
+                ('received', models.IntegerField(default=0, verbose_name='received')),
+                ('adjusted', models.IntegerField(default=0, help_text='Net adjustments (signed)', verbose_name='adjusted')),
+                ('wasted', models.IntegerField(default=0, verbose_name='wasted')),
+                ('consumed', models.IntegerField(default=0, verbose_name='consumed')),
+                ('reservations', models.IntegerField(default=0, verbose_name='reservations')),
+                ('releases', models.IntegerField(default=0, verbose_name='releases')),
+                ('movement_count', models.IntegerField(default=0, verbose_name='movement count')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inventory_snapshots', to='catalog.product', verbose_name='product')),
+            ],
+            options={
+                'verbose_name': 'inventory snapshot',
+                'verbose_name_plural': 'inventory snapshots',
+                'ordering': ['-date', 'product'],
+                'indexes': [models.Index(fields=['date'], name='idx_inventory_snapshot_date')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'date'), name='uniq_inventory_snapshot')],
+            },
+        ),
+    ]
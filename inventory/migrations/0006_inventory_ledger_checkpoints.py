@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-17 11:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_alter_product_is_active_alter_product_name_and_more'),
+        ('inventory', '0005_inventory_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryLedgerCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('on_hand', models.IntegerField(default=0, verbose_name='ledger on hand')),
+                ('reserved', models.IntegerField(default=0, verbose_name='ledger reserved')),
+                ('through', models.DateTimeField(help_text='Movements created before this instant are included', verbose_name='through')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_checkpoint', to='catalog.product', verbose_name='product')),
+            ],
+            options={
+                'verbose_name': 'inventory ledger checkpoint',
+                'verbose_name_plural': 'inventory ledger checkpoints',
+            },
+        ),
+    ]
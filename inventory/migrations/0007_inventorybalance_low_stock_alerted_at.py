@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 12:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_inventory_ledger_checkpoints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventorybalance',
+            name='low_stock_alerted_at',
+            field=models.DateTimeField(blank=True, help_text='When the last low_stock alert was sent (debounce, inventory/alerts.py)', null=True, verbose_name='low stock alerted at'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.3 on 2026-10-17 12:58
+
+import django.core.validators
+from django.db import migrations, models
+
+
+def backfill_direction(apps, schema_editor):
+    # Adjustments used to carry their sign only at the start of the note ("-3 - Damaged items")
+    for model_name in ('InventoryMovement', 'ArchivedInventoryMovement'):
+        apps.get_model('inventory', model_name).objects.filter(
+            movement_type='ADJUSTMENT',
+            note__startswith='-'
+        ).update(direction=-1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_inventorybalance_low_stock_alerted_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedinventorymovement',
+            name='direction',
+            field=models.SmallIntegerField(choices=[(1, 'Increase'), (-1, 'Decrease')], default=1, verbose_name='direction'),
+        ),
+        migrations.AddField(
+            model_name='inventorymovement',
+            name='direction',
+            field=models.SmallIntegerField(choices=[(1, 'Increase'), (-1, 'Decrease')], default=1, help_text='Sign of an adjustment (-1 removes stock); always 1 for the other movement types', verbose_name='direction'),
+        ),
+        migrations.AlterField(
+            model_name='inventorymovement',
+            name='quantity',
+            field=models.IntegerField(help_text='Quantity moved (always positive, sign determined by movement_type and direction)', validators=[django.core.validators.MinValueValidator(1)], verbose_name='quantity'),
+        ),
+        migrations.RunPython(backfill_direction, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
@@ -33,6 +34,17 @@ class InventoryBalance(models.Model):
         validators=[MinValueValidator(0)],
         help_text=_('Minimum quantity before reorder is needed')
     )
+    stripe_count = models.PositiveSmallIntegerField(
+        _('stripe count'),
+        default=0,
+        help_text=_('Number of reservation stripes (0 = reservations go to this row)')
+    )
+    low_stock_alerted_at = models.DateTimeField(
+        _('low stock alerted at'),
+        blank=True,
+        null=True,
+        help_text=_('When the last low_stock alert was sent (debounce, inventory/alerts.py)')
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -44,10 +56,22 @@ class InventoryBalance(models.Model):
     def __str__(self):
         return f'{self.product.name} - On Hand: {self.on_hand}, Reserved: {self.reserved}'
 
+    @property
+    def reserved_total(self):
+        """
+        Reserved quantity, including the reservations held by the stripes
+        Uses the stripe_reserved annotation (striping.with_stripe_reserved) when present
+        """
+        if not self.stripe_count:
+            return self.reserved
+        if hasattr(self, 'stripe_reserved'):
+            return self.reserved + self.stripe_reserved
+        return self.reserved + sum(stripe.reserved for stripe in self.product.inventory_stripes.all())
+
     @property
     def available(self):
-        """Available quantity (on_hand - reserved)"""
-        return self.on_hand - self.reserved
+        """Available quantity (on_hand - reserved, stripes included)"""
+        return self.on_hand - self.reserved_total
 
     @property
     def needs_reorder(self):
@@ -57,6 +81,46 @@ class InventoryBalance(models.Model):
         return self.on_hand <= self.reorder_level
 
 
+class InventoryStripe(models.Model):
+    """
+    One slice of a hot product's reservations (inventory/striping.py)
+
+    Each stripe owns `capacity` units of the product's on_hand and reserves
+    against them, so kiosks on different stripes never wait on the same row.
+    The product's reserved total is the balance's reserved plus the sum of
+    its stripes.
+    """
+    product = models.ForeignKey(
+        'catalog.Product',
+        on_delete=models.CASCADE,
+        related_name='inventory_stripes',
+        verbose_name=_('product')
+    )
+    index = models.PositiveSmallIntegerField(_('index'))
+    capacity = models.IntegerField(
+        _('capacity'),
+        default=0,
+        help_text=_('Units of on_hand allotted to this stripe')
+    )
+    reserved = models.IntegerField(
+        _('reserved quantity'),
+        default=0,
+        help_text=_('Quantity reserved through this stripe')
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('inventory stripe')
+        verbose_name_plural = _('inventory stripes')
+        ordering = ['product', 'index']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'index'], name='uniq_inventory_stripe'),
+        ]
+
+    def __str__(self):
+        return f'{self.product.name} #{self.index} - {self.reserved}/{self.capacity}'
+
+
 class InventoryMovement(models.Model):
     """
     Inventory movement log (receipts, adjustments, waste, etc.)
@@ -69,6 +133,10 @@ class InventoryMovement(models.Model):
         ('RELEASE', _('Release')),
         ('CONSUME', _('Consume')),
     ]
+    DIRECTION_CHOICES = [
+        (1, _('Increase')),
+        (-1, _('Decrease')),
+    ]
 
     product = models.ForeignKey(
         'catalog.Product',
@@ -85,7 +153,13 @@ class InventoryMovement(models.Model):
     quantity = models.IntegerField(
         _('quantity'),
         validators=[MinValueValidator(1)],
-        help_text=_('Quantity moved (always positive, sign determined by movement_type)')
+        help_text=_('Quantity moved (always positive, sign determined by movement_type and direction)')
+    )
+    direction = models.SmallIntegerField(
+        _('direction'),
+        choices=DIRECTION_CHOICES,
+        default=1,
+        help_text=_('Sign of an adjustment (-1 removes stock); always 1 for the other movement types')
     )
     order = models.ForeignKey(
         'orders.Order',
@@ -117,3 +191,132 @@ class InventoryMovement(models.Model):
 
     def __str__(self):
         return f'{self.get_movement_type_display()} - {self.product.name} ({self.quantity})'
+
+    def clean(self):
+        super().clean()
+        if self.direction != 1 and self.movement_type != 'ADJUSTMENT':
+            raise ValidationError({'direction': _('Only adjustments can decrease stock')})
+
+    @classmethod
+    def adjustment(cls, delta, note='', **fields):
+        """
+        Unsaved ADJUSTMENT movement for a signed stock change
+
+        The sign is stored in direction; the note is prefixed with it for
+        readers of the ledger ("-3 - Damaged items").
+        """
+        return cls(
+            movement_type='ADJUSTMENT',
+            quantity=abs(delta),
+            direction=1 if delta > 0 else -1,
+            note=f"{'+' if delta > 0 else ''}{delta} - {note}",
+            **fields
+        )
+
+
+class ArchivedInventoryMovement(models.Model):
+    """
+    Movement of an archived order, moved out of the hot movements table by
+    the order archiver. order_id points to orders.ArchivedOrder.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    product = models.ForeignKey(
+        'catalog.Product',
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name=_('product')
+    )
+    movement_type = models.CharField(
+        _('movement type'),
+        max_length=20,
+        choices=InventoryMovement.MOVEMENT_TYPE_CHOICES
+    )
+    quantity = models.IntegerField(_('quantity'))
+    direction = models.SmallIntegerField(
+        _('direction'),
+        choices=InventoryMovement.DIRECTION_CHOICES,
+        default=1
+    )
+    order_id = models.BigIntegerField(_('order id'), blank=True, null=True, db_index=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='+',
+        verbose_name=_('created by')
+    )
+    note = models.TextField(_('note'), blank=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('archived inventory movement')
+        verbose_name_plural = _('archived inventory movements')
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'{self.get_movement_type_display()} - {self.product.name} ({self.quantity})'
+
+
+class InventorySnapshot(models.Model):
+    """
+    Closing stock of a product at the end of a day, with that day's movement
+    totals (inventory/snapshots.py). Stock at any point in time is the
+    nearest snapshot plus the movements after it.
+    """
+    product = models.ForeignKey(
+        'catalog.Product',
+        on_delete=models.CASCADE,
+        related_name='inventory_snapshots',
+        verbose_name=_('product')
+    )
+    date = models.DateField(_('date'))
+    on_hand = models.IntegerField(_('on hand quantity'), help_text=_('Quantity in stock at the end of the day'))
+    reserved = models.IntegerField(_('reserved quantity'), help_text=_('Quantity reserved at the end of the day'))
+    received = models.IntegerField(_('received'), default=0)
+    adjusted = models.IntegerField(_('adjusted'), default=0, help_text=_('Net adjustments (signed)'))
+    wasted = models.IntegerField(_('wasted'), default=0)
+    consumed = models.IntegerField(_('consumed'), default=0)
+    reservations = models.IntegerField(_('reservations'), default=0)
+    releases = models.IntegerField(_('releases'), default=0)
+    movement_count = models.IntegerField(_('movement count'), default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('inventory snapshot')
+        verbose_name_plural = _('inventory snapshots')
+        ordering = ['-date', 'product']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'date'], name='uniq_inventory_snapshot'),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='idx_inventory_snapshot_date'),
+        ]
+
+    def __str__(self):
+        return f'{self.product.name} @ {self.date} - On Hand: {self.on_hand}, Reserved: {self.reserved}'
+
+
+class InventoryLedgerCheckpoint(models.Model):
+    """
+    Running movement ledger totals of a product up to `through`
+    (inventory/reconcile.py), so reconciliation runs only read newer movements
+    """
+    product = models.OneToOneField(
+        'catalog.Product',
+        on_delete=models.CASCADE,
+        related_name='ledger_checkpoint',
+        verbose_name=_('product')
+    )
+    on_hand = models.IntegerField(_('ledger on hand'), default=0)
+    reserved = models.IntegerField(_('ledger reserved'), default=0)
+    through = models.DateTimeField(_('through'), help_text=_('Movements created before this instant are included'))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('inventory ledger checkpoint')
+        verbose_name_plural = _('inventory ledger checkpoints')
+
+    def __str__(self):
+        return f'{self.product.name} through {self.through} - On Hand: {self.on_hand}, Reserved: {self.reserved}'
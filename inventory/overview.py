@@ -0,0 +1,63 @@
+"""
+Inventory overview (GET /api/inventory/balances/all_products/)
+
+Every active product with its stock figures, inventoried or not, read with a
+single query: the balance is LEFT JOINed through the product's reverse
+one-to-one and `reserved`, `available` and `needs_reorder` are computed in
+SQL. Striped products (inventory/striping.py) add the reservations held by
+their stripes through a correlated subquery that only runs for them.
+"""
+from django.db.models import BooleanField, Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import Coalesce, NullIf
+
+from catalog.models import Product
+
+from .striping import stripe_reserved
+
+
+def inventory_overview(needs_reorder=None, category=None, search=None, inventoried=None):
+    """
+    Active products with their inventory figures, as dicts for
+    InventoryOverviewSerializer; products without a balance have
+    inventoried=False and null figures
+    """
+    products = Product.objects.filter(is_active=True).annotate(
+        inventoried=Case(
+            When(inventory_balance__id__isnull=False, then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField()
+        ),
+        on_hand=F('inventory_balance__on_hand'),
+        reorder_level=F('inventory_balance__reorder_level'),
+        reserved=Case(
+            When(
+                inventory_balance__stripe_count__gt=0,
+                then=F('inventory_balance__reserved') + Coalesce(stripe_reserved('pk'), 0)
+            ),
+            default=F('inventory_balance__reserved'),
+            output_field=IntegerField()
+        ),
+    ).annotate(
+        available=F('on_hand') - F('reserved'),
+        needs_reorder=Case(
+            When(on_hand__lte=F('reorder_level'), then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField()
+        ),
+    )
+
+    if needs_reorder is not None:
+        products = products.filter(needs_reorder=needs_reorder)
+    if inventoried is not None:
+        products = products.filter(inventoried=inventoried)
+    if category is not None:
+        products = products.filter(category_id=category)
+    if search:
+        products = products.filter(Q(name__icontains=search) | Q(sku__icontains=search))
+
+    return products.values(
+        'id', 'name', 'category_id', 'inventoried', 'on_hand', 'reserved', 'available',
+        'reorder_level', 'needs_reorder',
+        category_name=F('category__name'),
+        sku_label=Coalesce(NullIf('sku', Value('')), Value('-')),
+    )
@@ -0,0 +1,15 @@
+from rest_framework.pagination import CursorPagination
+
+
+class InventoryCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the inventory overview
+
+    Pages are keyed on (name, id), so a page is a range scan with no
+    COUNT(*) and no OFFSET however large the catalog grows.
+    GET /api/inventory/balances/all_products/?cursor=<next cursor>&page_size=100
+    """
+    ordering = ('name', 'id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 500
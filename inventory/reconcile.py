@@ -0,0 +1,204 @@
+"""
+Inventory reconciliation against the movement ledger
+
+Every stock change writes an InventoryMovement, so a balance must equal the
+sum of its product's movements (hot and archived). Manual edits in the admin
+or a partially failed write show up as a difference between the two. The
+reconcile_inventory command compares them in batches of products, with one
+aggregated query per movement table per batch.
+
+Runs are incremental: the ledger totals of each product are kept in an
+InventoryLedgerCheckpoint up to a watermark (now minus
+INVENTORY_RECONCILE_LAG_SECONDS, so transactions still in flight are never
+skipped), and the next run only aggregates the movements after it.
+--full recomputes the totals from the first movement.
+
+Mismatches are reported, or corrected in one of two directions:
+- 'balance' rewrites the balance from the ledger (the ledger is right);
+- 'ledger' records ADJUSTMENT / RESERVE / RELEASE movements for the
+  difference (the balance is right, e.g. after a physical count).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .alerts import check_low_stock
+from .models import InventoryBalance, InventoryLedgerCheckpoint, InventoryMovement, InventoryStripe
+from .services import lock_balances
+from .snapshots import consistent_read, empty_totals, movement_totals, on_hand_delta, reserved_delta
+from .striping import lock_stripes
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_LAG_SECONDS = 300
+FIX_BALANCE = 'balance'
+FIX_LEDGER = 'ledger'
+FIX_MODES = (FIX_BALANCE, FIX_LEDGER)
+RECONCILIATION_NOTE = 'Reconciliation'
+
+
+def reconcile_watermark(lag_seconds=None):
+    """Movements created before this instant are final for the checkpoints"""
+    if lag_seconds is None:
+        lag_seconds = getattr(settings, 'INVENTORY_RECONCILE_LAG_SECONDS', DEFAULT_LAG_SECONDS)
+    return timezone.now() - timedelta(seconds=lag_seconds)
+
+
+def _read_balances(product_ids, lock):
+    """
+    {product_id: (balance, reserved_total)}
+    When fixing, balances and stripes are locked so that no reservation or
+    stock write lands between the comparison and the correction
+    """
+    if lock:
+        balances = lock_balances(product_ids)
+        stripes = {pid: lock_stripes(pid) for pid, balance in balances.items() if balance.stripe_count}
+    else:
+        balances = {b.product_id: b for b in InventoryBalance.objects.filter(product_id__in=product_ids)}
+        stripes = {}
+        striped = [pid for pid, balance in balances.items() if balance.stripe_count]
+        for stripe in InventoryStripe.objects.filter(product_id__in=striped) if striped else ():
+            stripes.setdefault(stripe.product_id, []).append(stripe)
+    return {
+        pid: (balance, balance.reserved + sum(stripe.reserved for stripe in stripes.get(pid, [])))
+        for pid, balance in balances.items()
+    }
+
+
+def _ledger_totals(product_ids, checkpoints, watermark, full):
+    """
+    ({product_id: (on_hand, reserved)} of the whole ledger,
+     {product_id: (on_hand, reserved, through)} for the new checkpoints)
+    """
+    groups = {}
+    for pid in product_ids:
+        checkpoint = None if full else checkpoints.get(pid)
+        groups.setdefault(checkpoint.through if checkpoint else None, []).append(pid)
+
+    ledger = {}
+    new_checkpoints = {}
+    for since, ids in groups.items():
+        through = max(watermark, since) if since else watermark
+        settled = movement_totals(ids, since, until=through)
+        recent = movement_totals(ids, through)
+        for pid in ids:
+            checkpoint = None if full else checkpoints.get(pid)
+            on_hand = checkpoint.on_hand if checkpoint else 0
+            reserved = checkpoint.reserved if checkpoint else 0
+            totals = settled.get(pid, empty_totals())
+            on_hand += on_hand_delta(totals)
+            reserved += reserved_delta(totals)
+            new_checkpoints[pid] = (on_hand, reserved, through)
+
+            totals = recent.get(pid, empty_totals())
+            ledger[pid] = (on_hand + on_hand_delta(totals), reserved + reserved_delta(totals))
+    return ledger, new_checkpoints
+
+
+def _fix(mismatches, balances, fix, user):
+    """Correct the mismatched products; returns the product ids fixed"""
+    fixed = []
+    if fix == FIX_BALANCE:
+        changed = []
+        available_deltas = {}
+        now = timezone.now()
+        for mismatch in mismatches:
+            balance, _ = balances[mismatch['product_id']]
+            new_reserved = balance.reserved + mismatch['ledger_reserved'] - mismatch['reserved']
+            if mismatch['ledger_on_hand'] < 0 or new_reserved < 0:
+                continue  # The ledger itself is inconsistent: leave it for a human
+            available_deltas[balance.product_id] = (
+                mismatch['ledger_on_hand'] - balance.on_hand - (new_reserved - balance.reserved)
+            )
+            balance.on_hand = mismatch['ledger_on_hand']
+            balance.reserved = new_reserved
+            balance.updated_at = now
+            changed.append(balance)
+            fixed.append(mismatch['product_id'])
+        InventoryBalance.objects.bulk_update(changed, ['on_hand', 'reserved', 'updated_at'])
+        check_low_stock(available_deltas)
+    else:
+        movements = []
+        for mismatch in mismatches:
+            delta = mismatch['on_hand'] - mismatch['ledger_on_hand']
+            if delta:
+                movements.append(InventoryMovement.adjustment(
+                    delta,
+                    RECONCILIATION_NOTE,
+                    product_id=mismatch['product_id'],
+                    created_by=user
+                ))
+            delta = mismatch['reserved'] - mismatch['ledger_reserved']
+            if delta:
+                movements.append(InventoryMovement(
+                    product_id=mismatch['product_id'],
+                    movement_type='RESERVE' if delta > 0 else 'RELEASE',
+                    quantity=abs(delta),
+                    created_by=user,
+                    note=RECONCILIATION_NOTE
+                ))
+            fixed.append(mismatch['product_id'])
+        InventoryMovement.objects.bulk_create(movements)
+    return fixed
+
+
+def reconcile_batch(product_ids, watermark, full=False, fix=None, user=None):
+    """
+    Compare the balances of a batch of products with the ledger, save the
+    checkpoints and, with fix, correct the mismatches
+    Returns the mismatches (dicts; 'fixed' tells whether each was corrected)
+    """
+    with (transaction.atomic() if fix else consistent_read()):
+        balances = _read_balances(product_ids, lock=bool(fix))
+        product_ids = sorted(balances)
+        checkpoints = {
+            checkpoint.product_id: checkpoint
+            for checkpoint in InventoryLedgerCheckpoint.objects.filter(product_id__in=product_ids)
+        }
+        ledger, new_checkpoints = _ledger_totals(product_ids, checkpoints, watermark, full)
+
+        mismatches = []
+        for pid in product_ids:
+            balance, reserved = balances[pid]
+            ledger_on_hand, ledger_reserved = ledger[pid]
+            if (balance.on_hand, reserved) != (ledger_on_hand, ledger_reserved):
+                mismatches.append({
+                    'product_id': pid,
+                    'on_hand': balance.on_hand,
+                    'ledger_on_hand': ledger_on_hand,
+                    'reserved': reserved,
+                    'ledger_reserved': ledger_reserved,
+                    'fixed': False,
+                })
+
+        if fix and mismatches:
+            fixed = set(_fix(mismatches, balances, fix, user))
+            for mismatch in mismatches:
+                mismatch['fixed'] = mismatch['product_id'] in fixed
+
+        InventoryLedgerCheckpoint.objects.bulk_create(
+            [
+                InventoryLedgerCheckpoint(product_id=pid, on_hand=on_hand, reserved=reserved, through=through)
+                for pid, (on_hand, reserved, through) in new_checkpoints.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=['on_hand', 'reserved', 'through', 'updated_at'],
+        )
+    return mismatches
+
+
+def reconcile_inventory(product_ids=None, full=False, fix=None, batch_size=DEFAULT_BATCH_SIZE, lag_seconds=None, user=None):
+    """
+    Reconcile every inventoried product (or product_ids), batch_size products
+    per transaction; yields (checked, mismatches) per batch
+    """
+    watermark = reconcile_watermark(lag_seconds)
+    balances = InventoryBalance.objects.order_by('product_id')
+    if product_ids is not None:
+        balances = balances.filter(product_id__in=product_ids)
+    ids = list(balances.values_list('product_id', flat=True))
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        yield len(batch), reconcile_batch(batch, watermark, full=full, fix=fix, user=user)
@@ -10,6 +10,7 @@ class InventoryBalanceSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
     product_category = serializers.CharField(source='product.category.name', read_only=True)
     product_sku = serializers.CharField(source='product.sku', read_only=True)
+    reserved = serializers.IntegerField(source='reserved_total', read_only=True)
     available = serializers.IntegerField(read_only=True)
     needs_reorder = serializers.BooleanField(read_only=True)
 
@@ -26,10 +27,27 @@ class InventoryBalanceSerializer(serializers.ModelSerializer):
             'available',
             'reorder_level',
             'needs_reorder',
+            'stripe_count',
             'created_at',
             'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'stripe_count', 'created_at', 'updated_at']
+
+
+class InventoryOverviewSerializer(serializers.Serializer):
+    """
+    Row of the inventory overview (rows of inventory.overview.inventory_overview())
+    """
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    category = serializers.CharField(source='category_name')
+    sku = serializers.CharField(source='sku_label')
+    inventoried = serializers.BooleanField()
+    on_hand = serializers.IntegerField(allow_null=True)
+    reserved = serializers.IntegerField(allow_null=True)
+    available = serializers.IntegerField(allow_null=True)
+    reorder_level = serializers.IntegerField(allow_null=True)
+    needs_reorder = serializers.BooleanField()
 
 
 class InventoryMovementSerializer(serializers.ModelSerializer):
@@ -48,6 +66,7 @@ class InventoryMovementSerializer(serializers.ModelSerializer):
             'product_name',
             'movement_type',
             'movement_type_display',
+            'direction',
             'quantity',
             'order',
             'created_by',
@@ -93,3 +112,33 @@ class StockAdjustmentSerializer(serializers.Serializer):
         if value == 0:
             raise serializers.ValidationError("Delta cannot be zero")
         return value
+
+
+class StockBulkLineSerializer(serializers.Serializer):
+    """
+    One line of a bulk stock operation (inventory/bulk.py)
+    The product is given by product_id or sku; receipts take a quantity and
+    adjustments a non-zero delta
+    """
+    TYPE_CHOICES = ['RECEIPT', 'ADJUSTMENT']
+
+    product_id = serializers.IntegerField(required=False)
+    sku = serializers.CharField(required=False)
+    type = serializers.ChoiceField(choices=TYPE_CHOICES)
+    quantity = serializers.IntegerField(min_value=1, required=False)
+    delta = serializers.IntegerField(required=False)
+    note = serializers.CharField(required=False, allow_blank=True)
+
+    def to_internal_value(self, data):
+        if isinstance(data, dict) and isinstance(data.get('type'), str):
+            data = dict(data, type=data['type'].upper())
+        return super().to_internal_value(data)
+
+    def validate(self, attrs):
+        if 'product_id' not in attrs and 'sku' not in attrs:
+            raise serializers.ValidationError("product_id or sku is required")
+        if attrs['type'] == 'RECEIPT' and 'quantity' not in attrs:
+            raise serializers.ValidationError({'quantity': "Quantity is required for a receipt"})
+        if attrs['type'] == 'ADJUSTMENT' and not attrs.get('delta'):
+            raise serializers.ValidationError({'delta': "Delta is required for an adjustment and cannot be zero"})
+        return attrs
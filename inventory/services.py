@@ -0,0 +1,121 @@
+from django.conf import settings
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .models import InventoryBalance
+
+PESSIMISTIC = 'pessimistic'
+OPTIMISTIC = 'optimistic'
+
+
+class InsufficientStock(Exception):
+    """
+    Raised by the optimistic reservation engine when a product cannot be reserved
+    """
+
+    def __init__(self, product_id, available, requested):
+        super().__init__(f'Insufficient inventory for product {product_id}')
+        self.product_id = product_id
+        self.available = available
+        self.requested = requested
+
+
+def reservation_mode():
+    """
+    Inventory reservation engine used when orders are created
+    (INVENTORY_RESERVATION_MODE: 'pessimistic' or 'optimistic')
+    """
+    mode = getattr(settings, 'INVENTORY_RESERVATION_MODE', PESSIMISTIC)
+    return OPTIMISTIC if mode == OPTIMISTIC else PESSIMISTIC
+
+
+def _delta_expression(deltas):
+    """
+    Build a CASE expression mapping product_id -> delta for a set-based UPDATE
+    """
+    return Case(
+        *[When(product_id=product_id, then=Value(delta)) for product_id, delta in deltas.items()],
+        default=Value(0),
+        output_field=IntegerField()
+    )
+
+
+def apply_balance_deltas(reserved=None, on_hand=None):
+    """
+    Apply per-product deltas to inventory balances with a single UPDATE
+
+    reserved/on_hand are dicts of {product_id: delta}. Callers are expected to
+    hold the row locks (select_for_update) on the affected balances already.
+    Returns the number of balance rows updated.
+    """
+    reserved = {pid: delta for pid, delta in (reserved or {}).items() if delta}
+    on_hand = {pid: delta for pid, delta in (on_hand or {}).items() if delta}
+    product_ids = set(reserved) | set(on_hand)
+    if not product_ids:
+        return 0
+
+    updates = {'updated_at': timezone.now()}
+    if reserved:
+        updates['reserved'] = F('reserved') + _delta_expression(reserved)
+    if on_hand:
+        updates['on_hand'] = F('on_hand') + _delta_expression(on_hand)
+
+    return InventoryBalance.objects.filter(product_id__in=product_ids).update(**updates)
+
+
+def lock_balances(product_ids):
+    """
+    Lock inventory balances for the given products in product_id order
+    Returns a dict of {product_id: InventoryBalance}
+    """
+    return {
+        b.product_id: b
+        for b in InventoryBalance.objects.select_for_update().filter(
+            product_id__in=product_ids
+        ).order_by('product_id')
+    }
+
+
+def ensure_balances(product_ids):
+    """
+    Create empty balances (on_hand 0) for the products that have none, with
+    one INSERT ... ON CONFLICT DO NOTHING, so that both reservation engines
+    reject them as out of stock instead of treating them as untracked
+    """
+    InventoryBalance.objects.bulk_create(
+        [InventoryBalance(product_id=product_id, on_hand=0, reserved=0) for product_id in product_ids],
+        ignore_conflicts=True
+    )
+
+
+def reserve_conditionally(quantities):
+    """
+    Reserve stock with one conditional UPDATE per product (optimistic mode)
+
+        UPDATE ... SET reserved = reserved + q WHERE on_hand - reserved >= q
+
+    No row is locked up front: the UPDATE only holds its row from the moment
+    it runs until commit, and a zero affected-row count means the product
+    could not be reserved. quantities is {product_id: quantity}; products
+    are updated in product_id order. Products without a balance row are
+    untracked and skipped (kiosk orders create them first with
+    ensure_balances(), like the pessimistic engine). Raises InsufficientStock (the caller's
+    transaction must roll back) and returns the set of reserved product ids.
+    """
+    now = timezone.now()
+    reserved = set()
+    for product_id in sorted(quantities):
+        quantity = quantities[product_id]
+        updated = InventoryBalance.objects.filter(
+            product_id=product_id,
+            on_hand__gte=F('reserved') + quantity
+        ).update(reserved=F('reserved') + quantity, updated_at=now)
+        if updated:
+            reserved.add(product_id)
+            continue
+
+        balance = InventoryBalance.objects.filter(product_id=product_id).values_list('on_hand', 'reserved').first()
+        if balance is not None:
+            on_hand, already_reserved = balance
+            raise InsufficientStock(product_id, on_hand - already_reserved, quantity)
+    return reserved
@@ -1,6 +1,7 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from catalog.models import Product
+from .alerts import invalidate_low_stock
 from .models import InventoryBalance
 
 
@@ -17,3 +18,13 @@ def create_inventory_balance(sender, instance, created, **kwargs):
                 'reserved': 0,
             }
         )
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=InventoryBalance)
+def invalidate_low_stock_list(sender, instance, **kwargs):
+    """
+    Drop the cached low-stock list when a product or a balance is saved
+    outside the alert checks (renames, reorder levels edited in the admin)
+    """
+    invalidate_low_stock()
@@ -0,0 +1,236 @@
+"""
+Inventory ledger snapshots
+
+InventoryMovement is an append-only ledger: every stock change is a row.
+Replaying it to answer "what was on hand on date D" costs O(movements), so
+the snapshot_inventory command writes one InventorySnapshot per product and
+day (closing on_hand and reserved plus the day's movement totals).
+
+Snapshots are anchored on the current balances: the command reads the
+balances and the daily movement totals since the oldest requested day in one
+REPEATABLE READ transaction per chunk of products, and walks back one day
+at a time (closing of D = closing of D+1 - movements of D+1). Reruns
+overwrite the rows of the same day.
+
+stock_as_of(at) combines each product's nearest snapshot before `at` with
+the movements between the snapshot and `at` (products without a snapshot
+are walked back from their current balance instead), so a historical stock
+report costs O(products) plus the movements of less than a day.
+
+Movements of archived orders live in ArchivedInventoryMovement and are read
+together with the hot table. Adjustments store the absolute quantity and
+their sign in direction.
+"""
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, IntegerField, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ArchivedInventoryMovement, InventoryBalance, InventoryMovement, InventorySnapshot, InventoryStripe
+
+DEFAULT_CHUNK_SIZE = 500
+
+MOVEMENT_SOURCES = (InventoryMovement, ArchivedInventoryMovement)
+
+def _sum_when(*cases):
+    return Sum(Case(*cases, default=Value(0), output_field=IntegerField()))
+
+
+# Day totals of a movement queryset (InventorySnapshot fields)
+TOTALS = {
+    'received': _sum_when(When(movement_type='RECEIPT', then='quantity')),
+    'adjusted': _sum_when(When(movement_type='ADJUSTMENT', then=F('quantity') * F('direction'))),
+    'wasted': _sum_when(When(movement_type='WASTE', then='quantity')),
+    'consumed': _sum_when(When(movement_type='CONSUME', then='quantity')),
+    'reservations': _sum_when(When(movement_type='RESERVE', then='quantity')),
+    'releases': _sum_when(When(movement_type='RELEASE', then='quantity')),
+    'movement_count': Count('id'),
+}
+TOTAL_FIELDS = tuple(TOTALS)
+
+
+def on_hand_delta(totals):
+    return totals['received'] + totals['adjusted'] - totals['wasted'] - totals['consumed']
+
+
+def reserved_delta(totals):
+    return totals['reservations'] - totals['releases'] - totals['consumed']
+
+
+def empty_totals():
+    return dict.fromkeys(TOTAL_FIELDS, 0)
+
+
+def _add_totals(into, row):
+    for field in TOTAL_FIELDS:
+        into[field] += row[field] or 0
+
+
+def day_start(day):
+    """First instant of a local calendar day"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+@contextmanager
+def consistent_read():
+    """
+    Transaction whose queries all see the same database snapshot
+    (inside an outer transaction, that transaction's isolation applies)
+    """
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        if outermost and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        yield
+
+
+def current_stock(product_ids=None):
+    """{product_id: (on_hand, reserved)} of the inventoried products (stripes included)"""
+    balances = InventoryBalance.objects.all()
+    if product_ids is not None:
+        balances = balances.filter(product_id__in=product_ids)
+    stock = {}
+    striped = []
+    for product_id, on_hand, reserved, stripe_count in balances.values_list(
+        'product_id', 'on_hand', 'reserved', 'stripe_count'
+    ):
+        stock[product_id] = [on_hand, reserved]
+        if stripe_count:
+            striped.append(product_id)
+    if striped:
+        for product_id, reserved in InventoryStripe.objects.filter(product_id__in=striped).order_by().values(
+            'product_id'
+        ).annotate(total=Sum('reserved')).values_list('product_id', 'total'):
+            stock[product_id][1] += reserved or 0
+    return {product_id: tuple(values) for product_id, values in stock.items()}
+
+
+def movement_totals(product_ids, since, until=None, by_day=False):
+    """
+    Movement totals of the products in [since, until) (None: unbounded),
+    hot and archived movements together: {product_id: totals} or, with
+    by_day, {(product_id, date): totals}
+    """
+    result = {}
+    if since is not None and until is not None and until <= since:
+        return result
+    for model in MOVEMENT_SOURCES:
+        movements = model.objects.filter(product_id__in=product_ids)
+        if since is not None:
+            movements = movements.filter(created_at__gte=since)
+        if until is not None:
+            movements = movements.filter(created_at__lt=until)
+        group = ['product_id']
+        if by_day:
+            movements = movements.annotate(day=TruncDate('created_at', tzinfo=timezone.get_current_timezone()))
+            group.append('day')
+        for row in movements.order_by().values(*group).annotate(**TOTALS):
+            key = (row['product_id'], row['day']) if by_day else row['product_id']
+            _add_totals(result.setdefault(key, empty_totals()), row)
+    return result
+
+
+def snapshot_chunk(product_ids, first_day, last_day):
+    """
+    Write the snapshots of first_day..last_day for a chunk of products
+    Returns the number of snapshot rows written
+    """
+    today = timezone.localdate()
+    rows = []
+    with consistent_read():
+        stock = current_stock(product_ids)
+        if not stock:
+            return 0
+        daily = movement_totals(list(stock), day_start(first_day), by_day=True)
+
+        for product_id, (on_hand, reserved) in stock.items():
+            # Walk back from now: closing of `day` is the stock before the movements after it
+            day = today
+            while day >= first_day:
+                totals = daily.get((product_id, day), empty_totals())
+                if day <= last_day:
+                    rows.append(InventorySnapshot(
+                        product_id=product_id, date=day, on_hand=on_hand, reserved=reserved, **totals
+                    ))
+                on_hand -= on_hand_delta(totals)
+                reserved -= reserved_delta(totals)
+                day -= timedelta(days=1)
+
+        InventorySnapshot.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['product', 'date'],
+            update_fields=['on_hand', 'reserved', *TOTAL_FIELDS],
+        )
+    return len(rows)
+
+
+def take_snapshots(first_day, last_day=None, product_ids=None, chunk_size=None):
+    """
+    Snapshot first_day..last_day (default: first_day) for all inventoried
+    products, chunk_size products per transaction
+    Returns the number of snapshot rows written
+    """
+    last_day = last_day or first_day
+    chunk_size = chunk_size or getattr(settings, 'INVENTORY_SNAPSHOT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    balances = InventoryBalance.objects.order_by('product_id')
+    if product_ids is not None:
+        balances = balances.filter(product_id__in=product_ids)
+    ids = list(balances.values_list('product_id', flat=True))
+
+    written = 0
+    for start in range(0, len(ids), chunk_size):
+        written += snapshot_chunk(ids[start:start + chunk_size], first_day, last_day)
+    return written
+
+
+def stock_as_of(at, product_ids=None):
+    """
+    {product_id: {'on_hand', 'reserved', 'snapshot_date'}} at the instant `at`
+    for the inventoried products (snapshot_date is None when the product was
+    walked back from its current balance)
+    """
+    with consistent_read():
+        snapshots = InventorySnapshot.objects.filter(date__lt=timezone.localdate(at))
+        balances = InventoryBalance.objects.all()
+        if product_ids is not None:
+            snapshots = snapshots.filter(product_id__in=product_ids)
+            balances = balances.filter(product_id__in=product_ids)
+        nearest = snapshots.order_by('product_id', '-date').values_list(
+            'product_id', 'date', 'on_hand', 'reserved'
+        )
+        if connection.vendor == 'postgresql':
+            nearest = nearest.distinct('product_id')
+
+        result = {}
+        by_date = {}
+        for product_id, date, on_hand, reserved in nearest:
+            if product_id in result:
+                continue  # Older snapshot (no DISTINCT ON outside PostgreSQL)
+            result[product_id] = {'on_hand': on_hand, 'reserved': reserved, 'snapshot_date': date}
+            by_date.setdefault(date, []).append(product_id)
+
+        # Forward from each snapshot (products of a daily run share the same date)
+        for date, ids in by_date.items():
+            for product_id, totals in movement_totals(ids, day_start(date + timedelta(days=1)), until=at).items():
+                result[product_id]['on_hand'] += on_hand_delta(totals)
+                result[product_id]['reserved'] += reserved_delta(totals)
+
+        # Backward from the current balance for products without a snapshot
+        missing = list(balances.exclude(product_id__in=list(result)).values_list('product_id', flat=True))
+        if missing:
+            stock = current_stock(missing)
+            later = movement_totals(missing, at)
+            for product_id, (on_hand, reserved) in stock.items():
+                totals = later.get(product_id, empty_totals())
+                result[product_id] = {
+                    'on_hand': on_hand - on_hand_delta(totals),
+                    'reserved': reserved - reserved_delta(totals),
+                    'snapshot_date': None,
+                }
+    return result
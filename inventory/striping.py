@@ -0,0 +1,269 @@
+"""
+Striped reservation counters for hot products
+
+A few best sellers take most reservations, and every kiosk order for them
+used to update the same InventoryBalance row. A striped product
+(InventoryBalance.stripe_count > 0) splits its reservations across N
+InventoryStripe rows instead: each stripe owns `capacity` units of on_hand,
+each device reserves on stripe device_id % N, and the product's reserved
+total is balance.reserved + sum(stripe.reserved).
+
+Invariant: balance.reserved + sum(stripe.capacity) <= balance.on_hand. The
+difference is unallocated stock (e.g. a receipt) that rebalance() hands out
+when a stripe runs dry, together with the free capacity of the other
+stripes. Reservations and rebalancing never wait on rows locked by other
+transactions (skip_locked), so two kiosks whose stripes run dry at the same
+time cannot deadlock.
+
+Striping is enabled with INVENTORY_STRIPED_RESERVATIONS; stripes are set up
+per product with the stripe_inventory command. Fold the stripes back
+(stripe_inventory --stripes 0) before disabling it.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import InventoryBalance, InventoryStripe
+from .services import InsufficientStock, apply_balance_deltas
+
+
+def striping_enabled():
+    return getattr(settings, 'INVENTORY_STRIPED_RESERVATIONS', False)
+
+
+def striped_products(product_ids):
+    """
+    Return {product_id: stripe_count} for the striped products among product_ids
+    No query is made when striping is disabled
+    """
+    if not striping_enabled() or not product_ids:
+        return {}
+    return dict(InventoryBalance.objects.filter(
+        product_id__in=product_ids,
+        stripe_count__gt=0
+    ).values_list('product_id', 'stripe_count'))
+
+
+def stripe_reserved(product_ref='product_id'):
+    """Correlated subquery: reserved units held by the stripes of the outer product (NULL without stripes)"""
+    return Subquery(
+        InventoryStripe.objects.filter(product_id=OuterRef(product_ref)).order_by().values('product_id').annotate(
+            total=Sum('reserved')
+        ).values('total'),
+        output_field=IntegerField()
+    )
+
+
+def with_stripe_reserved(balances):
+    """
+    Annotate balances with stripe_reserved, read by InventoryBalance.reserved_total
+    instead of one stripe query per balance; the subquery only runs for striped rows
+    """
+    return balances.annotate(stripe_reserved=Case(
+        When(stripe_count__gt=0, then=Coalesce(stripe_reserved(), 0)),
+        default=Value(0),
+        output_field=IntegerField()
+    ))
+
+
+def stripe_index(device_id, stripe_count):
+    """Stripe used by a device"""
+    return (device_id or 0) % stripe_count
+
+
+def lock_stripes(product_id):
+    """Lock all stripes of a product in index order and return them"""
+    return list(InventoryStripe.objects.select_for_update().filter(product_id=product_id).order_by('index'))
+
+
+def _stripe_update(product_id, reserved=None, capacity=None):
+    """
+    Apply {index: delta} to the reserved/capacity of a product's stripes with one UPDATE
+    """
+    reserved = {index: delta for index, delta in (reserved or {}).items() if delta}
+    capacity = {index: delta for index, delta in (capacity or {}).items() if delta}
+    indexes = set(reserved) | set(capacity)
+    if not indexes:
+        return 0
+
+    def delta_expression(deltas):
+        return Case(
+            *[When(index=index, then=Value(delta)) for index, delta in deltas.items()],
+            default=Value(0),
+            output_field=IntegerField()
+        )
+
+    updates = {'updated_at': timezone.now()}
+    if reserved:
+        updates['reserved'] = F('reserved') + delta_expression(reserved)
+    if capacity:
+        updates['capacity'] = F('capacity') + delta_expression(capacity)
+    return InventoryStripe.objects.filter(product_id=product_id, index__in=indexes).update(**updates)
+
+
+def _reserve_on_stripe(product_id, index, quantity):
+    return InventoryStripe.objects.filter(
+        product_id=product_id,
+        index=index,
+        capacity__gte=F('reserved') + quantity
+    ).update(reserved=F('reserved') + quantity, updated_at=timezone.now()) > 0
+
+
+def available_quantity(product_id):
+    """Committed available quantity of a striped product (for error messages)"""
+    on_hand, reserved = InventoryBalance.objects.filter(product_id=product_id).values_list('on_hand', 'reserved').get()
+    striped = InventoryStripe.objects.filter(product_id=product_id).aggregate(total=Sum('reserved'))['total'] or 0
+    return on_hand - reserved - striped
+
+
+def rebalance(product_id, index, quantity):
+    """
+    Move free capacity into stripe `index` until it can take `quantity`, then reserve it
+
+    Capacity comes from unallocated stock first (when the balance row is not
+    locked by another transaction), then from the other stripes with the most
+    free capacity. Only rows that are not locked elsewhere take part, so this
+    never waits. Returns whether the quantity was reserved.
+    """
+    with transaction.atomic():
+        balance = InventoryBalance.objects.select_for_update(skip_locked=True).filter(product_id=product_id).first()
+        stripes = {
+            stripe.index: stripe
+            for stripe in InventoryStripe.objects.select_for_update(skip_locked=True).filter(
+                product_id=product_id
+            ).order_by('index')
+        }
+        target = stripes.get(index)
+        if target is None:
+            return False
+
+        unallocated = 0
+        if balance is not None:
+            allocated = InventoryStripe.objects.filter(product_id=product_id).aggregate(total=Sum('capacity'))['total'] or 0
+            unallocated = max(balance.on_hand - balance.reserved - allocated, 0)
+        free = {i: stripe.capacity - stripe.reserved for i, stripe in stripes.items() if i != index}
+        target_free = target.capacity - target.reserved
+        total_free = unallocated + target_free + sum(free.values())
+        if total_free < quantity:
+            return False
+
+        # Give the target what it needs, or its fair share of the free stock
+        goal = max(quantity, total_free // len(stripes))
+        needed = goal - target_free
+        moved = {index: 0}
+        if balance is not None:
+            taken = min(unallocated, needed)
+            moved[index] += taken
+            needed -= taken
+        for donor in sorted(free, key=lambda i: (-free[i], i)):
+            if needed <= 0:
+                break
+            taken = min(free[donor], needed)
+            moved[donor] = -taken
+            moved[index] += taken
+            needed -= taken
+
+        _stripe_update(product_id, capacity=moved)
+        return _reserve_on_stripe(product_id, index, quantity)
+
+
+def reserve_striped(product_id, index, quantity):
+    """
+    Reserve quantity of a striped product on stripe `index`
+    Rebalances when the stripe runs dry; raises InsufficientStock when the
+    free stock that can be reached is not enough
+    """
+    if _reserve_on_stripe(product_id, index, quantity):
+        return
+    if rebalance(product_id, index, quantity):
+        return
+    raise InsufficientStock(product_id, available_quantity(product_id), quantity)
+
+
+def release_striped(product_id, index, quantity, consume=False):
+    """
+    Take quantity off the reservations of a striped product, starting with
+    stripe `index` (the other stripes cover what it does not hold)
+    consume=True also removes the units from the stripes' capacity and from on_hand
+    """
+    stripes = lock_stripes(product_id)
+    stripes.sort(key=lambda stripe: stripe.index != index)
+    remaining = quantity
+    reserved = {}
+    for stripe in stripes:
+        if remaining <= 0:
+            break
+        taken = min(stripe.reserved, remaining)
+        reserved[stripe.index] = -taken
+        remaining -= taken
+    _stripe_update(product_id, reserved=reserved, capacity=reserved if consume else None)
+    if consume:
+        apply_balance_deltas(on_hand={product_id: -quantity})
+
+
+def move_striped_stock(quantities, reserved_sign, on_hand_sign=0):
+    """
+    Reserve (reserved_sign > 0), release or consume (on_hand_sign < 0) striped stock
+
+    quantities is {(product_id, stripe_index): quantity}; products are handled
+    in product_id order. Returns the set of product ids moved.
+    """
+    for (product_id, index) in sorted(quantities):
+        quantity = quantities[(product_id, index)]
+        if reserved_sign > 0:
+            reserve_striped(product_id, index, quantity)
+        else:
+            release_striped(product_id, index, quantity, consume=on_hand_sign < 0)
+    return {product_id for product_id, _ in quantities}
+
+
+def fit_capacity(balance, stripes, new_on_hand):
+    """
+    Shrink the stripes' free capacity so that reserved + capacity fits in
+    new_on_hand (stock adjustments). stripes must be locked (lock_stripes)
+    and new_on_hand must cover every reservation.
+    """
+    excess = balance.reserved + sum(stripe.capacity for stripe in stripes) - new_on_hand
+    capacity = {}
+    for stripe in sorted(stripes, key=lambda stripe: stripe.reserved - stripe.capacity):
+        if excess <= 0:
+            break
+        taken = min(stripe.capacity - stripe.reserved, excess)
+        capacity[stripe.index] = -taken
+        excess -= taken
+    _stripe_update(balance.product_id, capacity=capacity)
+
+
+def set_stripes(product_id, stripe_count):
+    """
+    Split a product's reservations across stripe_count stripes (0 folds the
+    stripes back into the balance row). Existing reservations stay on stripe 0;
+    the free stock is divided evenly.
+    Returns the balance.
+    """
+    with transaction.atomic():
+        balance = InventoryBalance.objects.select_for_update().get(product_id=product_id)
+        stripes = lock_stripes(product_id)
+        reserved = balance.reserved + sum(stripe.reserved for stripe in stripes)
+        InventoryStripe.objects.filter(product_id=product_id).delete()
+
+        free = max(balance.on_hand - reserved, 0)
+        if stripe_count:
+            share, extra = divmod(free, stripe_count)
+            InventoryStripe.objects.bulk_create([
+                InventoryStripe(
+                    product_id=product_id,
+                    index=index,
+                    capacity=share + (1 if index < extra else 0) + (reserved if index == 0 else 0),
+                    reserved=reserved if index == 0 else 0
+                )
+                for index in range(stripe_count)
+            ])
+            balance.reserved = 0
+        else:
+            balance.reserved = reserved
+        balance.stripe_count = stripe_count
+        balance.save(update_fields=['reserved', 'stripe_count', 'updated_at'])
+        return balance
@@ -1,3 +1,354 @@
-from django.test import TestCase
+import io
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from catalog.models import Product, ProductCategory
+from inventory.alerts import low_stock_products
+from inventory.models import InventoryBalance, InventoryLedgerCheckpoint, InventoryMovement, InventorySnapshot
+from inventory.snapshots import day_start
+from common.testing import KioskOrderTestCase
+from orders.models import OutboxEvent
+
+
+class InventoryOverviewTests(KioskOrderTestCase):
+    """Tests para el resumen de inventario en una sola query"""
+
+    def setUp(self):
+        super().setUp()
+        self.snacks = ProductCategory.objects.create(name='Snacks', category_type='SNACK', is_active=True)
+        self.low = Product.objects.create(name='Agua', category=self.category, is_active=True, sku='AG-1')
+        InventoryBalance.objects.filter(product=self.low).update(on_hand=2, reserved=1, reorder_level=5)
+        self.untracked = Product.objects.create(name='Galletas', category=self.snacks, is_active=True)
+        InventoryBalance.objects.filter(product=self.untracked).delete()
+        for i in range(5):
+            Product.objects.create(name=f'Te {i}', category=self.category, is_active=True)
+        self.client.force_authenticate(user=self.staff_user)
+
+    def overview(self, **params):
+        response = self.client.get('/api/inventory/balances/all_products/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_single_query_with_computed_fields(self):
+        """El resumen usa una sola query y calcula disponible y reorden en SQL"""
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.overview()
+        self.assertEqual(len([q for q in ctx.captured_queries if 'catalog_product' in q['sql']]), 1)
+        self.assertEqual(data['count'], 8)
+
+        rows = {row['id']: row for row in data['results']}
+        self.assertEqual(
+            (rows[self.low.id]['reserved'], rows[self.low.id]['available'], rows[self.low.id]['needs_reorder']),
+            (1, 1, True)
+        )
+        self.assertEqual(rows[self.low.id]['sku'], 'AG-1')
+        self.assertFalse(rows[self.untracked.id]['inventoried'])
+        self.assertIsNone(rows[self.untracked.id]['available'])
+        self.assertFalse(rows[self.untracked.id]['needs_reorder'])
+        self.assertEqual(data['results'][-1]['id'], self.untracked.id)
+
+    def test_filters(self):
+        """Filtros por reorden, categoria y texto"""
+        self.assertEqual([row['id'] for row in self.overview(needs_reorder='true')['results']], [self.low.id])
+        self.assertEqual([row['id'] for row in self.overview(category=self.snacks.id)['results']], [self.untracked.id])
+        self.assertEqual([row['id'] for row in self.overview(search='ag-')['results']], [self.low.id])
+        self.assertEqual(self.overview(inventoried='false')['count'], 1)
+        response = self.client.get('/api/inventory/balances/all_products/', {'needs_reorder': 'si'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_pagination(self):
+        """La paginacion por cursor recorre todos los productos por nombre"""
+        data = self.overview(page_size=3)
+        names = [row['name'] for row in data['results']]
+        while data['next']:
+            data = self.client.get(data['next']).data
+            names.extend(row['name'] for row in data['results'])
+        self.assertEqual(len(names), 8)
+        self.assertEqual(names, sorted(names))
+
+
+class StockBulkTests(KioskOrderTestCase):
+    """Tests para la carga masiva de recepciones y ajustes de stock"""
+
+    def setUp(self):
+        super().setUp()
+        self.product_2 = Product.objects.create(name='Agua', category=self.category, is_active=True, sku='AG-1')
+        InventoryBalance.objects.filter(product=self.product).update(reserved=4)
+        self.client.force_authenticate(user=self.staff_user)
+
+    def on_hand(self, product):
+        return InventoryBalance.objects.get(product=product).on_hand
+
+    def test_json_lines_applied_in_one_batch(self):
+        """Las lineas JSON se aplican con un bloqueo y escrituras masivas"""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/inventory/stock/bulk', {'lines': [
+                {'product_id': self.product.id, 'type': 'RECEIPT', 'quantity': 20, 'note': 'Entrega'},
+                {'sku': 'AG-1', 'type': 'receipt', 'quantity': 5},
+                {'product_id': self.product.id, 'type': 'ADJUSTMENT', 'delta': -3, 'note': 'Dañados'},
+            ]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([r['on_hand'] for r in response.data['results']], [30, 5, 27])
+        self.assertEqual((self.on_hand(self.product), self.on_hand(self.product_2)), (27, 5))
+        self.assertEqual(InventoryMovement.objects.filter(movement_type__in=['RECEIPT', 'ADJUSTMENT']).count(), 3)
+        adjustment = InventoryMovement.objects.get(movement_type='ADJUSTMENT')
+        self.assertEqual((adjustment.quantity, adjustment.direction, adjustment.note), (3, -1, '-3 - Dañados'))
+        if connection.vendor == 'postgresql':  # SQLite has no FOR UPDATE
+            locks = [q for q in ctx.captured_queries if 'FOR UPDATE' in q['sql'] and 'inventory_inventorybalance' in q['sql']]
+            self.assertEqual(len(locks), 1)
+
+    def test_csv_upload(self):
+        """Se acepta un archivo CSV"""
+        content = (
+            'sku,product_id,type,quantity,delta,note\n'
+            f',{self.product.id},RECEIPT,10,,Semanal\n'
+            'AG-1,,ADJUSTMENT,,7,Conteo\n'
+        ).encode()
+        upload = SimpleUploadedFile('stock.csv', content, content_type='text/csv')
+        response = self.client.post('/api/inventory/stock/bulk', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((self.on_hand(self.product), self.on_hand(self.product_2)), (20, 7))
+
+    def test_invalid_line_rejects_whole_batch(self):
+        """Una linea invalida rechaza el lote completo con reporte por linea"""
+        response = self.client.post('/api/inventory/stock/bulk', {'lines': [
+            {'product_id': self.product.id, 'type': 'RECEIPT', 'quantity': 20},
+            {'sku': 'NO-EXISTE', 'type': 'RECEIPT', 'quantity': 5},
+            {'product_id': self.product.id, 'type': 'ADJUSTMENT', 'delta': 0},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([r['status'] for r in response.data['results']], ['valid', 'error', 'error'])
+        self.assertEqual(self.on_hand(self.product), 10)
+
+    def test_adjustment_below_reserved_rejects_batch(self):
+        """Un ajuste por debajo de lo reservado rechaza el lote sin aplicar nada"""
+        response = self.client.post('/api/inventory/stock/bulk', {'lines': [
+            {'product_id': self.product_2.id, 'type': 'RECEIPT', 'quantity': 5},
+            {'product_id': self.product.id, 'type': 'ADJUSTMENT', 'delta': -7},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['results'][1]['status'], 'error')
+        self.assertIn('Reserved: 4', response.data['results'][1]['errors']['delta'][0])
+        self.assertEqual(self.on_hand(self.product_2), 0)
+        self.assertFalse(InventoryMovement.objects.filter(movement_type='RECEIPT').exists())
+
+
+class InventorySnapshotTests(KioskOrderTestCase):
+    """Tests para los snapshots diarios de inventario y las consultas as_of"""
+
+    def setUp(self):
+        super().setUp()
+        self.today = timezone.localdate()
+        InventoryBalance.objects.filter(product=self.product).update(on_hand=13, reserved=2)
+        self.movement(3, 'RECEIPT', 5)
+        self.movement(2, 'ADJUSTMENT', 2, direction=-1, note='Dañados')
+        self.movement(1, 'RESERVE', 3)
+        self.movement(0, 'RELEASE', 1)
+        self.client.force_authenticate(user=self.staff_user)
+
+    def movement(self, days_ago, movement_type, quantity, **fields):
+        movement = InventoryMovement.objects.create(
+            product=self.product, movement_type=movement_type, quantity=quantity, **fields
+        )
+        if days_ago:
+            at = day_start(self.today - timedelta(days=days_ago)) + timedelta(hours=10)
+            InventoryMovement.objects.filter(id=movement.id).update(created_at=at)
+
+    def as_of(self, **params):
+        response = self.client.get('/api/inventory/balances/as_of/', dict(params, product=self.product.id))
+        self.assertEqual(response.status_code, 200)
+        row = response.data['results'][0]
+        return row['on_hand'], row['reserved'], row['snapshot_date']
+
+    def test_command_walks_back_from_current_balance(self):
+        """El comando escribe el cierre de cada dia a partir del balance actual"""
+        call_command('snapshot_inventory', days=4, stdout=mock.MagicMock())
+        snapshots = {
+            (self.today - s.date).days: (s.on_hand, s.reserved, s.received, s.adjusted, s.reservations)
+            for s in InventorySnapshot.objects.filter(product=self.product)
+        }
+        self.assertEqual(snapshots, {
+            4: (10, 0, 0, 0, 0),
+            3: (15, 0, 5, 0, 0),
+            2: (13, 0, 0, -2, 0),
+            1: (13, 3, 0, 0, 3),
+        })
+
+        # Reruns overwrite the same rows
+        call_command('snapshot_inventory', stdout=mock.MagicMock())
+        self.assertEqual(InventorySnapshot.objects.count(), 4)
+
+    def test_as_of_combines_snapshot_and_movements(self):
+        """as_of usa el snapshot mas cercano mas los movimientos posteriores"""
+        call_command('snapshot_inventory', days=4, stdout=mock.MagicMock())
+        noon = day_start(self.today - timedelta(days=2)) + timedelta(hours=12)
+        self.assertEqual(self.as_of(at=noon.isoformat()), (13, 0, self.today - timedelta(days=3)))
+        self.assertEqual(self.as_of(date=(self.today - timedelta(days=3)).isoformat())[:2], (15, 0))
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.as_of(date=(self.today - timedelta(days=1)).isoformat())
+        self.assertFalse([q for q in ctx.captured_queries if 'inventory_inventorymovement' in q['sql']])
+
+    def test_as_of_without_snapshots_walks_back(self):
+        """Sin snapshots, as_of descuenta los movimientos posteriores al balance actual"""
+        noon = day_start(self.today - timedelta(days=2)) + timedelta(hours=12)
+        self.assertEqual(self.as_of(at=noon.isoformat()), (13, 0, None))
+        self.assertEqual(self.as_of(date=(self.today - timedelta(days=4)).isoformat()), (10, 0, None))
+        self.assertEqual(self.client.get('/api/inventory/balances/as_of/').status_code, 400)
+
+    def test_only_adjustments_decrease_through_direction(self):
+        """Solo los ajustes pueden tener direccion negativa"""
+        InventoryMovement.adjustment(-2, 'Dañados', product=self.product).clean()
+        with self.assertRaises(ValidationError):
+            InventoryMovement(product=self.product, movement_type='RECEIPT', quantity=2, direction=-1).clean()
+
+
+class InventoryReconciliationTests(KioskOrderTestCase):
+    """Tests para la conciliacion de balances contra el libro de movimientos"""
+
+    def setUp(self):
+        super().setUp()
+        InventoryMovement.objects.create(product=self.product, movement_type='RECEIPT', quantity=10)
+        self.place_order(3)
+
+    def reconcile(self, **options):
+        out = io.StringIO()
+        call_command('reconcile_inventory', lag=0, stdout=out, **options)
+        return out.getvalue()
+
+    def test_consistent_balances_pass(self):
+        """Los balances que coinciden con los movimientos no se reportan"""
+        self.assertIn('balances match the ledger', self.reconcile())
+        checkpoint = InventoryLedgerCheckpoint.objects.get(product=self.product)
+        self.assertEqual((checkpoint.on_hand, checkpoint.reserved), (10, 3))
+
+    def test_manual_edit_reported_and_fixed_from_ledger(self):
+        """Una edicion manual se reporta y se corrige desde el libro"""
+        InventoryBalance.objects.filter(product=self.product).update(on_hand=15, reserved=1)
+        output = self.reconcile()
+        self.assertIn(f'Product {self.product.id}: on_hand=15 ledger=10, reserved=1 ledger=3', output)
+        self.assertEqual(InventoryBalance.objects.get(product=self.product).on_hand, 15)
+
+        self.reconcile(fix='balance')
+        balance = InventoryBalance.objects.get(product=self.product)
+        self.assertEqual((balance.on_hand, balance.reserved), (10, 3))
+
+    def test_fix_ledger_records_movements(self):
+        """Corregir el libro registra movimientos por la diferencia"""
+        InventoryBalance.objects.filter(product=self.product).update(on_hand=15)
+        self.reconcile(fix='ledger')
+        adjustment = InventoryMovement.objects.get(movement_type='ADJUSTMENT')
+        self.assertEqual((adjustment.quantity, adjustment.direction, adjustment.note), (5, 1, '+5 - Reconciliation'))
+        self.assertIn('balances match the ledger', self.reconcile())
+
+    def test_incremental_run_reads_only_new_movements(self):
+        """Una corrida incremental solo lee los movimientos posteriores al checkpoint"""
+        self.reconcile()
+        through = InventoryLedgerCheckpoint.objects.get(product=self.product).through
+        InventoryMovement.objects.create(product=self.product, movement_type='RECEIPT', quantity=4)
+        InventoryBalance.objects.filter(product=self.product).update(on_hand=14)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertIn('balances match the ledger', self.reconcile())
+        movement_queries = [q['sql'] for q in ctx.captured_queries if 'FROM "inventory_inventorymovement"' in q['sql']]
+        self.assertTrue(movement_queries)
+        self.assertTrue(all('"created_at" >=' in sql for sql in movement_queries))
+        checkpoint = InventoryLedgerCheckpoint.objects.get(product=self.product)
+        self.assertEqual(checkpoint.on_hand, 14)
+        self.assertGreater(checkpoint.through, through)
+
+        # A full run reaches the same totals from the first movement
+        self.assertIn('balances match the ledger', self.reconcile(full=True))
+
+
+class LowStockAlertTests(KioskOrderTestCase):
+    """Tests para las alertas de stock bajo por WebSocket"""
+
+    def setUp(self):
+        super().setUp()
+        InventoryBalance.objects.filter(product=self.product).update(on_hand=6, reorder_level=3)
+
+    def place_order(self, quantity=1, items=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return super().place_order(quantity, items)
+
+    def cancel(self, order_id):
+        self.client.force_authenticate(user=self.staff_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/orders/{order_id}/cancel/', {}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def alerts(self):
+        return [
+            event.payload for event in OutboxEvent.objects.order_by('id')
+            if event.payload['type'] in ('low_stock', 'low_stock_cleared')
+        ]
+
+    def test_crossing_sends_one_alert(self):
+        """Cruzar el nivel de reorden envia una sola alerta low_stock"""
+        self.place_order(2)
+        self.assertEqual(self.alerts(), [])
+        self.place_order(1)
+        self.place_order(1)
+        alerts = self.alerts()
+        self.assertEqual(len(alerts), 1)
+        self.assertEqual(alerts[0]['type'], 'low_stock')
+        self.assertEqual(alerts[0]['product_id'], self.product.id)
+        self.assertEqual((alerts[0]['available'], alerts[0]['threshold']), (3, 3))
+        self.assertEqual(OutboxEvent.objects.filter(group='staff_orders', payload__type='low_stock').count(), 1)
+
+    def test_release_clears_and_alerts_are_debounced(self):
+        """Liberar stock envia low_stock_cleared y una nueva caida dentro de la ventana no repite la alerta"""
+        order_id = self.place_order(3)
+        self.cancel(order_id)
+        cache.clear()  # The debounce lives on the balance, shared by every process
+        self.place_order(4)
+        self.assertEqual([alert['type'] for alert in self.alerts()], ['low_stock', 'low_stock_cleared'])
+
+    def test_receipt_clears_alert(self):
+        """Una recepcion que supera el nivel envia low_stock_cleared"""
+        self.place_order(4)
+        self.client.force_authenticate(user=self.staff_user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/inventory/stock/receipt', {
+                'product_id': self.product.id, 'quantity': 5
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([alert['type'] for alert in self.alerts()], ['low_stock', 'low_stock_cleared'])
+        self.assertEqual(low_stock_products(), [])
+
+    def test_dashboard_reads_cached_list(self):
+        """El dashboard lee la lista cacheada de productos con stock bajo"""
+        self.client.force_authenticate(user=self.staff_user)
+        self.client.get('/api/orders/dashboard/stats/')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/orders/dashboard/stats/')
+        self.assertEqual(response.data['products']['low_stock'], [])
+        self.assertFalse([q for q in ctx.captured_queries if 'inventory_inventorybalance' in q['sql']])
+
+        self.place_order(4)
+        response = self.client.get('/api/orders/dashboard/stats/')
+        low_stock = response.data['products']['low_stock']
+        self.assertEqual([(item['product__name'], item['on_hand'], item['available']) for item in low_stock], [
+            (self.product.name, 6, 2)
+        ])
+
+    def test_reconcile_fix_checks_low_stock(self):
+        """Corregir un balance desde el libro detecta el cruce e invalida la lista cacheada"""
+        InventoryMovement.objects.create(product=self.product, movement_type='RECEIPT', quantity=6)
+        self.assertEqual(low_stock_products(), [])
+        InventoryMovement.objects.create(
+            product=self.product, movement_type='ADJUSTMENT', quantity=4, direction=-1, note='Dañados'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reconcile_inventory', lag=0, fix='balance', stdout=io.StringIO())
+        self.assertEqual(InventoryBalance.objects.get(product=self.product).on_hand, 2)
+        self.assertEqual([alert['type'] for alert in self.alerts()], ['low_stock'])
+        self.assertEqual([item['product_id'] for item in low_stock_products()], [self.product.id])
@@ -9,6 +9,7 @@ router.register(r'balances', InventoryBalanceViewSet, basename='inventory-balanc
 urlpatterns = [
     path('stock/receipt', StockOperationsViewSet.as_view({'post': 'stock_receipt'}), name='stock-receipt'),
     path('stock/adjust', StockOperationsViewSet.as_view({'post': 'stock_adjustment'}), name='stock-adjust'),
+    path('stock/bulk', StockOperationsViewSet.as_view({'post': 'stock_bulk'}), name='stock-bulk'),
 ]
 
 # Add router URLs
@@ -1,6 +1,9 @@
+import csv
 import logging
+from datetime import date, datetime, timedelta
 
-from django.db import transaction
+from django.db import OperationalError, transaction
+from django.utils import timezone
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -9,11 +12,19 @@ from accounts.permissions import IsStaffOrAdmin
 
 logger = logging.getLogger(__name__)
 
+from .alerts import check_low_stock
+from .bulk import MAX_LINES, BulkStockError, apply_lines, read_csv, validate_lines
 from .models import InventoryBalance, InventoryMovement
+from .overview import inventory_overview
+from .pagination import InventoryCursorPagination
+from .snapshots import day_start, stock_as_of
+from .striping import fit_capacity, lock_stripes, with_stripe_reserved
+from orders.contention import transactional_retry
 from catalog.models import Product
 from .serializers import (
     InventoryBalanceSerializer,
     InventoryMovementSerializer,
+    InventoryOverviewSerializer,
     StockReceiptSerializer,
     StockAdjustmentSerializer
 )
@@ -27,7 +38,7 @@ class InventoryBalanceViewSet(viewsets.ReadOnlyModelViewSet):
     list: Get all inventory balances
     retrieve: Get a specific inventory balance
     """
-    queryset = InventoryBalance.objects.select_related('product', 'product__category').all()
+    queryset = with_stripe_reserved(InventoryBalance.objects.select_related('product', 'product__category'))
     serializer_class = InventoryBalanceSerializer
     permission_classes = [IsStaffOrAdmin]
 
@@ -36,49 +47,94 @@ class InventoryBalanceViewSet(viewsets.ReadOnlyModelViewSet):
         """
         Get all products with their inventory data
         Shows both inventoried and non-inventoried products
-        GET /api/inventory/balances/all_products/
+        GET /api/inventory/balances/all_products/?needs_reorder=true&category=3&search=jugo&inventoried=true
+        Add cursor/page_size for cursor pagination (ordered by name), otherwise
+        the whole list is returned ordered by category and name
         """
-        # Get all active products
-        products = Product.objects.filter(is_active=True).select_related('category').order_by('category__name', 'name')
+        filters = {}
+        for param in ('needs_reorder', 'inventoried'):
+            value = request.query_params.get(param)
+            if value is not None:
+                if value not in ('true', 'false'):
+                    return Response({
+                        'error': f'{param} must be true or false'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                filters[param] = value == 'true'
+        category = request.query_params.get('category')
+        if category:
+            if not category.isdigit():
+                return Response({'error': 'category must be a category id'}, status=status.HTTP_400_BAD_REQUEST)
+            filters['category'] = int(category)
+        filters['search'] = request.query_params.get('search', '').strip() or None
 
-        result = []
-        for product in products:
-            try:
-                # Try to get inventory balance
-                balance = InventoryBalance.objects.get(product=product)
-                result.append({
-                    'id': product.id,
-                    'name': product.name,
-                    'category': product.category.name,
-                    'sku': product.sku or '-',
-                    'inventoried': True,
-                    'on_hand': balance.on_hand,
-                    'reserved': balance.reserved,
-                    'available': balance.available,
-                    'reorder_level': balance.reorder_level,
-                    'needs_reorder': balance.needs_reorder,
-                })
-            except InventoryBalance.DoesNotExist:
-                # Product not in inventory system
-                result.append({
-                    'id': product.id,
-                    'name': product.name,
-                    'category': product.category.name,
-                    'sku': product.sku or '-',
-                    'inventoried': False,
-                    'on_hand': None,
-                    'reserved': None,
-                    'available': None,
-                    'reorder_level': None,
-                    'needs_reorder': False,
-                })
+        products = inventory_overview(**filters)
 
+        if 'cursor' in request.query_params or 'page_size' in request.query_params:
+            paginator = InventoryCursorPagination()
+            page = paginator.paginate_queryset(products, request, view=self)
+            return paginator.get_paginated_response(InventoryOverviewSerializer(page, many=True).data)
+
+        result = InventoryOverviewSerializer(products.order_by('category__name', 'name'), many=True).data
         return Response({
             'count': len(result),
             'results': result
         }, status=status.HTTP_200_OK)
 
 
+    @action(detail=False, methods=['get'])
+    def as_of(self, request):
+        """
+        Stock of the inventoried products at a point in time, from the nearest
+        daily snapshot plus the movements after it
+        GET /api/inventory/balances/as_of/?at=2026-09-30T18:00:00Z&product=1,2&category=3
+        GET /api/inventory/balances/as_of/?date=2026-09-30   (closing stock of that day)
+        """
+        at = request.query_params.get('at')
+        day = request.query_params.get('date')
+        try:
+            if at:
+                at = datetime.fromisoformat(at)
+                if timezone.is_naive(at):
+                    at = timezone.make_aware(at)
+            elif day:
+                at = day_start(date.fromisoformat(day) + timedelta(days=1))
+            else:
+                return Response({'error': 'Pass at (ISO datetime) or date (YYYY-MM-DD)'}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError:
+            return Response({'error': 'Invalid at or date'}, status=status.HTTP_400_BAD_REQUEST)
+
+        products = Product.objects.all()
+        if request.query_params.get('product'):
+            try:
+                products = products.filter(id__in=[int(pid) for pid in request.query_params['product'].split(',') if pid.strip()])
+            except ValueError:
+                return Response({'error': 'product must be a comma-separated list of ids'}, status=status.HTTP_400_BAD_REQUEST)
+        category = request.query_params.get('category')
+        if category:
+            if not category.isdigit():
+                return Response({'error': 'category must be a category id'}, status=status.HTTP_400_BAD_REQUEST)
+            products = products.filter(category_id=int(category))
+        names = dict(products.values_list('id', 'name'))
+
+        stock = stock_as_of(at, product_ids=list(names))
+        results = [
+            {
+                'product_id': product_id,
+                'product_name': names[product_id],
+                'on_hand': figures['on_hand'],
+                'reserved': figures['reserved'],
+                'available': figures['on_hand'] - figures['reserved'],
+                'snapshot_date': figures['snapshot_date'],
+            }
+            for product_id, figures in sorted(stock.items(), key=lambda item: names[item[0]])
+        ]
+        return Response({
+            'at': at.isoformat(),
+            'count': len(results),
+            'results': results
+        }, status=status.HTTP_200_OK)
+
+
 class StockOperationsViewSet(viewsets.ViewSet):
     """
     ViewSet for stock operations (Staff only)
@@ -87,6 +143,7 @@ class StockOperationsViewSet(viewsets.ViewSet):
     permission_classes = [IsStaffOrAdmin]
 
     @action(detail=False, methods=['post'], url_path='receipt')
+    @transactional_retry('stock_receipt')
     def stock_receipt(self, request):
         """
         Receive stock (increase on_hand)
@@ -119,6 +176,7 @@ class StockOperationsViewSet(viewsets.ViewSet):
                 # Update balance
                 balance.on_hand += quantity
                 balance.save(update_fields=['on_hand', 'updated_at'])
+                check_low_stock({product.id: quantity})
 
                 # Create movement record
                 movement = InventoryMovement.objects.create(
@@ -140,6 +198,8 @@ class StockOperationsViewSet(viewsets.ViewSet):
             return Response({
                 'error': 'Product not found'
             }, status=status.HTTP_404_NOT_FOUND)
+        except OperationalError:
+            raise  # Retried by @transactional_retry
         except Exception as e:
             logger.error('Error receiving stock', exc_info=True)
             return Response({
@@ -147,6 +207,7 @@ class StockOperationsViewSet(viewsets.ViewSet):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     @action(detail=False, methods=['post'], url_path='adjust')
+    @transactional_retry('stock_adjustment')
     def stock_adjustment(self, request):
         """
         Adjust stock (positive or negative delta)
@@ -185,24 +246,31 @@ class StockOperationsViewSet(viewsets.ViewSet):
                         'error': f'Insufficient stock. Current: {balance.on_hand}, Requested delta: {delta}'
                     }, status=status.HTTP_400_BAD_REQUEST)
 
-                # Validate that on_hand >= reserved
-                if new_on_hand < balance.reserved:
+                # Validate that on_hand >= reserved (striped reservations included)
+                stripes = lock_stripes(product.id) if balance.stripe_count else []
+                reserved = balance.reserved + sum(stripe.reserved for stripe in stripes)
+                if new_on_hand < reserved:
                     return Response({
-                        'error': f'Cannot reduce stock below reserved quantity. Reserved: {balance.reserved}, New on_hand would be: {new_on_hand}'
+                        'error': f'Cannot reduce stock below reserved quantity. Reserved: {reserved}, New on_hand would be: {new_on_hand}'
                     }, status=status.HTTP_400_BAD_REQUEST)
 
+                # Give back the stripes' capacity that no longer exists
+                if stripes and delta < 0:
+                    fit_capacity(balance, stripes, new_on_hand)
+
                 # Update balance
                 balance.on_hand = new_on_hand
                 balance.save(update_fields=['on_hand', 'updated_at'])
+                check_low_stock({product.id: delta})
 
                 # Create movement record
-                movement = InventoryMovement.objects.create(
+                movement = InventoryMovement.adjustment(
+                    delta,
+                    note,
                     product=product,
-                    movement_type='ADJUSTMENT',
-                    quantity=abs(delta),
-                    created_by=request.user if request.user.is_authenticated else None,
-                    note=f"{'+' if delta > 0 else ''}{delta} - {note}"
+                    created_by=request.user if request.user.is_authenticated else None
                 )
+                movement.save()
 
                 return Response({
                     'success': True,
@@ -215,8 +283,68 @@ class StockOperationsViewSet(viewsets.ViewSet):
             return Response({
                 'error': 'Product not found'
             }, status=status.HTTP_404_NOT_FOUND)
+        except OperationalError:
+            raise  # Retried by @transactional_retry
         except Exception as e:
             logger.error('Error adjusting stock', exc_info=True)
             return Response({
                 'error': 'Error interno del servidor. Intente nuevamente.'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    @transactional_retry('stock_bulk')
+    def stock_bulk(self, request):
+        """
+        Receive and adjust stock of many products at once (all or nothing)
+        POST /api/inventory/stock/bulk
+        {
+            "lines": [
+                {"product_id": 1, "type": "RECEIPT", "quantity": 100, "note": "Weekly delivery"},
+                {"sku": "BEB-0002", "type": "ADJUSTMENT", "delta": -3, "note": "Damaged items"}
+            ]
+        }
+        or multipart with a CSV "file" (columns product_id or sku, type, quantity, delta, note)
+        """
+        uploaded = request.FILES.get('file')
+        if uploaded is not None:
+            try:
+                raw_lines = read_csv(uploaded)
+            except (UnicodeDecodeError, csv.Error):
+                return Response({
+                    'error': 'The file must be a UTF-8 CSV'
+                }, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            raw_lines = request.data.get('lines') if isinstance(request.data, dict) else request.data
+        if not isinstance(raw_lines, list) or not raw_lines:
+            return Response({
+                'error': 'Send "lines" or a CSV "file" with at least one line'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if len(raw_lines) > MAX_LINES:
+            return Response({
+                'error': f'At most {MAX_LINES} lines per request'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            lines = validate_lines(raw_lines)
+            with transaction.atomic():
+                results = apply_lines(lines, user=request.user if request.user.is_authenticated else None)
+
+            return Response({
+                'success': True,
+                'message': f'{len(results)} stock lines applied',
+                'results': results
+            }, status=status.HTTP_201_CREATED)
+
+        except BulkStockError as exc:
+            return Response({
+                'success': False,
+                'error': 'No changes were applied. Fix the lines with errors and send the batch again.',
+                'results': exc.report
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except OperationalError:
+            raise  # Retried by @transactional_retry
+        except Exception as e:
+            logger.error('Error applying bulk stock operation', exc_info=True)
+            return Response({
+                'error': 'Error interno del servidor. Intente nuevamente.'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
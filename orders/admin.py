@@ -1,5 +1,7 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.db import transaction
 from .models import Order, OrderItem, OrderStatusEvent
+from .state_machine import lock_orders, transition_orders
 
 
 class OrderItemInline(admin.TabularInline):
@@ -25,16 +27,16 @@ class OrderStatusEventInline(admin.TabularInline):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ['id', 'status', 'assignment', 'room', 'patient', 'placed_at', 'delivered_at']
+    list_display = ['id', 'status', 'assignment', 'room', 'patient', 'item_count', 'total_quantity', 'placed_at', 'delivered_at']
     list_filter = ['status', 'placed_at', 'delivered_at']
     search_fields = ['id', 'assignment__device_uid', 'room__code', 'patient__full_name']
-    readonly_fields = ['placed_at', 'delivered_at', 'cancelled_at', 'created_at', 'updated_at']
+    readonly_fields = ['item_count', 'total_quantity', 'placed_at', 'delivered_at', 'cancelled_at', 'created_at', 'updated_at']
     ordering = ['-placed_at']
     inlines = [OrderItemInline, OrderStatusEventInline]
 
     fieldsets = (
         ('Order Information', {
-            'fields': ('status', 'assignment', 'room', 'patient')
+            'fields': ('status', 'assignment', 'room', 'patient', 'item_count', 'total_quantity')
         }),
         ('Timestamps', {
             'fields': ('placed_at', 'delivered_at', 'cancelled_at', 'created_at', 'updated_at'),
@@ -42,6 +44,32 @@ class OrderAdmin(admin.ModelAdmin):
         }),
     )
 
+    def has_add_permission(self, request):
+        # Orders are created through the API, which reserves their stock and
+        # counts them as active ('' -> PLACED hooks); an order added here would
+        # later release or consume stock it never reserved
+        return False
+
+    def save_model(self, request, obj, form, change):
+        # Status changes go through the order state machine so inventory and
+        # patient side effects match the API
+        if 'status' not in form.changed_data:
+            return super().save_model(request, obj, form, change)
+
+        to_status = obj.status
+        obj.status = form.initial['status']
+        with transaction.atomic():
+            super().save_model(request, obj, form, change)
+            changed, errors = transition_orders(
+                lock_orders([obj.pk]),
+                to_status,
+                changed_by=request.user,
+                note='Status changed from admin'
+            )
+        if errors:
+            self.message_user(request, errors[0]['error'], level=messages.ERROR)
+        obj.refresh_from_db()
+
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
@@ -0,0 +1,132 @@
+"""
+Admission control for order creation
+
+When the database slows down, order requests would otherwise pile up in the
+server's worker threads while holding connections and row locks. The kiosk
+and staff create paths go through one AdmissionController per process that:
+
+- lets at most ORDER_ADMISSION_MAX_IN_FLIGHT requests run at the same time,
+- queues up to ORDER_ADMISSION_MAX_QUEUE more for ORDER_ADMISSION_MAX_WAIT
+  seconds each,
+- rejects everything beyond that with 503 and a Retry-After header.
+
+Queue depth, rejections and wait times are exposed by GET /api/orders/metrics/.
+ORDER_ADMISSION_MAX_IN_FLIGHT = 0 disables admission control.
+"""
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.response import Response
+
+DEFAULT_MAX_IN_FLIGHT = 8
+DEFAULT_MAX_QUEUE = 32
+DEFAULT_MAX_WAIT = 2.0
+DEFAULT_RETRY_AFTER = 2
+
+
+class AdmissionController:
+    """
+    Bounded concurrency with a bounded, deadline-limited wait queue
+    Limits are read from settings on every acquire()
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._condition = threading.Condition()
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.max_queued = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+
+    @staticmethod
+    def limits():
+        return (
+            getattr(settings, 'ORDER_ADMISSION_MAX_IN_FLIGHT', DEFAULT_MAX_IN_FLIGHT),
+            getattr(settings, 'ORDER_ADMISSION_MAX_QUEUE', DEFAULT_MAX_QUEUE),
+            getattr(settings, 'ORDER_ADMISSION_MAX_WAIT', DEFAULT_MAX_WAIT),
+        )
+
+    def acquire(self):
+        """Take a slot, waiting in the queue if needed; returns False when shed"""
+        max_in_flight, max_queue, max_wait = self.limits()
+        started = time.monotonic()
+        with self._condition:
+            if max_in_flight <= 0 or (self.in_flight < max_in_flight and not self.queued):
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+            if self.queued >= max_queue:
+                self.rejected += 1
+                return False
+
+            self.queued += 1
+            self.max_queued = max(self.max_queued, self.queued)
+            deadline = started + max_wait
+            try:
+                while self.in_flight >= max_in_flight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        return False
+                    self._condition.wait(remaining)
+                self.in_flight += 1
+                self.admitted += 1
+                waited = time.monotonic() - started
+                self.total_wait += waited
+                self.max_wait_seen = max(self.max_wait_seen, waited)
+                return True
+            finally:
+                self.queued -= 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def snapshot(self):
+        """Current queue depth and counters since the process started"""
+        max_in_flight, max_queue, max_wait = self.limits()
+        with self._condition:
+            return {
+                'max_in_flight': max_in_flight,
+                'max_queue': max_queue,
+                'max_wait_seconds': max_wait,
+                'in_flight': self.in_flight,
+                'queued': self.queued,
+                'max_queued': self.max_queued,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'avg_wait_ms': round(1000 * self.total_wait / self.admitted, 2) if self.admitted else 0.0,
+                'max_wait_ms': round(1000 * self.max_wait_seen, 2),
+            }
+
+
+order_admission = AdmissionController('order_create')
+
+
+def admission_controlled(view_method):
+    """
+    Run a view method under the order admission controller
+    Returns 503 with Retry-After when the request is shed
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        if not order_admission.acquire():
+            retry_after = getattr(settings, 'ORDER_ADMISSION_RETRY_AFTER', DEFAULT_RETRY_AFTER)
+            return Response({
+                'error': 'El servicio está ocupado. Intente nuevamente en unos segundos.',
+                'retry_after': retry_after
+            }, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': str(retry_after)})
+        try:
+            return view_method(self, request, *args, **kwargs)
+        finally:
+            order_admission.release()
+    return wrapper
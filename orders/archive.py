@@ -0,0 +1,128 @@
+"""
+Hot/cold order archiving
+
+Delivered and cancelled orders older than ORDER_ARCHIVE_AFTER_DAYS are moved,
+with their items, status events and inventory movements, into the archive
+tables in chunked batches (archive_orders command). Each batch is one short
+transaction that skips rows locked by kiosk or staff requests, so the hot
+tables stay small without blocking order traffic.
+
+Archived rows keep their original ids. Order history and reports read both
+sides through the helpers below.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from inventory.models import ArchivedInventoryMovement, InventoryMovement
+
+from .models import (
+    ArchivedOrder,
+    ArchivedOrderItem,
+    ArchivedOrderStatusEvent,
+    Order,
+    OrderIdempotencyKey,
+    OrderItem,
+    OrderStatusEvent,
+)
+
+ARCHIVABLE_STATUSES = ['DELIVERED', 'CANCELLED']
+DEFAULT_ARCHIVE_AFTER_DAYS = 90
+DEFAULT_BATCH_SIZE = 500
+
+ORDER_PREFETCH = ('items__product__category', 'status_events__changed_by')
+
+
+def archive_cutoff(days=None):
+    """Orders placed before this datetime can be archived"""
+    if days is None:
+        days = getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', DEFAULT_ARCHIVE_AFTER_DAYS)
+    return timezone.now() - timedelta(days=days)
+
+
+def _copy_rows(queryset, archive_model):
+    """Insert the rows of queryset into archive_model (same column names)"""
+    fields = [f.attname for f in archive_model._meta.concrete_fields if f.attname != 'archived_at']
+    archive_model.objects.bulk_create([archive_model(**row) for row in queryset.values(*fields)])
+
+
+def archive_batch(cutoff, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Move one batch of archivable orders (and their rows) to the archive tables
+    Returns the number of orders archived
+    """
+    with transaction.atomic():
+        order_ids = list(Order.objects.select_for_update(skip_locked=True).filter(
+            status__in=ARCHIVABLE_STATUSES,
+            placed_at__lt=cutoff
+        ).order_by('placed_at', 'id').values_list('id', flat=True)[:batch_size])
+        if not order_ids:
+            return 0
+
+        _copy_rows(Order.objects.filter(id__in=order_ids), ArchivedOrder)
+        _copy_rows(OrderItem.objects.filter(order_id__in=order_ids), ArchivedOrderItem)
+        _copy_rows(OrderStatusEvent.objects.filter(order_id__in=order_ids), ArchivedOrderStatusEvent)
+        _copy_rows(InventoryMovement.objects.filter(order_id__in=order_ids), ArchivedInventoryMovement)
+
+        InventoryMovement.objects.filter(order_id__in=order_ids).delete()
+        OrderStatusEvent.objects.filter(order_id__in=order_ids).delete()
+        OrderItem.objects.filter(order_id__in=order_ids).delete()
+        OrderIdempotencyKey.objects.filter(order_id__in=order_ids).delete()
+        Order.objects.filter(id__in=order_ids).delete()
+        return len(order_ids)
+
+
+def archive_orders(cutoff=None, batch_size=DEFAULT_BATCH_SIZE, max_batches=None):
+    """
+    Archive orders placed before cutoff in batches of batch_size
+    Returns the total number of orders archived
+    """
+    if cutoff is None:
+        cutoff = archive_cutoff()
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        archived = archive_batch(cutoff, batch_size)
+        total += archived
+        batches += 1
+        if archived < batch_size:
+            break
+    return total
+
+
+def order_sources():
+    """Order models holding order rows, hot table first"""
+    return (Order, ArchivedOrder)
+
+
+def order_item_sources():
+    """Order item models, hot table first"""
+    return (OrderItem, ArchivedOrderItem)
+
+
+def patient_order_history(patient, limit=None):
+    """
+    Hot and archived orders of a patient, newest first
+    Returns (total_count, orders); orders mixes Order and ArchivedOrder
+    """
+    hot = patient.orders.prefetch_related(*ORDER_PREFETCH).order_by('-placed_at')
+    archived = patient.archived_orders.prefetch_related(*ORDER_PREFETCH).order_by('-placed_at')
+    total = hot.count() + archived.count()
+    if limit is not None:
+        hot, archived = hot[:limit], archived[:limit]
+    orders = sorted([*hot, *archived], key=lambda order: order.placed_at, reverse=True)
+    return total, orders[:limit] if limit is not None else orders
+
+
+def serialize_order_history(orders, context=None):
+    """Serialize a mixed list of Order and ArchivedOrder"""
+    from .serializers import ArchivedOrderSerializer, OrderSerializer
+
+    return [
+        (ArchivedOrderSerializer if isinstance(order, ArchivedOrder) else OrderSerializer)(
+            order, context=context or {}
+        ).data
+        for order in orders
+    ]
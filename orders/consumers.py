@@ -78,6 +78,7 @@ class StaffOrderConsumer(AsyncWebsocketConsumer):
             'placed_at': event['placed_at'],
             'device_uid': event.get('device_uid'),
         }))
+        await self.prep_summary_delta(event)
 
     async def order_updated(self, event):
         """
@@ -91,6 +92,43 @@ class StaffOrderConsumer(AsyncWebsocketConsumer):
             'from_status': event.get('from_status'),
             'changed_at': event.get('changed_at'),
         }))
+        await self.prep_summary_delta(event)
+
+    async def orders_updated(self, event):
+        """
+        Handle coalesced orders_updated event from channel layer (bulk status change)
+        Sent to the WebSocket as one order_updated message per order
+        """
+        for change in event['orders']:
+            await self.order_updated(change)
+        await self.prep_summary_delta(event)
+
+    async def prep_summary_delta(self, event):
+        """
+        Forward the prep summary changes carried by an order event
+        (signed quantities per product and per room, see orders/prep.py)
+        """
+        if not event.get('prep_delta'):
+            return
+        await self.send(text_data=json.dumps(dict(
+            event['prep_delta'],
+            type='prep_summary_delta',
+            queue_version=event.get('queue_version'),
+        )))
+
+    async def low_stock(self, event):
+        """
+        Handle low_stock event from channel layer
+        A product's available stock fell to or below its level (inventory/alerts.py)
+        """
+        await self.send(text_data=json.dumps(event))
+
+    async def low_stock_cleared(self, event):
+        """
+        Handle low_stock_cleared event from channel layer
+        A product's available stock rose back above its level
+        """
+        await self.send(text_data=json.dumps(event))
 
     async def assignment_updated(self, event):
         """
@@ -200,6 +238,14 @@ class KioskOrderConsumer(AsyncWebsocketConsumer):
             'changed_at': event.get('changed_at'),
         }))
 
+    async def orders_status_changed(self, event):
+        """
+        Handle coalesced orders_status_changed event from channel layer (bulk status change)
+        Sent to the kiosk as one order_status_changed message per order
+        """
+        for change in event['orders']:
+            await self.order_status_changed(change)
+
     async def order_created_by_staff(self, event):
         """
         Handle order_created_by_staff event from channel layer
@@ -0,0 +1,185 @@
+"""
+Transaction retries and lock contention metrics
+
+@transactional_retry(endpoint) wraps the order and stock write endpoints:
+
+- lock_timeout is set for the request (DB_LOCK_TIMEOUT_MS, per endpoint
+  overrides in DB_LOCK_TIMEOUT_MS_BY_ENDPOINT), so a request gives up on a
+  held row lock instead of queueing behind it indefinitely;
+- deadlocks, serialization failures and lock timeouts are retried up to
+  DB_RETRY_MAX_ATTEMPTS times with jittered exponential backoff, then
+  answered with 503 + Retry-After instead of the generic 500;
+- every row-lock query (SELECT ... FOR UPDATE) is timed. Retries and lock
+  wait time are recorded per endpoint, and lock waits longer than
+  DB_CONTENTION_THRESHOLD_MS are counted per locked table and ids, so the
+  contended products or devices show up in GET /api/orders/metrics/.
+
+Views must let OperationalError propagate (`except OperationalError: raise`)
+for it to reach the decorator, which answers other database errors with the
+usual 500.
+"""
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, connection
+from rest_framework import status
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+# deadlock_detected, serialization_failure, lock_not_available (lock_timeout)
+RETRYABLE_SQLSTATES = {'40P01', '40001', '55P03'}
+
+DEFAULT_LOCK_TIMEOUT_MS = 2000
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BACKOFF = 0.05
+DEFAULT_CONTENTION_THRESHOLD_MS = 100
+HOT_KEYS_LIMIT = 20
+
+_LOCKED_TABLE = re.compile(r'FROM "(\w+)"')
+
+
+def is_retryable(exc):
+    """Whether a database error is a deadlock, serialization failure or lock timeout"""
+    cause = exc.__cause__ or exc
+    return getattr(cause, 'pgcode', None) in RETRYABLE_SQLSTATES
+
+
+class ContentionStats:
+    """Per-endpoint retry and lock-wait counters (per process)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+        self.hot_keys = Counter()
+
+    def _endpoint(self, endpoint):
+        return self.endpoints.setdefault(endpoint, {
+            'calls': 0,
+            'retries': 0,
+            'failures': 0,
+            'lock_queries': 0,
+            'lock_wait_ms': 0.0,
+            'max_lock_wait_ms': 0.0,
+        })
+
+    def record_call(self, endpoint):
+        with self._lock:
+            self._endpoint(endpoint)['calls'] += 1
+
+    def record_retry(self, endpoint):
+        with self._lock:
+            self._endpoint(endpoint)['retries'] += 1
+
+    def record_failure(self, endpoint):
+        with self._lock:
+            self._endpoint(endpoint)['failures'] += 1
+
+    def record_lock_wait(self, endpoint, key, wait_ms, threshold_ms):
+        with self._lock:
+            stats = self._endpoint(endpoint)
+            stats['lock_queries'] += 1
+            stats['lock_wait_ms'] += wait_ms
+            stats['max_lock_wait_ms'] = max(stats['max_lock_wait_ms'], wait_ms)
+            if wait_ms >= threshold_ms:
+                self.hot_keys[key] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'endpoints': {
+                    endpoint: dict(
+                        stats,
+                        lock_wait_ms=round(stats['lock_wait_ms'], 2),
+                        max_lock_wait_ms=round(stats['max_lock_wait_ms'], 2)
+                    )
+                    for endpoint, stats in self.endpoints.items()
+                },
+                'hot_keys': [
+                    {'key': key, 'count': count}
+                    for key, count in self.hot_keys.most_common(HOT_KEYS_LIMIT)
+                ],
+            }
+
+
+contention_stats = ContentionStats()
+
+
+class _LockTimer:
+    """Connection execute wrapper that times row-lock queries"""
+
+    def __init__(self, endpoint, threshold_ms):
+        self.endpoint = endpoint
+        self.threshold_ms = threshold_ms
+
+    def __call__(self, execute, sql, params, many, context):
+        if 'FOR UPDATE' not in sql:
+            return execute(sql, params, many, context)
+        started = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            table = _LOCKED_TABLE.search(sql)
+            ids = ','.join(str(p) for p in (params or ()) if isinstance(p, int))
+            key = f'{table.group(1) if table else "?"}:{ids}'
+            contention_stats.record_lock_wait(
+                self.endpoint, key, 1000 * (time.monotonic() - started), self.threshold_ms
+            )
+
+
+def _lock_timeout_ms(endpoint, lock_timeout_ms):
+    if lock_timeout_ms is not None:
+        return lock_timeout_ms
+    by_endpoint = getattr(settings, 'DB_LOCK_TIMEOUT_MS_BY_ENDPOINT', {})
+    return by_endpoint.get(endpoint, getattr(settings, 'DB_LOCK_TIMEOUT_MS', DEFAULT_LOCK_TIMEOUT_MS))
+
+
+def transactional_retry(endpoint, lock_timeout_ms=None):
+    """
+    Retry a view method on deadlocks/serialization failures/lock timeouts,
+    with lock_timeout set and lock waits recorded under `endpoint`
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            max_attempts = getattr(settings, 'DB_RETRY_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+            backoff = getattr(settings, 'DB_RETRY_BACKOFF', DEFAULT_BACKOFF)
+            threshold_ms = getattr(settings, 'DB_CONTENTION_THRESHOLD_MS', DEFAULT_CONTENTION_THRESHOLD_MS)
+            timeout_ms = _lock_timeout_ms(endpoint, lock_timeout_ms)
+            use_lock_timeout = timeout_ms and connection.vendor == 'postgresql'
+
+            contention_stats.record_call(endpoint)
+            if use_lock_timeout:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT set_config(%s, %s, false)', ['lock_timeout', f'{int(timeout_ms)}ms'])
+            try:
+                with connection.execute_wrapper(_LockTimer(endpoint, threshold_ms)):
+                    for attempt in range(1, max_attempts + 1):
+                        try:
+                            return view_method(self, request, *args, **kwargs)
+                        except OperationalError as exc:
+                            if not is_retryable(exc):
+                                logger.error('Database error in %s', endpoint, exc_info=True)
+                                return Response({
+                                    'error': 'Error interno del servidor. Intente nuevamente.'
+                                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                            if attempt == max_attempts:
+                                contention_stats.record_failure(endpoint)
+                                logger.warning('%s gave up after %s attempts: %s', endpoint, attempt, exc)
+                                return Response({
+                                    'error': 'El servicio está ocupado. Intente nuevamente en unos segundos.'
+                                }, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
+                            contention_stats.record_retry(endpoint)
+                            time.sleep(random.uniform(0, backoff * 2 ** (attempt - 1)))
+            finally:
+                if use_lock_timeout:
+                    with connection.cursor() as cursor:
+                        cursor.execute('RESET lock_timeout')
+        return wrapper
+    return decorator
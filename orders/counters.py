@@ -0,0 +1,168 @@
+"""
+Incrementally maintained order status counters
+
+Every order counts once per scope (GLOBAL, ROOM, HOUR) under its current
+status. The create and transition paths call apply_status_changes() inside
+their transaction, so the counters commit together with the order change and
+the dashboard reads them instead of aggregating the orders table.
+rebuild_counters() recomputes everything from Order and ArchivedOrder
+(reconcile_order_counters command); archiving does not change the counters.
+
+Every order write touches the GLOBAL and current HOUR counters, so each
+counter is split across ORDER_COUNTER_SHARDS rows: a transaction adds its
+deltas to one randomly chosen shard with a plain UPDATE (no SELECT ... FOR
+UPDATE) and readers sum the shards. Two writers only wait on each other
+when they pick the same shard. rebuild_counters() folds them back to shard 0.
+"""
+import random
+from datetime import datetime, timezone as dt_timezone
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import ArchivedOrder, Order, OrderStatusCounter
+
+DEFAULT_SHARDS = 8
+
+
+def hour_key(placed_at):
+    """Hour bucket key (UTC, ISO 8601) for a placed_at datetime"""
+    return placed_at.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0).isoformat()
+
+
+def parse_hour_key(key):
+    return datetime.fromisoformat(key)
+
+
+def _order_keys(order):
+    """(scope, key) of every counter an order belongs to"""
+    return [
+        ('GLOBAL', ''),
+        ('ROOM', str(order.room_id or '')),
+        ('HOUR', hour_key(order.placed_at or timezone.now())),
+    ]
+
+
+def counter_shards():
+    return max(1, getattr(settings, 'ORDER_COUNTER_SHARDS', DEFAULT_SHARDS))
+
+
+def apply_status_changes(changes):
+    """
+    Move orders between status counters
+
+    changes is a list of (order, from_status, to_status); from_status is ''
+    for new orders. The deltas go to one random shard: missing shard rows are
+    created and all deltas are applied with a single UPDATE of exactly the
+    touched rows. Must run inside the transaction that changes the orders.
+    """
+    deltas = {}
+    for order, from_status, to_status in changes:
+        for scope, key in _order_keys(order):
+            if from_status:
+                deltas[(scope, key, from_status)] = deltas.get((scope, key, from_status), 0) - 1
+            deltas[(scope, key, to_status)] = deltas.get((scope, key, to_status), 0) + 1
+    deltas = {counter: delta for counter, delta in deltas.items() if delta}
+    if not deltas:
+        return 0
+
+    shard = random.randrange(counter_shards())
+    OrderStatusCounter.objects.bulk_create([
+        OrderStatusCounter(scope=scope, key=key, status=status, shard=shard)
+        for scope, key, status in deltas
+    ], ignore_conflicts=True)
+
+    matches = {counter: Q(scope=counter[0], key=counter[1], status=counter[2]) for counter in deltas}
+    return OrderStatusCounter.objects.filter(reduce(or_, matches.values()), shard=shard).update(
+        count=F('count') + Case(
+            *[When(match, then=Value(deltas[counter])) for counter, match in matches.items()],
+            default=Value(0),
+            output_field=IntegerField()
+        ),
+        updated_at=timezone.now()
+    )
+
+
+def get_counts(scope, keys=None, statuses=None):
+    """
+    Return {key: {status: count}} for a scope (shards summed)
+    """
+    counters = OrderStatusCounter.objects.filter(scope=scope)
+    if keys is not None:
+        counters = counters.filter(key__in=keys)
+    if statuses is not None:
+        counters = counters.filter(status__in=statuses)
+    counts = {}
+    for key, status, count in counters.order_by().values('key', 'status').annotate(
+        total=Sum('count')
+    ).filter(total__gt=0).values_list('key', 'status', 'total'):
+        counts.setdefault(key, {})[status] = count
+    return counts
+
+
+def stored_counts():
+    """{(scope, key, status): count} of the counter rows (shards summed)"""
+    return {
+        (scope, key, status): total
+        for scope, key, status, total in OrderStatusCounter.objects.order_by().values(
+            'scope', 'key', 'status'
+        ).annotate(total=Sum('count')).values_list('scope', 'key', 'status', 'total')
+    }
+
+
+def compute_counts():
+    """
+    Aggregate the orders tables (hot and archived) into {(scope, key, status): count}
+    """
+    counts = {}
+
+    def add(counter, n):
+        counts[counter] = counts.get(counter, 0) + n
+
+    for model in (Order, ArchivedOrder):
+        for row in model.objects.order_by().values('status').annotate(n=Count('id')):
+            add(('GLOBAL', '', row['status']), row['n'])
+        for row in model.objects.order_by().values('room_id', 'status').annotate(n=Count('id')):
+            add(('ROOM', str(row['room_id'] or ''), row['status']), row['n'])
+        by_hour = model.objects.order_by().annotate(
+            hour=TruncHour('placed_at', tzinfo=dt_timezone.utc)
+        ).values('hour', 'status').annotate(n=Count('id'))
+        for row in by_hour:
+            add(('HOUR', hour_key(row['hour']), row['status']), row['n'])
+    return counts
+
+
+def rebuild_counters(dry_run=False):
+    """
+    Recompute all counters from the orders tables (into shard 0)
+
+    Writers are blocked while the counters are rebuilt, so orders created or
+    transitioned concurrently are applied on top of the rebuilt values.
+    Returns a list of (scope, key, status, stored, actual) for counters that
+    were out of sync.
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'LOCK TABLE {OrderStatusCounter._meta.db_table} IN SHARE ROW EXCLUSIVE MODE'
+                )
+        actual = compute_counts()
+        stored = stored_counts()
+        drift = [
+            (scope, key, status, stored.get((scope, key, status), 0), actual.get((scope, key, status), 0))
+            for scope, key, status in sorted(set(actual) | set(stored))
+            if stored.get((scope, key, status), 0) != actual.get((scope, key, status), 0)
+        ]
+        if not dry_run:
+            OrderStatusCounter.objects.all().delete()
+            OrderStatusCounter.objects.bulk_create([
+                OrderStatusCounter(scope=scope, key=key, status=status, count=count)
+                for (scope, key, status), count in actual.items()
+            ], batch_size=1000)
+    return drift
@@ -1,5 +1,5 @@
-from django.db.models import Count, Q, Avg, F, ExpressionWrapper, DurationField
-from django.db.models.functions import TruncHour, TruncDate
+from django.db.models import Count, Avg
+from django.db.models.functions import TruncDate
 from django.utils import timezone
 from datetime import timedelta
 from rest_framework.decorators import api_view, permission_classes
@@ -7,10 +7,11 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from accounts.permissions import IsStaffOrAdmin
 
+from .counters import get_counts, hour_key, parse_hour_key
 from .models import Order, OrderItem
+from .state_machine import ACTIVE_STATUSES
 from clinic.models import Room, Device, PatientAssignment
 from feedbacks.models import Feedback
-from catalog.models import Product
 
 
 @api_view(['GET'])
@@ -24,15 +25,24 @@ def dashboard_stats(request):
     last_24h = now - timedelta(hours=24)
     last_7d = now - timedelta(days=7)
 
-    # Panel 1: Orders in Real Time
-    orders_by_status = Order.objects.values('status').annotate(count=Count('id'))
-    orders_status_dict = {item['status']: item['count'] for item in orders_by_status}
-
-    orders_last_24h = Order.objects.filter(
-        placed_at__gte=last_24h
-    ).annotate(
-        hour=TruncHour('placed_at')
-    ).values('hour').annotate(count=Count('id')).order_by('hour')
+    # Panel 1: Orders in Real Time (precomputed counters, see orders/counters.py)
+    orders_status_dict = get_counts('GLOBAL').get('', {})
+
+    # Orders per hour since last_24h, labelled in the current timezone. The HOUR
+    # counters are whole UTC hours, so the hour last_24h falls in (only partly
+    # inside the window) is counted from the orders table.
+    first_hour = last_24h.replace(minute=0, second=0, microsecond=0)
+    hour_keys = [hour_key(first_hour + timedelta(hours=h)) for h in range(1, 25)]
+    orders_by_hour = get_counts('HOUR', keys=hour_keys)
+    first_hour_count = Order.objects.filter(
+        placed_at__gte=last_24h,
+        placed_at__lt=first_hour + timedelta(hours=1)
+    ).count()
+    orders_last_24h = [{'hour': timezone.localtime(first_hour), 'count': first_hour_count}] if first_hour_count else []
+    orders_last_24h += [
+        {'hour': timezone.localtime(parse_hour_key(key)), 'count': sum(orders_by_hour[key].values())}
+        for key in hour_keys if key in orders_by_hour
+    ]
 
     # Panel 2: Room Occupancy
     active_assignments = PatientAssignment.objects.filter(is_active=True).select_related('room', 'patient')
@@ -50,15 +60,17 @@ def dashboard_stats(request):
             'staff': assignment.staff.full_name if assignment.staff else 'N/A'
         })
 
-    # Add order counts per room
-    orders_by_room = Order.objects.filter(
-        status__in=['PLACED', 'PREPARING', 'READY']
-    ).values('room__code').annotate(count=Count('id'))
+    # Add active order counts per room
+    room_codes = {
+        str(assignment.room_id or ''): assignment.room.code if assignment.room else 'N/A'
+        for assignment in active_assignments
+    }
+    orders_by_room = get_counts('ROOM', keys=list(room_codes), statuses=ACTIVE_STATUSES)
 
-    for item in orders_by_room:
-        room_code = item['room__code'] or 'N/A'
+    for room_key, counts in orders_by_room.items():
+        room_code = room_codes[room_key]
         if room_code in rooms_with_patients:
-            rooms_with_patients[room_code]['order_count'] = item['count']
+            rooms_with_patients[room_code]['order_count'] = sum(counts.values())
 
     # Panel 3: Active Devices
     total_devices = Device.objects.filter(is_active=True).count()
@@ -124,23 +136,15 @@ def dashboard_stats(request):
         total_quantity=Count('id')
     ).order_by('-total_quantity')[:10]
 
-    # Low stock alerts
-    from inventory.models import InventoryBalance
-    low_stock = InventoryBalance.objects.filter(
-        Q(on_hand__lte=F('reorder_level')) | Q(on_hand__lte=10)
-    ).select_related('product').values(
-        'product__name',
-        'on_hand',
-        'reorder_level'
-    )[:5]
+    # Low stock alerts (cached list, rebuilt after a threshold crossing)
+    from inventory.alerts import low_stock_products
+    low_stock = low_stock_products()[:5]
 
     return Response({
         'orders': {
             'by_status': orders_status_dict,
-            'last_24h': list(orders_last_24h),
-            'active_count': Order.objects.filter(
-                status__in=['PLACED', 'PREPARING', 'READY']
-            ).count()
+            'last_24h': orders_last_24h,
+            'active_count': sum(orders_status_dict.get(status, 0) for status in ACTIVE_STATUSES)
         },
         'rooms': {
             'occupied': list(rooms_with_patients.values()),
@@ -167,6 +171,6 @@ def dashboard_stats(request):
         },
         'products': {
             'top_requested': list(top_products),
-            'low_stock': list(low_stock)
+            'low_stock': low_stock
         }
     })
@@ -0,0 +1,93 @@
+"""
+Streaming order export (GET /api/orders/export/)
+
+Orders are flattened to one row per item and read from a server-side cursor
+(.aiterator(chunk_size)) over the hot and the archived tables, then written
+to the response one chunk at a time. Memory use does not depend on how many
+orders the export covers.
+
+The rows and the streamers are async generators: under ASGI (daphne) Django
+serves a synchronous iterator by collecting it into a list first, which
+would build the whole export in memory before sending the first byte.
+aiterator() fetches each chunk through sync_to_async on the request's
+database thread, so the cursor stays on one connection.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+
+from .archive import order_item_sources
+
+DEFAULT_CHUNK_SIZE = 2000
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Column name -> ORM expression on the item row (None means the item field of the same name)
+EXPORT_COLUMNS = {
+    'order_id': None,
+    'status': F('order__status'),
+    'placed_at': F('order__placed_at'),
+    'delivered_at': F('order__delivered_at'),
+    'cancelled_at': F('order__cancelled_at'),
+    'room_code': F('order__room__code'),
+    'device_uid': F('order__assignment__device_uid'),
+    'patient_id': F('order__patient_id'),
+    'patient_name': F('order__patient__full_name'),
+    'patient_assignment': F('order__patient_assignment_id'),
+    'item_id': F('id'),
+    'product_id': None,
+    'product_name': F('product__name'),
+    'category': F('product__category__name'),
+    'quantity': None,
+    'unit_label': None,
+}
+
+
+async def export_rows(filters=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield (asynchronously) one dict per order item (archived orders first, then hot ones),
+    oldest orders first. filters are lookups on the order (e.g. placed_at__gte)
+    """
+    order_filters = {f'order__{lookup}': value for lookup, value in (filters or {}).items()}
+    for model in reversed(order_item_sources()):
+        rows = model.objects.filter(**order_filters).order_by(
+            'order__placed_at', 'order_id', 'id'
+        ).values(
+            *[name for name, expression in EXPORT_COLUMNS.items() if expression is None],
+            **{name: expression for name, expression in EXPORT_COLUMNS.items() if expression is not None}
+        )
+        async for row in rows.aiterator(chunk_size=chunk_size):
+            yield row
+
+
+class _Echo:
+    """File-like object whose write() returns the value (for csv.writer)"""
+
+    def write(self, value):
+        return value
+
+
+def _format_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+async def stream_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(list(EXPORT_COLUMNS))
+    async for row in rows:
+        yield writer.writerow([_format_value(row[column]) for column in EXPORT_COLUMNS])
+
+
+async def stream_ndjson(rows):
+    async for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+STREAMERS = {
+    'csv': stream_csv,
+    'ndjson': stream_ndjson,
+}
@@ -0,0 +1,109 @@
+"""
+Idempotency key store for order creation
+
+Kiosks retry POST /api/public/orders/create on flaky Wi-Fi. When a retry
+carries the same Idempotency-Key header (or client_request_id field) as a
+request that already created an order, the original response is replayed
+instead of taking the order locks again. A key reused with a different cart
+is rejected with 422: each key stores a hash of the normalized items.
+Expired keys are purged by the stale order sweeper.
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import OrderIdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+
+def get_idempotency_key(request, validated_data):
+    """
+    Return the idempotency key sent by the client, if any
+    The header takes precedence over the client_request_id body field
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER) or validated_data.get('client_request_id')
+    return key.strip()[:255] if key and key.strip() else None
+
+
+def request_hash(quantities):
+    """
+    SHA-256 of the aggregated {product_id: quantity} cart
+    Independent of item order and of products repeated across lines
+    """
+    normalized = sorted((int(pid), int(qty)) for pid, qty in quantities.items())
+    return hashlib.sha256(json.dumps(normalized).encode()).hexdigest()
+
+
+def find_key(scope, key):
+    """
+    Return the stored key for scope/key, or None
+    Expired keys are deleted so the key can be used again
+    """
+    stored = OrderIdempotencyKey.objects.filter(scope=scope, key=key).first()
+    if stored and stored.expires_at <= timezone.now():
+        stored.delete()
+        return None
+    return stored
+
+
+def purge_expired_keys():
+    """
+    Delete every expired key; returns the number of keys deleted
+    """
+    deleted, _ = OrderIdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+
+def remember_key(scope, key, order, fingerprint=''):
+    """
+    Claim scope/key for an order (call inside the order transaction)
+    A concurrent request with the same key fails with IntegrityError
+    """
+    ttl = getattr(settings, 'ORDER_IDEMPOTENCY_TTL', DEFAULT_TTL_SECONDS)
+    return OrderIdempotencyKey.objects.create(
+        scope=scope,
+        key=key,
+        request_hash=fingerprint,
+        order=order,
+        expires_at=timezone.now() + timedelta(seconds=ttl)
+    )
+
+
+def store_response(stored, response):
+    """
+    Save the response body once the order transaction has committed
+    """
+    stored.response_status = response.status_code
+    stored.response_body = response.data
+    stored.save(update_fields=['response_status', 'response_body'])
+    return response
+
+
+def replay_response(stored, request=None, fingerprint=None):
+    """
+    Build the response for a replayed request
+    Falls back to re-serializing the order if the body was never stored
+    A key reused with a different cart (fingerprint mismatch) gets a 422
+    """
+    if fingerprint and stored.request_hash and fingerprint != stored.request_hash:
+        return Response({
+            'error': 'Idempotency-Key already used with a different order'
+        }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    body = stored.response_body
+    if body is None:
+        from .serializers import PublicOrderSerializer
+        body = {
+            'success': True,
+            'message': 'Order created successfully',
+            'order': PublicOrderSerializer(stored.order, context={'request': request}).data
+        }
+    response = Response(body, status=stored.response_status or status.HTTP_201_CREATED)
+    response['Idempotent-Replayed'] = 'true'
+    return response
@@ -0,0 +1,122 @@
+"""
+Compiled order-limit policies
+
+PatientAssignment.order_limits caps how many units of each category type
+(DRINK, SNACK, ...) a single kiosk order may contain. Checking a cart only
+needs the category type of each product. The order endpoints already load
+the cart's products with their categories, and those are authoritative. For
+other products the product_id -> category_type map is built once and kept in
+the cache; signals (orders/signals.py) invalidate it when a product or a
+category changes. The default cache is per process, so the map also expires
+after CATEGORY_TYPES_CACHE_TIMEOUT seconds to bound how long another
+process can serve a stale one. A LimitPolicy combines the types with an
+assignment's limits, so a check is a dictionary lookup per cart line.
+
+The kiosk can read the same policy (GET /api/public/orders/limits) together
+with the running consumption of the current patient assignment and reject
+over-limit carts before calling the API.
+"""
+from django.core.cache import cache
+from django.db.models import Sum
+
+from catalog.models import Product
+from common.cache import invalidate_now_and_on_commit
+
+from .models import OrderItem
+
+CATEGORY_TYPES_CACHE_KEY = 'orders:limits:category_types'
+CATEGORY_TYPES_CACHE_TIMEOUT = 300
+NO_LIMIT = 999
+
+CATEGORY_LABELS = {
+    'DRINK': 'bebidas',
+    'SNACK': 'snacks',
+    'OTHER': 'productos',
+}
+
+# Orders of the current assignment that count towards its consumption
+CONSUMING_STATUSES = ['PLACED', 'PREPARING', 'READY', 'DELIVERED']
+
+
+def category_types():
+    """{product_id: category_type} for every product (cached until a product or category changes, or the timeout)"""
+    types = cache.get(CATEGORY_TYPES_CACHE_KEY)
+    if types is None:
+        types = dict(Product.objects.values_list('id', 'category__category_type'))
+        cache.set(CATEGORY_TYPES_CACHE_KEY, types, CATEGORY_TYPES_CACHE_TIMEOUT)
+    return types
+
+
+def invalidate_category_types():
+    invalidate_now_and_on_commit(CATEGORY_TYPES_CACHE_KEY)
+
+
+class LimitViolation:
+    """A category type whose requested quantity exceeds the assignment's limit"""
+
+    def __init__(self, category_type, max_allowed, requested):
+        self.category_type = category_type
+        self.max_allowed = max_allowed
+        self.requested = requested
+
+    @property
+    def message(self):
+        label = CATEGORY_LABELS.get(self.category_type, 'productos')
+        return f'Has alcanzado tu límite de {label}. Máximo permitido: {self.max_allowed}'
+
+
+class LimitPolicy:
+    """
+    Order limits of one patient assignment compiled against the category map
+    """
+
+    def __init__(self, order_limits, types=None):
+        self.limits = dict(order_limits or {})
+        self._types = types
+
+    @property
+    def types(self):
+        """The category map (read from the cache on first use)"""
+        if self._types is None:
+            self._types = category_types()
+        return self._types
+
+    def totals(self, quantities, products=None):
+        """
+        Sum {product_id: quantity} into {category_type: quantity}
+        The category of a loaded product ({product_id: Product} with its
+        category) wins over the map, which may be stale in this process
+        """
+        totals = {}
+        for product_id, quantity in quantities.items():
+            if products and product_id in products:
+                category_type = products[product_id].category.category_type
+            else:
+                category_type = self.types.get(product_id)
+            totals[category_type] = totals.get(category_type, 0) + quantity
+        return totals
+
+    def check(self, quantities, products=None):
+        """First LimitViolation of a cart ({product_id: quantity}), or None"""
+        for category_type, count in self.totals(quantities, products).items():
+            max_allowed = self.limits.get(category_type, NO_LIMIT)
+            if count > max_allowed:
+                return LimitViolation(category_type, max_allowed, count)
+        return None
+
+
+def compile_policy(assignment):
+    return LimitPolicy(assignment.order_limits)
+
+
+def consumption(assignment, policy=None):
+    """
+    Running totals {category_type: quantity} of the assignment's orders
+    (cancelled orders excluded), with one query
+    """
+    policy = policy or compile_policy(assignment)
+    quantities = dict(OrderItem.objects.filter(
+        order__patient_assignment=assignment,
+        order__status__in=CONSUMING_STATUSES
+    ).order_by().values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total'))
+    return policy.totals(quantities)
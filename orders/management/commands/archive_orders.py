@@ -0,0 +1,35 @@
+"""
+Management command to move old delivered/cancelled orders to the archive tables
+Usage:
+    python manage.py archive_orders                 # ORDER_ARCHIVE_AFTER_DAYS
+    python manage.py archive_orders --days 30
+    python manage.py archive_orders --batch-size 200 --max-batches 10
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from orders.archive import archive_cutoff, archive_orders, DEFAULT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Archive delivered and cancelled orders older than the configured age'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Archive orders placed more than N days ago')
+        parser.add_argument(
+            '--batch-size', type=int,
+            default=getattr(settings, 'ORDER_ARCHIVE_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+            help='Orders moved per transaction'
+        )
+        parser.add_argument('--max-batches', type=int, help='Stop after N batches')
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff(options['days'])
+        archived = archive_orders(
+            cutoff=cutoff,
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} orders placed before {cutoff.isoformat()}'
+        ))
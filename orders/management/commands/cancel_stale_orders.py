@@ -0,0 +1,35 @@
+"""
+Management command to cancel orders stuck in PLACED/PREPARING and release their stock
+Expired idempotency keys are deleted on the same run
+Usage:
+    python manage.py cancel_stale_orders                  # ORDER_STALE_AFTER_MINUTES
+    python manage.py cancel_stale_orders --minutes 240 --batch-size 100
+    python manage.py cancel_stale_orders --dry-run
+"""
+from django.core.management.base import BaseCommand
+
+from orders.idempotency import purge_expired_keys
+from orders.models import Order
+from orders.sweeper import DEFAULT_BATCH_SIZE, STALE_STATUSES, stale_cutoff, sweep_stale_orders
+
+
+class Command(BaseCommand):
+    help = 'Cancel stale open orders in batches and release their reserved stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=int, help='Cancel orders not updated for N minutes')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Orders cancelled per transaction')
+        parser.add_argument('--max-batches', type=int, help='Stop after N batches')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the stale orders')
+
+    def handle(self, *args, **options):
+        cutoff = stale_cutoff(options['minutes'])
+
+        if options['dry_run']:
+            count = Order.objects.filter(status__in=STALE_STATUSES, updated_at__lt=cutoff).count()
+            self.stdout.write(f'{count} stale orders (not updated since {cutoff.isoformat()})')
+            return
+
+        purged = purge_expired_keys()
+        cancelled = sweep_stale_orders(cutoff, batch_size=options['batch_size'], max_batches=options['max_batches'])
+        self.stdout.write(self.style.SUCCESS(f'Cancelled {cancelled} stale orders, purged {purged} expired idempotency keys'))
@@ -0,0 +1,55 @@
+"""
+Management command to publish pending outbox events to the channel layer
+Usage:
+    python manage.py dispatch_outbox              # one pass
+    python manage.py dispatch_outbox --loop       # run continuously
+    python manage.py dispatch_outbox --purge-days 7
+
+--loop also purges old events (ORDER_OUTBOX_RETENTION_DAYS) once an hour.
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from orders.outbox import dispatch_pending, purge_events, DEFAULT_BATCH_SIZE, PURGE_INTERVAL_SECONDS
+
+
+class Command(BaseCommand):
+    help = 'Publish pending order broadcasts from the outbox (with retries)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new events')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls in --loop mode')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Events published per batch')
+        parser.add_argument(
+            '--purge-days', type=int,
+            help='Delete events dispatched (or given up) more than N days ago and exit'
+        )
+
+    def handle(self, *args, **options):
+        if options['purge_days'] is not None:
+            deleted = purge_events(timezone.now() - timedelta(days=options['purge_days']))
+            self.stdout.write(self.style.SUCCESS(f'Purged {deleted} events'))
+            return
+
+        total = 0
+        purged_at = None
+        while True:
+            close_old_connections()
+            if options['loop'] and (purged_at is None or time.monotonic() - purged_at > PURGE_INTERVAL_SECONDS):
+                purge_events()
+                purged_at = time.monotonic()
+            published = dispatch_pending(batch_size=options['batch_size'])
+            total += published
+
+            if not options['loop']:
+                if published == options['batch_size']:
+                    continue  # Drain the backlog before exiting
+                break
+            if not published:
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Published {total} events'))
@@ -0,0 +1,26 @@
+"""
+Management command to rebuild the order status counters from the orders table
+Usage:
+    python manage.py reconcile_order_counters            # rebuild
+    python manage.py reconcile_order_counters --dry-run  # only report drift
+"""
+from django.core.management.base import BaseCommand
+
+from orders.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the dashboard order status counters from Order'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drifted counters without writing')
+
+    def handle(self, *args, **options):
+        drift = rebuild_counters(dry_run=options['dry_run'])
+        for scope, key, status, stored, actual in drift:
+            self.stdout.write(f'{scope}:{key or "-"} {status}: stored={stored} actual={actual}')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{len(drift)} counters out of sync (dry run, nothing written)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Counters rebuilt ({len(drift)} were out of sync)'))
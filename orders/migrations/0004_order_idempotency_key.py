@@ -0,0 +1,33 @@
+# Generated by Django 5.2.3 on 2026-10-17 10:42
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_alter_order_status_order_idx_order_status_placed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderIdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(help_text='Namespace of the key (e.g., the device UID that sent it)', max_length=255, verbose_name='scope')),
+                ('key', models.CharField(help_text='Idempotency-Key header or client_request_id sent by the client', max_length=255, verbose_name='key')),
+                ('response_status', models.PositiveSmallIntegerField(default=201, help_text='HTTP status of the original response', verbose_name='response status')),
+                ('response_body', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='Original response body (filled in after commit)', null=True, verbose_name='response body')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True, help_text='When this key can no longer be replayed', verbose_name='expires at')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='idempotency_keys', to='orders.order', verbose_name='order')),
+            ],
+            options={
+                'verbose_name': 'order idempotency key',
+                'verbose_name_plural': 'order idempotency keys',
+                'constraints': [models.UniqueConstraint(fields=('scope', 'key'), name='uniq_order_idempotency_key')],
+            },
+        ),
+    ]
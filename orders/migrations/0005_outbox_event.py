@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-17 10:43
+
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_order_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group', models.CharField(help_text='Channel layer group (e.g., staff_orders, device_12)', max_length=100, verbose_name='group')),
+                ('payload', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='Message sent with group_send (includes the handler "type")', verbose_name='payload')),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Number of failed publish attempts', verbose_name='attempts')),
+                ('last_error', models.TextField(blank=True, help_text='Error from the last failed publish attempt', verbose_name='last error')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Earliest time the dispatcher will (re)try this event', verbose_name='next attempt at')),
+                ('dispatched_at', models.DateTimeField(blank=True, help_text='When the event was published to the channel layer', null=True, verbose_name='dispatched at')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'outbox event',
+                'verbose_name_plural': 'outbox events',
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('dispatched_at__isnull', True)), fields=['next_attempt_at'], name='idx_outbox_pending')],
+            },
+        ),
+    ]
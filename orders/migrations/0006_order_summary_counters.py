@@ -0,0 +1,47 @@
+# Generated by Django 5.2.3 on 2026-10-17 10:51
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    PatientAssignment = apps.get_model('clinic', 'PatientAssignment')
+
+    items = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+    Order.objects.update(
+        item_count=Coalesce(Subquery(items.annotate(n=Count('id')).values('n')), 0),
+        total_quantity=Coalesce(Subquery(items.annotate(n=Sum('quantity')).values('n')), 0)
+    )
+
+    active = Order.objects.filter(
+        patient_assignment=OuterRef('pk'),
+        status__in=['PLACED', 'PREPARING', 'READY']
+    ).order_by().values('patient_assignment')
+    PatientAssignment.objects.update(
+        active_order_count=Coalesce(Subquery(active.annotate(n=Count('id')).values('n')), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clinic', '0009_patientassignment_active_order_count'),
+        ('orders', '0005_outbox_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of order lines (maintained on write)', verbose_name='item count'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_quantity',
+            field=models.PositiveIntegerField(default=0, help_text='Sum of item quantities (maintained on write)', verbose_name='total quantity'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.3 on 2026-10-17 10:55
+
+from datetime import timezone as dt_timezone
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+
+
+def backfill_counters(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderStatusCounter = apps.get_model('orders', 'OrderStatusCounter')
+
+    counters = []
+    for row in Order.objects.order_by().values('status').annotate(n=Count('id')):
+        counters.append(OrderStatusCounter(scope='GLOBAL', key='', status=row['status'], count=row['n']))
+    for row in Order.objects.order_by().values('room_id', 'status').annotate(n=Count('id')):
+        counters.append(OrderStatusCounter(
+            scope='ROOM', key=str(row['room_id'] or ''), status=row['status'], count=row['n']
+        ))
+    by_hour = Order.objects.order_by().annotate(
+        hour=TruncHour('placed_at', tzinfo=dt_timezone.utc)
+    ).values('hour', 'status').annotate(n=Count('id'))
+    for row in by_hour:
+        counters.append(OrderStatusCounter(
+            scope='HOUR', key=row['hour'].isoformat(), status=row['status'], count=row['n']
+        ))
+    OrderStatusCounter.objects.bulk_create(counters, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_order_summary_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStatusCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('GLOBAL', 'Global'), ('ROOM', 'Room'), ('HOUR', 'Hour')], max_length=10, verbose_name='scope')),
+                ('key', models.CharField(blank=True, help_text='Room id or hour bucket, depending on the scope', max_length=40, verbose_name='key')),
+                ('status', models.CharField(choices=[('PLACED', 'Placed'), ('PREPARING', 'Preparing'), ('READY', 'Ready'), ('DELIVERED', 'Delivered'), ('CANCELLED', 'Cancelled')], max_length=20, verbose_name='status')),
+                ('count', models.IntegerField(default=0, verbose_name='count')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'order status counter',
+                'verbose_name_plural': 'order status counters',
+                'constraints': [models.UniqueConstraint(fields=('scope', 'key', 'status'), name='uniq_order_status_counter')],
+            },
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.3 on 2026-10-17 10:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_alter_product_is_active_alter_product_name_and_more'),
+        ('clinic', '0009_patientassignment_active_order_count'),
+        ('orders', '0007_order_status_counter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('PLACED', 'Placed'), ('PREPARING', 'Preparing'), ('READY', 'Ready'), ('DELIVERED', 'Delivered'), ('CANCELLED', 'Cancelled')], max_length=20, verbose_name='status')),
+                ('placed_at', models.DateTimeField(db_index=True, verbose_name='placed at')),
+                ('delivered_at', models.DateTimeField(blank=True, null=True, verbose_name='delivered at')),
+                ('cancelled_at', models.DateTimeField(blank=True, null=True, verbose_name='cancelled at')),
+                ('item_count', models.PositiveIntegerField(default=0, verbose_name='item count')),
+                ('total_quantity', models.PositiveIntegerField(default=0, verbose_name='total quantity')),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('assignment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='clinic.device', verbose_name='device assignment')),
+                ('patient', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_orders', to='clinic.patient', verbose_name='patient')),
+                ('patient_assignment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_orders', to='clinic.patientassignment', verbose_name='patient assignment')),
+                ('room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='clinic.room', verbose_name='room')),
+            ],
+            options={
+                'verbose_name': 'archived order',
+                'verbose_name_plural': 'archived orders',
+                'ordering': ['-placed_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.IntegerField(verbose_name='quantity')),
+                ('unit_label', models.CharField(max_length=50, verbose_name='unit label')),
+                ('created_at', models.DateTimeField()),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='orders.archivedorder', verbose_name='order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='catalog.product', verbose_name='product')),
+            ],
+            options={
+                'verbose_name': 'archived order item',
+                'verbose_name_plural': 'archived order items',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderStatusEvent',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('from_status', models.CharField(blank=True, max_length=20, verbose_name='from status')),
+                ('to_status', models.CharField(max_length=20, verbose_name='to status')),
+                ('changed_at', models.DateTimeField(verbose_name='changed at')),
+                ('note', models.TextField(blank=True, verbose_name='note')),
+                ('changed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='changed by')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_events', to='orders.archivedorder', verbose_name='order')),
+            ],
+            options={
+                'verbose_name': 'archived order status event',
+                'verbose_name_plural': 'archived order status events',
+                'ordering': ['-changed_at'],
+            },
+        ),
+    ]
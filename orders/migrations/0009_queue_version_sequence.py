@@ -0,0 +1,26 @@
+from django.db import migrations
+
+VERSION_SEQUENCE = 'orders_queue_version_seq'
+
+
+def create_sequence(apps, schema_editor):
+    # Version counter of the staff order queue events (orders/queue.py);
+    # other databases run without queue versions
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'CREATE SEQUENCE IF NOT EXISTS {VERSION_SEQUENCE}')
+
+
+def drop_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP SEQUENCE IF EXISTS {VERSION_SEQUENCE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_archived_orders'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_sequence, drop_sequence),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.3 on 2026-10-17 12:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_queue_version_sequence'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='orderstatuscounter',
+            name='uniq_order_status_counter',
+        ),
+        migrations.AddField(
+            model_name='orderstatuscounter',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='shard'),
+        ),
+        migrations.AddConstraint(
+            model_name='orderstatuscounter',
+            constraint=models.UniqueConstraint(fields=('scope', 'key', 'status', 'shard'), name='uniq_order_status_counter_shard'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 12:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_order_status_counter_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderidempotencykey',
+            name='request_hash',
+            field=models.CharField(blank=True, help_text='SHA-256 of the normalized order items sent with the key', max_length=64, verbose_name='request hash'),
+        ),
+    ]
@@ -2,6 +2,8 @@ from django.db import models
 from django.core.validators import MinValueValidator
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
+from django.utils import timezone
+from django.core.serializers.json import DjangoJSONEncoder
 
 
 class Order(models.Model):
@@ -75,6 +77,16 @@ class Order(models.Model):
         null=True,
         help_text=_('When the order was cancelled')
     )
+    item_count = models.PositiveIntegerField(
+        _('item count'),
+        default=0,
+        help_text=_('Number of order lines (maintained on write)')
+    )
+    total_quantity = models.PositiveIntegerField(
+        _('total quantity'),
+        default=0,
+        help_text=_('Sum of item quantities (maintained on write)')
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -174,3 +186,295 @@ class OrderStatusEvent(models.Model):
 
     def __str__(self):
         return f'Order #{self.order.id}: {self.from_status or "NEW"} → {self.to_status}'
+
+
+class OrderIdempotencyKey(models.Model):
+    """
+    Result of an order creation request keyed by a client-supplied idempotency key
+    Lets retried kiosk requests replay the original response instead of
+    creating a duplicate order
+    """
+    scope = models.CharField(
+        _('scope'),
+        max_length=255,
+        help_text=_('Namespace of the key (e.g., the device UID that sent it)')
+    )
+    key = models.CharField(
+        _('key'),
+        max_length=255,
+        help_text=_('Idempotency-Key header or client_request_id sent by the client')
+    )
+    request_hash = models.CharField(
+        _('request hash'),
+        max_length=64,
+        blank=True,
+        help_text=_('SHA-256 of the normalized order items sent with the key')
+    )
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.CASCADE,
+        related_name='idempotency_keys',
+        verbose_name=_('order')
+    )
+    response_status = models.PositiveSmallIntegerField(
+        _('response status'),
+        default=201,
+        help_text=_('HTTP status of the original response')
+    )
+    response_body = models.JSONField(
+        _('response body'),
+        blank=True,
+        null=True,
+        encoder=DjangoJSONEncoder,
+        help_text=_('Original response body (filled in after commit)')
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(
+        _('expires at'),
+        db_index=True,
+        help_text=_('When this key can no longer be replayed')
+    )
+
+    class Meta:
+        verbose_name = _('order idempotency key')
+        verbose_name_plural = _('order idempotency keys')
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='uniq_order_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f'{self.scope}:{self.key} -> Order #{self.order_id}'
+
+
+class OutboxEvent(models.Model):
+    """
+    Channel-layer broadcast recorded in the same transaction as the change
+    that produced it, and published by the outbox dispatcher after commit
+    """
+    group = models.CharField(
+        _('group'),
+        max_length=100,
+        help_text=_('Channel layer group (e.g., staff_orders, device_12)')
+    )
+    payload = models.JSONField(
+        _('payload'),
+        encoder=DjangoJSONEncoder,
+        help_text=_('Message sent with group_send (includes the handler "type")')
+    )
+    attempts = models.PositiveIntegerField(
+        _('attempts'),
+        default=0,
+        help_text=_('Number of failed publish attempts')
+    )
+    last_error = models.TextField(
+        _('last error'),
+        blank=True,
+        help_text=_('Error from the last failed publish attempt')
+    )
+    next_attempt_at = models.DateTimeField(
+        _('next attempt at'),
+        default=timezone.now,
+        help_text=_('Earliest time the dispatcher will (re)try this event')
+    )
+    dispatched_at = models.DateTimeField(
+        _('dispatched at'),
+        blank=True,
+        null=True,
+        help_text=_('When the event was published to the channel layer')
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('outbox event')
+        verbose_name_plural = _('outbox events')
+        ordering = ['id']
+        indexes = [
+            models.Index(
+                fields=['next_attempt_at'],
+                name='idx_outbox_pending',
+                condition=models.Q(dispatched_at__isnull=True)
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.payload.get("type")} -> {self.group} (#{self.id})'
+
+
+class OrderStatusCounter(models.Model):
+    """
+    Number of orders per status, maintained incrementally by the order
+    create and transition paths so dashboards read counts in constant time
+
+    Scopes:
+    - GLOBAL: key is ''
+    - ROOM: key is the room id ('' for orders without a room)
+    - HOUR: key is the UTC hour the order was placed (ISO 8601)
+
+    Each counter is split across ORDER_COUNTER_SHARDS rows (shard) that are
+    summed on read, so concurrent writers rarely update the same row
+    """
+    SCOPE_CHOICES = [
+        ('GLOBAL', _('Global')),
+        ('ROOM', _('Room')),
+        ('HOUR', _('Hour')),
+    ]
+
+    scope = models.CharField(
+        _('scope'),
+        max_length=10,
+        choices=SCOPE_CHOICES
+    )
+    key = models.CharField(
+        _('key'),
+        max_length=40,
+        blank=True,
+        help_text=_('Room id or hour bucket, depending on the scope')
+    )
+    status = models.CharField(
+        _('status'),
+        max_length=20,
+        choices=Order.STATUS_CHOICES
+    )
+    shard = models.PositiveSmallIntegerField(
+        _('shard'),
+        default=0
+    )
+    count = models.IntegerField(
+        _('count'),
+        default=0
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('order status counter')
+        verbose_name_plural = _('order status counters')
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key', 'status', 'shard'], name='uniq_order_status_counter_shard'),
+        ]
+
+    def __str__(self):
+        return f'{self.scope}:{self.key} {self.status}[{self.shard}] = {self.count}'
+
+
+class ArchivedOrder(models.Model):
+    """
+    Delivered/cancelled order moved out of the hot orders table by the
+    archiver (orders/archive.py). Keeps the original order id.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    assignment = models.ForeignKey(
+        'clinic.Device',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='+',
+        verbose_name=_('device assignment')
+    )
+    patient_assignment = models.ForeignKey(
+        'clinic.PatientAssignment',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='archived_orders',
+        verbose_name=_('patient assignment')
+    )
+    room = models.ForeignKey(
+        'clinic.Room',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='+',
+        verbose_name=_('room')
+    )
+    patient = models.ForeignKey(
+        'clinic.Patient',
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='archived_orders',
+        verbose_name=_('patient')
+    )
+    status = models.CharField(
+        _('status'),
+        max_length=20,
+        choices=Order.STATUS_CHOICES
+    )
+    placed_at = models.DateTimeField(_('placed at'), db_index=True)
+    delivered_at = models.DateTimeField(_('delivered at'), blank=True, null=True)
+    cancelled_at = models.DateTimeField(_('cancelled at'), blank=True, null=True)
+    item_count = models.PositiveIntegerField(_('item count'), default=0)
+    total_quantity = models.PositiveIntegerField(_('total quantity'), default=0)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('archived order')
+        verbose_name_plural = _('archived orders')
+        ordering = ['-placed_at']
+
+    def __str__(self):
+        return f'Archived order #{self.id} - {self.get_status_display()}'
+
+
+class ArchivedOrderItem(models.Model):
+    """
+    Item of an archived order (keeps the original item id)
+    """
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(
+        ArchivedOrder,
+        on_delete=models.CASCADE,
+        related_name='items',
+        verbose_name=_('order')
+    )
+    product = models.ForeignKey(
+        'catalog.Product',
+        on_delete=models.PROTECT,
+        related_name='+',
+        verbose_name=_('product')
+    )
+    quantity = models.IntegerField(_('quantity'))
+    unit_label = models.CharField(_('unit label'), max_length=50)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = _('archived order item')
+        verbose_name_plural = _('archived order items')
+        ordering = ['id']
+
+    def __str__(self):
+        return f'{self.product.name} x{self.quantity} ({self.unit_label})'
+
+
+class ArchivedOrderStatusEvent(models.Model):
+    """
+    Status change of an archived order (keeps the original event id)
+    """
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(
+        ArchivedOrder,
+        on_delete=models.CASCADE,
+        related_name='status_events',
+        verbose_name=_('order')
+    )
+    from_status = models.CharField(_('from status'), max_length=20, blank=True)
+    to_status = models.CharField(_('to status'), max_length=20)
+    changed_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='+',
+        verbose_name=_('changed by')
+    )
+    changed_at = models.DateTimeField(_('changed at'))
+    note = models.TextField(_('note'), blank=True)
+
+    class Meta:
+        verbose_name = _('archived order status event')
+        verbose_name_plural = _('archived order status events')
+        ordering = ['-changed_at']
+
+    def __str__(self):
+        return f'Archived order #{self.order_id}: {self.from_status or "NEW"} → {self.to_status}'
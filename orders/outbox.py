@@ -0,0 +1,208 @@
+"""
+Transactional outbox for channel-layer broadcasts
+
+Views call enqueue_broadcast() inside their transaction instead of calling
+group_send directly. The event row commits (or rolls back) together with the
+order change, and is published after commit by dispatch_pending(), so Redis
+latency never extends the time row locks are held and a rolled-back order
+never announces itself.
+
+Events are published in three ways:
+- right after commit, for the events of that transaction (one on_commit
+  hook per transaction, however many events it enqueued)
+- by the asyncio dispatcher task (ORDER_OUTBOX_DISPATCHER = 'asgi')
+- by `python manage.py dispatch_outbox --loop`
+The last two retry events that failed with exponential backoff, and purge
+events older than ORDER_OUTBOX_RETENTION_DAYS (published, or given up after
+ORDER_OUTBOX_MAX_ATTEMPTS) once an hour.
+
+A dispatcher first claims its batch in a short transaction (FOR UPDATE SKIP
+LOCKED, then next_attempt_at moves CLAIM_LEASE_SECONDS ahead) and only calls
+the channel layer after that transaction has committed, so no database
+transaction or row lock is held while Redis is slow. An event claimed by a
+process that dies before publishing is retried when its lease expires.
+"""
+import asyncio
+import logging
+import time
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_ATTEMPTS = 10
+DEFAULT_RETENTION_DAYS = 7
+MAX_BACKOFF_SECONDS = 300
+CLAIM_LEASE_SECONDS = 60
+PURGE_INTERVAL_SECONDS = 3600
+
+_dispatcher_task = None
+
+
+class _DispatchOnCommit:
+    """on_commit hook publishing the events enqueued by one transaction"""
+
+    def __init__(self):
+        self.event_ids = []
+
+    def __call__(self):
+        dispatch_pending(event_ids=self.event_ids)
+
+
+def _commit_dispatch():
+    """
+    The dispatch hook of the current transaction (at the current savepoint
+    level), registered on first use; a hook dropped by a rolled-back
+    savepoint is no longer in run_on_commit
+    """
+    savepoint_ids = set(connection.savepoint_ids)
+    for sids, callback, _ in reversed(connection.run_on_commit):
+        if isinstance(callback, _DispatchOnCommit) and sids == savepoint_ids:
+            return callback
+    callback = _DispatchOnCommit()
+    transaction.on_commit(callback)
+    return callback
+
+
+def enqueue_broadcast(group, message):
+    """
+    Record a group_send for publishing after the current transaction commits
+    """
+    event = OutboxEvent.objects.create(group=group, payload=message)
+    if connection.in_atomic_block:
+        _commit_dispatch().event_ids.append(event.id)
+    else:
+        dispatch_pending(event_ids=[event.id])
+    return event
+
+
+def _backoff(attempts):
+    """Seconds to wait before retrying an event that failed `attempts` times"""
+    return min(2 ** attempts, MAX_BACKOFF_SECONDS)
+
+
+def _max_attempts():
+    return getattr(settings, 'ORDER_OUTBOX_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+
+
+def claim_pending(event_ids=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Claim a batch of due events (committed before returning): their
+    next_attempt_at moves CLAIM_LEASE_SECONDS ahead so other dispatchers
+    skip them while they are being published
+    """
+    with transaction.atomic():
+        now = timezone.now()
+        pending = OutboxEvent.objects.select_for_update(skip_locked=True).filter(
+            dispatched_at__isnull=True,
+            attempts__lt=_max_attempts(),
+            next_attempt_at__lte=now
+        )
+        if event_ids is not None:
+            pending = pending.filter(id__in=event_ids)
+        events = list(pending.order_by('id')[:batch_size])
+        if events:
+            OutboxEvent.objects.filter(id__in=[event.id for event in events]).update(
+                next_attempt_at=now + timedelta(seconds=CLAIM_LEASE_SECONDS)
+            )
+    return events
+
+
+def dispatch_pending(event_ids=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Publish a batch of pending outbox events to the channel layer
+    Returns the number of events published
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return 0
+
+    try:
+        events = claim_pending(event_ids, batch_size)
+        published = []
+        for event in events:
+            try:
+                async_to_sync(channel_layer.group_send)(event.group, event.payload)
+                published.append(event.id)
+            except Exception as exc:
+                logger.warning('Outbox event %s publish failed: %s', event.id, exc)
+                OutboxEvent.objects.filter(id=event.id).update(
+                    attempts=F('attempts') + 1,
+                    last_error=str(exc)[:1000],
+                    next_attempt_at=timezone.now() + timedelta(seconds=_backoff(event.attempts + 1))
+                )
+
+        if published:
+            OutboxEvent.objects.filter(id__in=published).update(dispatched_at=timezone.now())
+        return len(published)
+    except Exception:
+        # Never let a broadcast failure surface in the request that committed it
+        logger.error('Outbox dispatch failed', exc_info=True)
+        return 0
+
+
+def purge_events(older_than=None):
+    """
+    Delete events dispatched before `older_than` (a datetime, default
+    ORDER_OUTBOX_RETENTION_DAYS ago) and events that reached the maximum
+    number of attempts and were created before it
+    """
+    if older_than is None:
+        days = getattr(settings, 'ORDER_OUTBOX_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+        older_than = timezone.now() - timedelta(days=days)
+    deleted, _ = OutboxEvent.objects.filter(
+        Q(dispatched_at__isnull=False, dispatched_at__lt=older_than)
+        | Q(dispatched_at__isnull=True, attempts__gte=_max_attempts(), created_at__lt=older_than)
+    ).delete()
+    return deleted
+
+
+def _dispatch_batch():
+    close_old_connections()
+    return dispatch_pending()
+
+
+def _purge():
+    close_old_connections()
+    return purge_events()
+
+
+async def run_dispatcher(interval=1.0):
+    """
+    Poll and publish pending events forever (asyncio task)
+    """
+    purged_at = None
+    while True:
+        try:
+            published = await sync_to_async(_dispatch_batch, thread_sensitive=False)()
+            if purged_at is None or time.monotonic() - purged_at > PURGE_INTERVAL_SECONDS:
+                await sync_to_async(_purge, thread_sensitive=False)()
+                purged_at = time.monotonic()
+        except Exception:
+            logger.error('Outbox dispatcher iteration failed', exc_info=True)
+            published = 0
+        # Drain quickly while there is a backlog, otherwise wait for the next poll
+        if not published:
+            await asyncio.sleep(interval)
+
+
+def start_dispatcher(interval=None):
+    """
+    Start the dispatcher task on the running event loop (once per process)
+    """
+    global _dispatcher_task
+    if _dispatcher_task is not None and not _dispatcher_task.done():
+        return _dispatcher_task
+    if interval is None:
+        interval = getattr(settings, 'ORDER_OUTBOX_POLL_INTERVAL', 1.0)
+    _dispatcher_task = asyncio.get_running_loop().create_task(run_dispatcher(interval))
+    return _dispatcher_task
@@ -0,0 +1,16 @@
+from rest_framework.pagination import CursorPagination
+
+
+class OrderCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the staff order list and queue
+
+    Pages are keyed on (placed_at, id) newest first, so every page is an
+    index range scan (idx_order_status_placed) with no COUNT(*) and no
+    OFFSET, and cursors stay stable while new orders come in.
+    GET /api/orders/queue/?cursor=<next cursor>&page_size=50
+    """
+    ordering = ('-placed_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
@@ -0,0 +1,144 @@
+"""
+Prep-station summary (GET /api/orders/prep-summary/)
+
+The kitchen prepares by product ("12 coffees, 7 juices"), not by order. The
+summary adds up the items of the orders still to be prepared (PLACED and
+PREPARING) per product and per room with a single GROUP BY over OrderItem.
+
+Staff tablets keep it current without polling: order creation and status
+changes that move orders into or out of those statuses attach a prep_delta
+(signed quantities per product and per room) to the staff_orders event they
+already send, and StaffOrderConsumer forwards it as a prep_summary_delta
+message. A delta for a product or room the client does not know yet (no name)
+is the cue to reload the summary.
+"""
+from django.db.models import Count, Sum
+
+from .models import OrderItem
+
+PREP_STATUSES = ('PLACED', 'PREPARING')
+
+
+def prep_summary(statuses=PREP_STATUSES, room_id=None):
+    """
+    Open quantities of the orders in `statuses`, per product and per room
+    One query grouped by room, product and status, folded in Python
+    """
+    items = OrderItem.objects.filter(order__status__in=statuses)
+    if room_id is not None:
+        items = items.filter(order__room_id=room_id)
+    rows = items.order_by().values(
+        'order__room_id', 'order__room__code', 'order__status',
+        'product_id', 'product__name', 'product__category__name', 'unit_label'
+    ).annotate(quantity=Sum('quantity'), orders=Count('order_id', distinct=True))
+
+    products = {}
+    rooms = {}
+    for row in rows:
+        product = products.setdefault(row['product_id'], {
+            'product_id': row['product_id'],
+            'product_name': row['product__name'],
+            'category': row['product__category__name'],
+            'unit_label': row['unit_label'],
+            'quantity': 0,
+            'orders': 0,
+            'by_status': {},
+        })
+        # An order has one status and one room, so distinct counts of the groups add up
+        product['quantity'] += row['quantity']
+        product['orders'] += row['orders']
+        product['by_status'][row['order__status']] = product['by_status'].get(row['order__status'], 0) + row['quantity']
+
+        room = rooms.setdefault(row['order__room_id'], {
+            'room_id': row['order__room_id'],
+            'room_code': row['order__room__code'],
+            'quantity': 0,
+            'products': {},
+        })
+        room['quantity'] += row['quantity']
+        room_product = room['products'].setdefault(row['product_id'], {
+            'product_id': row['product_id'],
+            'product_name': row['product__name'],
+            'quantity': 0,
+        })
+        room_product['quantity'] += row['quantity']
+
+    return {
+        'statuses': list(statuses),
+        'total_quantity': sum(product['quantity'] for product in products.values()),
+        'products': sorted(products.values(), key=lambda p: (-p['quantity'], p['product_name'])),
+        'rooms': [
+            dict(room, products=sorted(room['products'].values(), key=lambda p: (-p['quantity'], p['product_name'])))
+            for room in sorted(rooms.values(), key=lambda r: (r['room_code'] is None, r['room_code'] or ''))
+        ],
+    }
+
+
+def prep_sign(from_status, to_status):
+    """+1 when a transition enters the prep statuses, -1 when it leaves them, 0 otherwise"""
+    return (to_status in PREP_STATUSES) - (from_status in PREP_STATUSES)
+
+
+def prep_delta(orders_with_sign, items):
+    """
+    Signed changes to the prep summary ({'products': [...], 'rooms': [...]}),
+    or None when nothing changes
+
+    orders_with_sign is {order_id: (order, sign)} and items the
+    (order_id, product_id, quantity) rows of those orders (other rows are ignored)
+    """
+    products = {}
+    rooms = {}
+    for order_id, product_id, quantity in items:
+        if order_id not in orders_with_sign:
+            continue
+        order, sign = orders_with_sign[order_id]
+        product = products.setdefault(product_id, {'quantity': 0, 'orders': set()})
+        product['quantity'] += sign * quantity
+        product['orders'].add((order_id, sign))
+        key = (order.room_id, product_id)
+        rooms[key] = rooms.get(key, 0) + sign * quantity
+
+    if not products:
+        return None
+    return {
+        'products': [
+            {
+                'product_id': product_id,
+                'quantity': product['quantity'],
+                'orders': sum(sign for _, sign in product['orders']),
+            }
+            for product_id, product in sorted(products.items())
+        ],
+        'rooms': [
+            {'room_id': room_id, 'product_id': product_id, 'quantity': quantity}
+            for (room_id, product_id), quantity in sorted(rooms.items(), key=lambda r: (r[0][0] or 0, r[0][1]))
+        ],
+    }
+
+
+def transition_prep_delta(changes, contexts=()):
+    """
+    prep_delta of a batch of transitions ([(order, from_status, to_status)])
+    Reuses the items the transition hooks already loaded (contexts) and
+    queries the items of the other orders that enter or leave prep
+    """
+    orders_with_sign = {}
+    for order, from_status, to_status in changes:
+        sign = prep_sign(from_status, to_status)
+        if sign:
+            orders_with_sign[order.id] = (order, sign)
+    if not orders_with_sign:
+        return None
+
+    items = []
+    missing = set(orders_with_sign)
+    for context in contexts:
+        if context.items_loaded and missing.intersection(context.order_ids):
+            items.extend(context.items)
+            missing.difference_update(context.order_ids)
+    if missing:
+        items.extend(OrderItem.objects.filter(order_id__in=sorted(missing)).values_list(
+            'order_id', 'product_id', 'quantity'
+        ))
+    return prep_delta(orders_with_sign, items)
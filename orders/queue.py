@@ -0,0 +1,278 @@
+"""
+In-process read model of the open order queue
+
+Staff tablets poll GET /api/orders/queue. Inside the ASGI process the open
+orders (PLACED, PREPARING, READY) are kept in memory, indexed by status, room
+and device assignment, so the queue endpoint is served without order queries.
+
+The read model is hydrated from the database once when the process starts
+(ORDER_QUEUE_READ_MODEL) and kept current by the staff_orders events that
+also drive StaffOrderConsumer (new_order, order_updated, orders_updated).
+Every one of those events carries a queue_version taken from a database
+sequence. A version that stays missing for longer than
+ORDER_QUEUE_RESYNC_GRACE seconds (lost broadcast, rolled-back transaction)
+makes the read model reload itself from the database.
+
+Sequence values are not transactional: a transaction that allocates a
+version and then rolls back (an order rejected after its event was queued,
+a deadlock retried by @transactional_retry) leaves a gap that no event will
+ever fill. Each such gap costs one full reload of the open orders (one query
+per table over PLACED/PREPARING/READY, a few hundred rows) after the grace
+period; the queue keeps being served from memory meanwhile. Gaps are
+tolerated this way rather than avoided, since allocating the version after
+commit would lose the ordering with the transaction's own writes.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from .models import Order
+from .outbox import enqueue_broadcast
+from .serializers import OrderSerializer, OrderSummarySerializer
+
+logger = logging.getLogger(__name__)
+
+STAFF_GROUP = 'staff_orders'
+QUEUE_STATUSES = ('PLACED', 'PREPARING', 'READY')
+VERSION_SEQUENCE = 'orders_queue_version_seq'
+DEFAULT_RESYNC_GRACE = 5.0
+GROUP_REFRESH_SECONDS = 600
+
+_read_model = None
+_read_model_task = None
+
+
+def next_queue_version():
+    """Allocate the next queue version (None when the database has no sequences)"""
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT nextval(%s)', [VERSION_SEQUENCE])
+        return cursor.fetchone()[0]
+
+
+def current_queue_version():
+    """Last allocated queue version"""
+    if connection.vendor != 'postgresql':
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT last_value, is_called FROM {VERSION_SEQUENCE}')
+        last_value, is_called = cursor.fetchone()
+        return last_value if is_called else 0
+
+
+def broadcast_queue_event(message):
+    """
+    Send an order event to the staff_orders group (published after commit)
+    tagged with the next queue version
+    """
+    return enqueue_broadcast(STAFF_GROUP, dict(message, queue_version=next_queue_version()))
+
+
+def _summary_row(order):
+    """Summary representation of an order (same fields as the ?view=summary rows)"""
+    return OrderSummarySerializer({
+        'id': order.id,
+        'status': order.status,
+        'room_code': order.room.code if order.room else None,
+        'device_uid': order.assignment.device_uid if order.assignment else None,
+        'patient_name': order.patient.full_name if order.patient else None,
+        'patient_assignment': order.patient_assignment_id,
+        'placed_at': order.placed_at,
+        'delivered_at': order.delivered_at,
+        'cancelled_at': order.cancelled_at,
+        'item_count': order.item_count,
+        'total_quantity': order.total_quantity,
+    }).data
+
+
+def _event_order_ids(event):
+    """Order ids touched by a staff_orders event (empty for other event types)"""
+    if event.get('type') in ('new_order', 'order_updated'):
+        return [event['order_id']]
+    if event.get('type') == 'orders_updated':
+        return [change['order_id'] for change in event['orders']]
+    return []
+
+
+class OrderQueueReadModel:
+    """
+    Open orders held in memory, indexed by status, room and assignment (device)
+    """
+
+    def __init__(self, resync_grace=DEFAULT_RESYNC_GRACE):
+        self.resync_grace = resync_grace
+        self.ready = False
+        self.version = 0
+        self._pending_versions = set()
+        self._gap_since = None
+        self._entries = {}
+        self._by_status = {}
+        self._by_room = {}
+        self._by_assignment = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _load(order_ids=None):
+        orders = Order.objects.filter(status__in=QUEUE_STATUSES).select_related(
+            'assignment', 'room', 'patient'
+        ).prefetch_related(
+            'items__product__category', 'status_events__changed_by'
+        )
+        if order_ids is not None:
+            orders = orders.filter(id__in=order_ids)
+        return {
+            order.id: {
+                'id': order.id,
+                'status': order.status,
+                'room_id': order.room_id,
+                'assignment_id': order.assignment_id,
+                'patient_id': order.patient_id,
+                'placed_at': order.placed_at,
+                'data': OrderSerializer(order).data,
+                'summary': _summary_row(order),
+            }
+            for order in orders
+        }
+
+    def _index(self, entry):
+        self._by_status.setdefault(entry['status'], set()).add(entry['id'])
+        self._by_room.setdefault(entry['room_id'], set()).add(entry['id'])
+        self._by_assignment.setdefault(entry['assignment_id'], set()).add(entry['id'])
+
+    def _remove(self, order_id):
+        entry = self._entries.pop(order_id, None)
+        if entry:
+            self._by_status.get(entry['status'], set()).discard(order_id)
+            self._by_room.get(entry['room_id'], set()).discard(order_id)
+            self._by_assignment.get(entry['assignment_id'], set()).discard(order_id)
+
+    def hydrate(self):
+        """(Re)load every open order from the database"""
+        version = current_queue_version()
+        entries = self._load()
+        with self._lock:
+            self._entries = {}
+            self._by_status, self._by_room, self._by_assignment = {}, {}, {}
+            for entry in entries.values():
+                self._entries[entry['id']] = entry
+                self._index(entry)
+            self.version = version
+            self._pending_versions = {v for v in self._pending_versions if v > version}
+            self._gap_since = time.monotonic() if self._pending_versions else None
+            self.ready = True
+
+    def refresh(self, order_ids):
+        """Reload the given orders; those no longer open leave the queue"""
+        entries = self._load(order_ids)
+        with self._lock:
+            for order_id in order_ids:
+                self._remove(order_id)
+                if order_id in entries:
+                    self._entries[order_id] = entries[order_id]
+                    self._index(entries[order_id])
+
+    def apply_event(self, event):
+        """
+        Record the version of a staff_orders event
+        Returns the order ids that must be refreshed from the database
+        """
+        version = event.get('queue_version')
+        with self._lock:
+            if version is not None and version > self.version:
+                self._pending_versions.add(version)
+                while self.version + 1 in self._pending_versions:
+                    self.version += 1
+                    self._pending_versions.discard(self.version)
+                if self._pending_versions and self._gap_since is None:
+                    self._gap_since = time.monotonic()
+                elif not self._pending_versions:
+                    self._gap_since = None
+        return _event_order_ids(event)
+
+    def needs_resync(self):
+        """Whether a missing version has been outstanding longer than the grace period"""
+        with self._lock:
+            return self._gap_since is not None and time.monotonic() - self._gap_since > self.resync_grace
+
+    def query(self, statuses, room_id=None, assignment_id=None, patient_id=None):
+        """Open orders with one of statuses, newest first"""
+        with self._lock:
+            order_ids = set()
+            for status in statuses:
+                order_ids |= self._by_status.get(status, set())
+            if room_id is not None:
+                order_ids &= self._by_room.get(room_id, set())
+            if assignment_id is not None:
+                order_ids &= self._by_assignment.get(assignment_id, set())
+            entries = [self._entries[order_id] for order_id in order_ids]
+        if patient_id is not None:
+            entries = [entry for entry in entries if entry['patient_id'] == patient_id]
+        entries.sort(key=lambda entry: (entry['placed_at'], entry['id']), reverse=True)
+        return entries
+
+
+def get_read_model():
+    """The read model of this process, or None when it is not running"""
+    if _read_model is not None and _read_model.ready:
+        return _read_model
+    return None
+
+
+def _sync(method, *args):
+    close_old_connections()
+    return method(*args)
+
+
+async def run_read_model(model, resync_interval=1.0):
+    """
+    Hydrate the read model and apply staff_orders events forever (asyncio task)
+    """
+    channel_layer = get_channel_layer()
+    channel = await channel_layer.new_channel()
+    group_added_at = None
+    while True:
+        try:
+            if group_added_at is None or time.monotonic() - group_added_at > GROUP_REFRESH_SECONDS:
+                await channel_layer.group_add(STAFF_GROUP, channel)
+                group_added_at = time.monotonic()
+            if not model.ready:
+                await sync_to_async(_sync, thread_sensitive=False)(model.hydrate)
+
+            try:
+                event = await asyncio.wait_for(channel_layer.receive(channel), timeout=resync_interval)
+            except asyncio.TimeoutError:
+                event = None
+
+            order_ids = model.apply_event(event) if event else []
+            if model.needs_resync():
+                logger.warning('Order queue read model missed events, resyncing (version %s)', model.version)
+                await sync_to_async(_sync, thread_sensitive=False)(model.hydrate)
+            elif order_ids:
+                await sync_to_async(_sync, thread_sensitive=False)(model.refresh, order_ids)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.error('Order queue read model iteration failed', exc_info=True)
+            model.ready = False
+            await asyncio.sleep(resync_interval)
+
+
+def start_read_model():
+    """
+    Start the read model task on the running event loop (once per process)
+    """
+    global _read_model, _read_model_task
+    if _read_model_task is not None and not _read_model_task.done():
+        return _read_model_task
+    _read_model = OrderQueueReadModel(
+        resync_grace=getattr(settings, 'ORDER_QUEUE_RESYNC_GRACE', DEFAULT_RESYNC_GRACE)
+    )
+    _read_model_task = asyncio.get_running_loop().create_task(run_read_model(_read_model))
+    return _read_model_task
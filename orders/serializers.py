@@ -1,7 +1,5 @@
 from rest_framework import serializers
-from django.db import transaction
-from django.utils import timezone
-from .models import Order, OrderItem, OrderStatusEvent
+from .models import ArchivedOrder, ArchivedOrderItem, ArchivedOrderStatusEvent, Order, OrderItem, OrderStatusEvent
 from catalog.models import Product
 from clinic.models import Device
 
@@ -85,12 +83,75 @@ class OrderSerializer(serializers.ModelSerializer):
             'placed_at',
             'delivered_at',
             'cancelled_at',
+            'item_count',
+            'total_quantity',
             'items',
             'status_events',
             'created_at',
             'updated_at'
         ]
-        read_only_fields = ['id', 'placed_at', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'placed_at', 'item_count', 'total_quantity', 'created_at', 'updated_at']
+
+
+class ArchivedOrderItemSerializer(OrderItemSerializer):
+    """
+    Serializer for ArchivedOrderItem (same shape as OrderItemSerializer)
+    """
+
+    class Meta(OrderItemSerializer.Meta):
+        model = ArchivedOrderItem
+
+
+class ArchivedOrderStatusEventSerializer(OrderStatusEventSerializer):
+    """
+    Serializer for ArchivedOrderStatusEvent (same shape as OrderStatusEventSerializer)
+    """
+
+    class Meta(OrderStatusEventSerializer.Meta):
+        model = ArchivedOrderStatusEvent
+
+
+class ArchivedOrderSerializer(OrderSerializer):
+    """
+    Serializer for ArchivedOrder (same shape as OrderSerializer)
+    """
+    items = ArchivedOrderItemSerializer(many=True, read_only=True)
+    status_events = ArchivedOrderStatusEventSerializer(many=True, read_only=True)
+
+    class Meta(OrderSerializer.Meta):
+        model = ArchivedOrder
+
+
+class OrderSummarySerializer(serializers.Serializer):
+    """
+    Compact Order representation for list views (?view=summary or ?fields=...)
+    Serializes plain .values() rows, no nested items or status history
+    """
+    STATUS_LABELS = dict(Order.STATUS_CHOICES)
+
+    id = serializers.IntegerField()
+    status = serializers.CharField()
+    status_display = serializers.SerializerMethodField()
+    room_code = serializers.CharField(allow_null=True)
+    device_uid = serializers.CharField(allow_null=True)
+    patient_name = serializers.CharField(allow_null=True)
+    patient_assignment = serializers.IntegerField(allow_null=True)
+    placed_at = serializers.DateTimeField()
+    delivered_at = serializers.DateTimeField(allow_null=True)
+    cancelled_at = serializers.DateTimeField(allow_null=True)
+    item_count = serializers.IntegerField()
+    total_quantity = serializers.IntegerField()
+
+    def get_fields(self):
+        """Keep only the fields requested through context['fields'] (if any)"""
+        fields = super().get_fields()
+        requested = self.context.get('fields')
+        if requested:
+            fields = {name: field for name, field in fields.items() if name in requested}
+        return fields
+
+    def get_status_display(self, obj):
+        return str(self.STATUS_LABELS.get(obj['status'], obj['status']))
 
 
 class PublicOrderSerializer(serializers.ModelSerializer):
@@ -113,27 +174,32 @@ class PublicOrderSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'status', 'placed_at', 'delivered_at']
 
 
-class CreateOrderSerializer(serializers.Serializer):
+class OrderResolution:
     """
-    Serializer for creating orders from kiosk
+    Objects loaded while validating an order request (device, active products
+    with their category), handed to the view so each is fetched once per request
     """
-    device_uid = serializers.CharField(required=True)
-    items = serializers.ListField(
-        child=serializers.DictField(),
-        min_length=1,
-        help_text='List of items: [{"product_id": 1, "quantity": 2}, ...]'
-    )
 
-    def validate_device_uid(self, value):
-        """Validate device exists"""
-        try:
-            Device.objects.get(device_uid=value)
-        except Device.DoesNotExist:
-            raise serializers.ValidationError("Device not found")
-        return value
+    def __init__(self):
+        self.device = None
+        self.products = {}
+
+
+class OrderItemsField(serializers.ListField):
+    """
+    Cart items [{"product_id": 1, "quantity": 2}, ...]
+    Loads every product of the cart with one query into the serializer's
+    resolution; product_id and quantity are returned as integers
+    """
 
-    def validate_items(self, value):
-        """Validate items structure and products"""
+    def __init__(self, **kwargs):
+        kwargs.setdefault('child', serializers.DictField())
+        kwargs.setdefault('min_length', 1)
+        kwargs.setdefault('help_text', 'List of items: [{"product_id": 1, "quantity": 2}, ...]')
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
         if not value:
             raise serializers.ValidationError("At least one item is required")
 
@@ -145,21 +211,64 @@ class CreateOrderSerializer(serializers.Serializer):
 
             # Validate quantity
             try:
-                quantity = int(item['quantity'])
-                if quantity < 1:
+                item['quantity'] = int(item['quantity'])
+                if item['quantity'] < 1:
                     raise serializers.ValidationError("Quantity must be at least 1")
             except (ValueError, TypeError):
                 raise serializers.ValidationError("Quantity must be a number")
 
-            # Validate product exists and is active
+        # Validate products exist and are active (one query for the whole cart)
+        product_ids = set()
+        for item in value:
             try:
-                product = Product.objects.get(id=item['product_id'], is_active=True)
-            except Product.DoesNotExist:
+                product_ids.add(int(item['product_id']))
+            except (ValueError, TypeError):
                 raise serializers.ValidationError(f"Product {item['product_id']} not found or inactive")
+        products = self.parent.resolution.products
+        products.update({
+            product.id: product
+            for product in Product.objects.filter(id__in=product_ids, is_active=True).select_related('category')
+        })
+        for item in value:
+            if int(item['product_id']) not in products:
+                raise serializers.ValidationError(f"Product {item['product_id']} not found or inactive")
+            item['product_id'] = int(item['product_id'])
 
         return value
 
 
+class OrderResolutionMixin:
+    """Serializer holding the objects resolved during validation (serializer.resolution)"""
+
+    @property
+    def resolution(self):
+        if 'resolution' not in self.context:
+            self.context['resolution'] = OrderResolution()
+        return self.context['resolution']
+
+
+class CreateOrderSerializer(OrderResolutionMixin, serializers.Serializer):
+    """
+    Serializer for creating orders from kiosk
+    """
+    device_uid = serializers.CharField(required=True)
+    client_request_id = serializers.CharField(
+        required=False,
+        allow_blank=True,
+        max_length=255,
+        help_text='Idempotency key (alternative to the Idempotency-Key header)'
+    )
+    items = OrderItemsField()
+
+    def validate_device_uid(self, value):
+        """Validate device exists"""
+        try:
+            self.resolution.device = Device.objects.get(device_uid=value)
+        except Device.DoesNotExist:
+            raise serializers.ValidationError("Device not found")
+        return value
+
+
 class OrderStatusChangeSerializer(serializers.Serializer):
     """
     Serializer for changing order status
@@ -170,6 +279,22 @@ class OrderStatusChangeSerializer(serializers.Serializer):
     note = serializers.CharField(required=False, allow_blank=True)
 
 
+class OrderBulkStatusChangeSerializer(serializers.Serializer):
+    """
+    Serializer for changing the status of several orders at once
+    """
+    order_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1,
+        max_length=100,
+        help_text='Orders to move: [12, 13, 15]'
+    )
+    to_status = serializers.ChoiceField(
+        choices=['PLACED', 'PREPARING', 'READY', 'DELIVERED', 'CANCELLED']
+    )
+    note = serializers.CharField(required=False, allow_blank=True)
+
+
 class OrderCancelSerializer(serializers.Serializer):
     """
     Serializer for cancelling orders
@@ -177,39 +302,8 @@ class OrderCancelSerializer(serializers.Serializer):
     note = serializers.CharField(required=False, allow_blank=True)
 
 
-class StaffCreateOrderSerializer(serializers.Serializer):
+class StaffCreateOrderSerializer(OrderResolutionMixin, serializers.Serializer):
     """
     Serializer for staff to create orders for their assigned patients
     """
-    items = serializers.ListField(
-        child=serializers.DictField(),
-        min_length=1,
-        help_text='List of items: [{"product_id": 1, "quantity": 2}, ...]'
-    )
-
-    def validate_items(self, value):
-        """Validate items structure and products"""
-        if not value:
-            raise serializers.ValidationError("At least one item is required")
-
-        for item in value:
-            if 'product_id' not in item:
-                raise serializers.ValidationError("Each item must have product_id")
-            if 'quantity' not in item:
-                raise serializers.ValidationError("Each item must have quantity")
-
-            # Validate quantity
-            try:
-                quantity = int(item['quantity'])
-                if quantity < 1:
-                    raise serializers.ValidationError("Quantity must be at least 1")
-            except (ValueError, TypeError):
-                raise serializers.ValidationError("Quantity must be a number")
-
-            # Validate product exists and is active
-            try:
-                product = Product.objects.get(id=item['product_id'], is_active=True)
-            except Product.DoesNotExist:
-                raise serializers.ValidationError(f"Product {item['product_id']} not found or inactive")
-
-        return value
+    items = OrderItemsField()
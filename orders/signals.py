@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from catalog.models import Product, ProductCategory
+
+from .limits import invalidate_category_types
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+def invalidate_limit_policies(sender, instance, **kwargs):
+    """
+    A product (or its category) may have changed category type:
+    drop the cached product_id -> category_type map
+    """
+    invalidate_category_types()
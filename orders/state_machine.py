@@ -0,0 +1,349 @@
+"""
+Order state machine
+
+All order status changes (single, bulk, cancel, admin) go through
+transition_orders(). Allowed transitions and their inventory/patient side
+effects are declared once in TRANSITIONS and compiled into a lookup table at
+import time. Hooks run set-based over every item of every order in the batch,
+so the number of queries per transition does not depend on the number of
+orders or items.
+"""
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from clinic.models import PatientAssignment
+from inventory.alerts import check_low_stock
+from inventory.models import InventoryMovement
+from inventory.services import OPTIMISTIC, apply_balance_deltas, lock_balances, reservation_mode, reserve_conditionally
+from inventory.striping import move_striped_stock, stripe_index, striped_products
+
+from .counters import apply_status_changes
+from .models import Order, OrderItem, OrderStatusEvent
+from .outbox import enqueue_broadcast
+from .prep import transition_prep_delta
+from .queue import broadcast_queue_event
+
+ACTIVE_STATUSES = ['PLACED', 'PREPARING', 'READY']
+
+
+class TransitionContext:
+    """
+    Data shared by the hooks of one transition batch
+    """
+
+    def __init__(self, orders, changed_by=None, now=None, note_template=None):
+        self.orders = orders
+        self.order_ids = [order.id for order in orders]
+        self.changed_by = changed_by
+        self.now = now or timezone.now()
+        self.note_template = note_template
+        self._items = None
+
+    @property
+    def items(self):
+        """(order_id, product_id, quantity) for every item, loaded once per batch"""
+        if self._items is None:
+            self._items = list(OrderItem.objects.filter(order_id__in=self.order_ids).values_list(
+                'order_id', 'product_id', 'quantity'
+            ))
+        return self._items
+
+    @property
+    def items_loaded(self):
+        return self._items is not None
+
+    def totals_by_product(self):
+        totals = {}
+        for _, product_id, quantity in self.items:
+            totals[product_id] = totals.get(product_id, 0) + quantity
+        return totals
+
+    def totals_by_stripe(self, stripe_counts):
+        """
+        {(product_id, stripe_index): quantity} for the striped products
+        (stripe_counts is {product_id: stripe_count}); each order uses its device's stripe
+        """
+        devices = {order.id: order.assignment_id for order in self.orders}
+        totals = {}
+        for order_id, product_id, quantity in self.items:
+            if product_id in stripe_counts:
+                key = (product_id, stripe_index(devices.get(order_id), stripe_counts[product_id]))
+                totals[key] = totals.get(key, 0) + quantity
+        return totals
+
+
+def _create_movements(context, movement_type, note_template, product_ids):
+    """Bulk-insert one movement per item of the given products"""
+    note_template = context.note_template or note_template
+    InventoryMovement.objects.bulk_create([
+        InventoryMovement(
+            product_id=product_id,
+            movement_type=movement_type,
+            quantity=quantity,
+            order_id=order_id,
+            created_by=context.changed_by,
+            note=note_template.format(order_id=order_id)
+        )
+        for order_id, product_id, quantity in context.items
+        if product_id in product_ids
+    ])
+
+
+def _move_stock(context, movement_type, note_template, reserved_sign, on_hand_sign=0):
+    """
+    Lock the affected balances (sorted), apply aggregated deltas with one UPDATE
+    and bulk-insert one movement per item. Untracked products are skipped;
+    striped products are moved on their stripes.
+    """
+    totals = context.totals_by_product()
+    stripe_counts = striped_products(totals)
+    balances = lock_balances(sorted(pid for pid in totals if pid not in stripe_counts))
+    apply_balance_deltas(
+        reserved={pid: reserved_sign * totals[pid] for pid in balances},
+        on_hand={pid: on_hand_sign * totals[pid] for pid in balances}
+    )
+    moved = set(balances)
+    if stripe_counts:
+        moved |= move_striped_stock(context.totals_by_stripe(stripe_counts), reserved_sign, on_hand_sign)
+    _create_movements(context, movement_type, note_template, moved)
+    check_low_stock({pid: (on_hand_sign - reserved_sign) * totals[pid] for pid in moved})
+
+
+def reserve(context):
+    """
+    Reserve stock for new orders: reserved += qty
+    In optimistic mode each product is reserved with a conditional UPDATE
+    (no up-front row locks) and InsufficientStock is raised on failure
+    """
+    if reservation_mode() != OPTIMISTIC:
+        _move_stock(context, 'RESERVE', 'Reserved for order #{order_id}', reserved_sign=1)
+        return
+
+    totals = context.totals_by_product()
+    stripe_counts = striped_products(totals)
+    reserved = reserve_conditionally({pid: qty for pid, qty in totals.items() if pid not in stripe_counts})
+    if stripe_counts:
+        reserved |= move_striped_stock(context.totals_by_stripe(stripe_counts), reserved_sign=1)
+    _create_movements(context, 'RESERVE', 'Reserved for order #{order_id}', reserved)
+    check_low_stock({pid: -totals[pid] for pid in reserved})
+
+
+def consume(context):
+    """Consume stock for delivered orders: reserved -= qty, on_hand -= qty"""
+    _move_stock(context, 'CONSUME', 'Consumed for order #{order_id} delivery', reserved_sign=-1, on_hand_sign=-1)
+
+
+def release(context):
+    """Release stock of cancelled orders: reserved -= qty"""
+    _move_stock(context, 'RELEASE', 'Released from cancelled order #{order_id}', reserved_sign=-1)
+
+
+def _adjust_active_order_counts(context, sign):
+    """
+    Add sign * (orders in the batch) to each patient assignment's active_order_count
+    with a single UPDATE
+    """
+    counts = {}
+    for order in context.orders:
+        if order.patient_assignment_id:
+            counts[order.patient_assignment_id] = counts.get(order.patient_assignment_id, 0) + 1
+    if not counts:
+        return
+    delta = Case(
+        *[When(id=assignment_id, then=Value(sign * count)) for assignment_id, count in counts.items()],
+        default=Value(0),
+        output_field=IntegerField()
+    )
+    PatientAssignment.objects.filter(id__in=counts).update(
+        active_order_count=F('active_order_count') + delta,
+        updated_at=context.now
+    )
+
+
+def open_orders(context):
+    """Count new orders as active on their patient assignment"""
+    _adjust_active_order_counts(context, 1)
+
+
+def close_orders(context):
+    """Stop counting delivered/cancelled orders as active"""
+    _adjust_active_order_counts(context, -1)
+
+
+def lock_patient_ordering(context):
+    """
+    Block patients from creating new orders once they have no other active orders
+    Runs after close_orders, so active_order_count already excludes this batch
+    """
+    assignment_ids = {order.patient_assignment_id for order in context.orders if order.patient_assignment_id}
+    if not assignment_ids:
+        return
+    PatientAssignment.objects.filter(
+        id__in=assignment_ids,
+        active_order_count__lte=0
+    ).update(can_patient_order=False, updated_at=context.now)
+
+
+# Allowed transitions: from_status -> {to_status: hooks}
+# '' is the initial state of an order being created
+TRANSITIONS = {
+    '': {
+        'PLACED': (reserve, open_orders),
+    },
+    'PLACED': {
+        'PREPARING': (),
+        'READY': (),
+        'DELIVERED': (consume, close_orders, lock_patient_ordering),
+        'CANCELLED': (release, close_orders),
+    },
+    'PREPARING': {
+        'READY': (),
+        'DELIVERED': (consume, close_orders, lock_patient_ordering),
+        'CANCELLED': (release, close_orders),
+    },
+    'READY': {
+        'DELIVERED': (consume, close_orders, lock_patient_ordering),
+        'CANCELLED': (release, close_orders),
+    },
+    'DELIVERED': {},
+    'CANCELLED': {},
+}
+
+# Timestamp field set on the order when entering a status
+TIMESTAMP_FIELDS = {
+    'DELIVERED': 'delivered_at',
+    'CANCELLED': 'cancelled_at',
+}
+
+# Compiled lookup: (from_status, to_status) -> hooks
+_COMPILED = {
+    (from_status, to_status): hooks
+    for from_status, targets in TRANSITIONS.items()
+    for to_status, hooks in targets.items()
+}
+
+
+def can_transition(from_status, to_status):
+    return (from_status, to_status) in _COMPILED
+
+
+def transition_error(from_status, to_status):
+    """Error message for a transition that is not allowed"""
+    if from_status == 'DELIVERED':
+        return 'Cannot cancel delivered order' if to_status == 'CANCELLED' else 'Cannot change status of delivered order'
+    if from_status == 'CANCELLED':
+        return 'Order is already cancelled' if to_status == 'CANCELLED' else 'Cannot change status of cancelled order'
+    if from_status == to_status:
+        return f'Order is already {to_status}'
+    return f'Cannot change status from {from_status} to {to_status}'
+
+
+def run_hooks(from_status, to_status, orders, changed_by=None, note_template=None):
+    """
+    Run the side-effect hooks of one transition over a batch of orders
+    """
+    context = TransitionContext(orders, changed_by=changed_by, note_template=note_template)
+    for hook in _COMPILED[(from_status, to_status)]:
+        hook(context)
+    apply_status_changes([(order, from_status, to_status) for order in orders])
+    return context
+
+
+def lock_orders(order_ids):
+    """Lock orders in id order (avoid deadlocks) and return them"""
+    return list(Order.objects.select_for_update().filter(id__in=order_ids).order_by('id'))
+
+
+def transition_orders(orders, to_status, changed_by=None, note=''):
+    """
+    Move a batch of locked orders to to_status
+    Must run inside transaction.atomic() with the orders locked (lock_orders).
+
+    Returns (changed, errors): changed is a list of (order, from_status) and
+    errors a list of {'order_id', 'error'} for orders that cannot transition.
+    The order instances are updated in memory.
+    """
+    changed = []
+    errors = []
+    for order in orders:
+        if can_transition(order.status, to_status):
+            changed.append((order, order.status))
+        else:
+            errors.append({'order_id': order.id, 'error': transition_error(order.status, to_status)})
+
+    if not changed:
+        return changed, errors
+
+    # Run each distinct hook chain once over all the orders that share it
+    now = timezone.now()
+    batches = {}
+    contexts = []
+    for order, from_status in changed:
+        batches.setdefault(_COMPILED[(from_status, to_status)], []).append(order)
+    for hooks, batch in batches.items():
+        context = TransitionContext(batch, changed_by=changed_by, now=now)
+        for hook in hooks:
+            hook(context)
+        contexts.append(context)
+
+    # Update all orders with a single UPDATE
+    changed_orders = [order for order, _ in changed]
+    updates = {'status': to_status, 'updated_at': now}
+    timestamp_field = TIMESTAMP_FIELDS.get(to_status)
+    if timestamp_field:
+        updates[timestamp_field] = now
+    Order.objects.filter(id__in=[order.id for order in changed_orders]).update(**updates)
+    for order in changed_orders:
+        for field, value in updates.items():
+            setattr(order, field, value)
+    apply_status_changes([(order, from_status, to_status) for order, from_status in changed])
+
+    OrderStatusEvent.objects.bulk_create([
+        OrderStatusEvent(
+            order=order,
+            from_status=from_status,
+            to_status=to_status,
+            changed_by=changed_by,
+            note=note
+        )
+        for order, from_status in changed
+    ])
+
+    prep = transition_prep_delta([(order, from_status, to_status) for order, from_status in changed], contexts)
+    _broadcast_changes(changed, to_status, now, prep)
+    return changed, errors
+
+
+def _broadcast_changes(changed, to_status, now, prep=None):
+    """
+    Notify staff and each kiosk device once (published after commit)
+    Several changed orders are sent as one coalesced message, carrying the
+    prep summary delta of the whole batch
+    """
+    changes = []
+    changes_by_device = {}
+    for order, from_status in changed:
+        change = {
+            'order_id': order.id,
+            'status': to_status,
+            'from_status': from_status,
+            'changed_at': now.isoformat(),
+        }
+        changes.append(change)
+        if order.assignment_id:
+            changes_by_device.setdefault(order.assignment_id, []).append(change)
+
+    if len(changes) == 1:
+        message = dict(changes[0], type='order_updated')
+    else:
+        message = {'type': 'orders_updated', 'orders': changes}
+    if prep:
+        message['prep_delta'] = prep
+    broadcast_queue_event(message)
+
+    for device_id, changes in changes_by_device.items():
+        if len(changes) == 1:
+            message = dict(changes[0], type='order_status_changed')
+        else:
+            message = {'type': 'orders_status_changed', 'orders': changes}
+        enqueue_broadcast(f'device_{device_id}', message)
@@ -0,0 +1,108 @@
+"""
+Stale order sweeper
+
+Orders left in PLACED or PREPARING (e.g. when a shift ends) keep their stock
+reserved. Orders whose status has not changed for ORDER_STALE_AFTER_MINUTES
+are cancelled in chunked batches through transition_orders(): one balance
+UPDATE per batch for the released quantities, bulk-inserted RELEASE
+movements and one coalesced broadcast per device. Each sweep also deletes
+expired idempotency keys.
+
+Runs with `python manage.py cancel_stale_orders` or, when
+ORDER_STALE_SWEEP_INTERVAL is set, as an asyncio task in the ASGI process.
+"""
+import asyncio
+import logging
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .idempotency import purge_expired_keys
+from .models import Order
+from .state_machine import transition_orders
+
+logger = logging.getLogger(__name__)
+
+STALE_STATUSES = ['PLACED', 'PREPARING']
+DEFAULT_STALE_AFTER_MINUTES = 12 * 60
+DEFAULT_BATCH_SIZE = 200
+SWEEP_NOTE = 'Cancelled automatically: order was not handled in time'
+
+_sweeper_task = None
+
+
+def stale_cutoff(minutes=None):
+    """Open orders not updated since this datetime are stale"""
+    if minutes is None:
+        minutes = getattr(settings, 'ORDER_STALE_AFTER_MINUTES', DEFAULT_STALE_AFTER_MINUTES)
+    return timezone.now() - timedelta(minutes=minutes)
+
+
+def sweep_batch(cutoff, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Cancel one batch of stale orders (rows locked by staff requests are skipped)
+    Returns the number of orders cancelled
+    """
+    with transaction.atomic():
+        orders = list(Order.objects.select_for_update(skip_locked=True).filter(
+            status__in=STALE_STATUSES,
+            updated_at__lt=cutoff
+        ).order_by('id')[:batch_size])
+        if not orders:
+            return 0
+        changed, _ = transition_orders(orders, 'CANCELLED', note=SWEEP_NOTE)
+        return len(changed)
+
+
+def sweep_stale_orders(cutoff=None, batch_size=DEFAULT_BATCH_SIZE, max_batches=None):
+    """
+    Cancel orders stale since cutoff in batches of batch_size
+    Returns the total number of orders cancelled
+    """
+    if cutoff is None:
+        cutoff = stale_cutoff()
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        cancelled = sweep_batch(cutoff, batch_size)
+        total += cancelled
+        batches += 1
+        if cancelled < batch_size:
+            break
+    if total:
+        logger.info('Cancelled %s stale orders', total)
+    return total
+
+
+def _sweep():
+    close_old_connections()
+    purge_expired_keys()
+    return sweep_stale_orders()
+
+
+async def run_sweeper(interval):
+    """
+    Cancel stale orders every interval seconds forever (asyncio task)
+    """
+    while True:
+        try:
+            await sync_to_async(_sweep, thread_sensitive=False)()
+        except Exception:
+            logger.error('Stale order sweep failed', exc_info=True)
+        await asyncio.sleep(interval)
+
+
+def start_sweeper(interval=None):
+    """
+    Start the sweeper task on the running event loop (once per process)
+    """
+    global _sweeper_task
+    if _sweeper_task is not None and not _sweeper_task.done():
+        return _sweeper_task
+    if interval is None:
+        interval = getattr(settings, 'ORDER_STALE_SWEEP_INTERVAL', 0)
+    _sweeper_task = asyncio.get_running_loop().create_task(run_sweeper(interval))
+    return _sweeper_task
@@ -1,73 +1,45 @@
+import io
+import json
+import threading
+import warnings
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.core.management import call_command
+from django.db import OperationalError, connection
 from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from clinic.models import Room, Device, Patient, PatientAssignment
 from catalog.models import Product, ProductCategory
-from inventory.models import InventoryBalance
-from orders.models import Order, OrderItem
-from accounts.models import Role, UserRole
+from inventory.models import InventoryBalance, InventoryMovement, InventoryStripe, ArchivedInventoryMovement
+from common.testing import KioskOrderTestCase, create_test_data
+from orders.admission import AdmissionController
+from orders.consumers import KioskOrderConsumer
+from orders.contention import ContentionStats
+from orders.counters import compute_counts, get_counts, rebuild_counters, stored_counts
+from orders.limits import category_types
+from orders.models import (
+    Order, OrderItem, OrderStatusEvent, OrderIdempotencyKey, OutboxEvent, OrderStatusCounter,
+    ArchivedOrder, ArchivedOrderItem, ArchivedOrderStatusEvent
+)
+from orders.outbox import _DispatchOnCommit, claim_pending, dispatch_pending, purge_events
+from orders.queue import OrderQueueReadModel
+from orders.state_machine import lock_orders, run_hooks, transition_orders, can_transition
 
 User = get_user_model()
 
 
-def create_test_data(order_limits=None):
-    """Helper para crear los objetos necesarios para tests de ordenes"""
-    staff_user = User.objects.create_user(
-        email='staff@test.com', password='testpass123',
-        full_name='Staff Test', is_staff=True
-    )
-    # Assign STAFF role so IsStaffOrAdmin permission passes
-    staff_role, _ = Role.objects.get_or_create(name='STAFF')
-    UserRole.objects.create(user=staff_user, role=staff_role)
-
-    room = Room.objects.create(code='R101', is_active=True)
-    device = Device.objects.create(
-        device_uid='test-device-001',
-        device_type='IPAD',
-        room=room,
-        is_active=True
-    )
-    patient = Patient.objects.create(
-        full_name='Paciente Test',
-        phone_e164='+1234567890'
-    )
-    if order_limits is None:
-        order_limits = {'DRINK': 5, 'SNACK': 5}
-    assignment = PatientAssignment.objects.create(
-        patient=patient,
-        staff=staff_user,
-        room=room,
-        device=device,
-        is_active=True,
-        can_patient_order=True,
-        order_limits=order_limits
-    )
-    category = ProductCategory.objects.create(
-        name='Bebidas',
-        category_type='DRINK',
-        is_active=True
-    )
-    product = Product.objects.create(
-        name='Jugo de Naranja',
-        category=category,
-        is_active=True,
-        unit_label='vaso'
-    )
-    # Signal auto-creates InventoryBalance on Product creation, so update it
-    balance = InventoryBalance.objects.get(product=product)
-    balance.on_hand = 10
-    balance.reserved = 0
-    balance.save()
-    return {
-        'staff_user': staff_user,
-        'room': room,
-        'device': device,
-        'patient': patient,
-        'assignment': assignment,
-        'category': category,
-        'product': product,
-    }
+def read_streaming(response):
+    """Consume a streaming response the way the ASGI handler does (async iteration)"""
+    async def collect():
+        return b''.join([chunk async for chunk in response])
+    return async_to_sync(collect)()
 
 
 @override_settings(
@@ -336,3 +308,1218 @@ class OrderStatusFlowTests(TestCase):
         self.client.patch(f'/api/orders/{self.order.id}/status/', {'to_status': 'DELIVERED'}, format='json')
         self.assignment.refresh_from_db()
         self.assertFalse(self.assignment.can_patient_order)
+
+
+class OrderBulkWriteTests(KioskOrderTestCase):
+    """Tests para la ruta de escritura en bloque al crear ordenes"""
+    order_limits = {'DRINK': 10, 'SNACK': 10}
+
+    def setUp(self):
+        super().setUp()
+        self.product_2 = Product.objects.create(
+            name='Agua Natural',
+            category=self.category,
+            is_active=True,
+            unit_label='botella'
+        )
+        InventoryBalance.objects.filter(product=self.product_2).update(on_hand=5)
+
+    def test_multi_product_order_reserves_and_logs_each_line(self):
+        """Una orden con varios productos reserva y registra movimientos por linea"""
+        response = self.client.post('/api/public/orders/create', {
+            'device_uid': self.device.device_uid,
+            'items': [
+                {'product_id': self.product.id, 'quantity': 2},
+                {'product_id': self.product_2.id, 'quantity': 3},
+            ]
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(order.inventory_movements.filter(movement_type='RESERVE').count(), 2)
+        self.assertEqual(InventoryBalance.objects.get(product=self.product).reserved, 2)
+        self.assertEqual(InventoryBalance.objects.get(product=self.product_2).reserved, 3)
+        self.assertEqual(len(response.data['order']['items']), 2)
+
+    def test_repeated_product_lines_are_checked_together(self):
+        """Lineas repetidas del mismo producto se validan contra el disponible total"""
+        response = self.client.post('/api/public/orders/create', {
+            'device_uid': self.device.device_uid,
+            'items': [
+                {'product_id': self.product_2.id, 'quantity': 3},
+                {'product_id': self.product_2.id, 'quantity': 3},
+            ]
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(InventoryBalance.objects.get(product=self.product_2).reserved, 0)
+        self.assertFalse(Order.objects.exists())
+
+    @skipUnless(connection.vendor == 'postgresql', 'Locking reads only differ from plain fetches by FOR UPDATE on PostgreSQL')
+    def test_device_and_products_are_fetched_once(self):
+        """El dispositivo y los productos se cargan una vez (serializer) y la vista los reutiliza"""
+        category_types()  # Warm the limit policy cache
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/public/orders/create', {
+                'device_uid': self.device.device_uid,
+                'items': [
+                    {'product_id': self.product.id, 'quantity': 1},
+                    {'product_id': self.product_2.id, 'quantity': 1},
+                    {'product_id': self.product.id, 'quantity': 1},
+                ]
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['order']['items'][0]['product_name'], self.product.name)
+        selects = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+        product_fetches = [sql for sql in selects if 'FROM "catalog_product"' in sql and 'FOR UPDATE' not in sql]
+        device_fetches = [sql for sql in selects if 'FROM "clinic_device"' in sql and 'FOR UPDATE' not in sql]
+        self.assertEqual(len(product_fetches), 1)
+        self.assertEqual(len(device_fetches), 1)
+
+
+class OrderIdempotencyTests(KioskOrderTestCase):
+    """Tests para reintentos idempotentes al crear ordenes desde el kiosco"""
+
+    def setUp(self):
+        super().setUp()
+        self.payload = {
+            'device_uid': self.device.device_uid,
+            'items': [{'product_id': self.product.id, 'quantity': 1}]
+        }
+
+    def test_retry_with_same_header_replays_original_order(self):
+        """Un reintento con el mismo Idempotency-Key devuelve la orden original"""
+        first = self.client.post('/api/public/orders/create', self.payload,
+                                 format='json', HTTP_IDEMPOTENCY_KEY='abc-123')
+        retry = self.client.post('/api/public/orders/create', self.payload,
+                                 format='json', HTTP_IDEMPOTENCY_KEY='abc-123')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data['order']['id'], first.data['order']['id'])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(InventoryBalance.objects.get(product=self.product).reserved, 1)
+
+    def test_client_request_id_field_is_accepted(self):
+        """El campo client_request_id funciona igual que el header"""
+        payload = dict(self.payload, client_request_id='req-1')
+        self.client.post('/api/public/orders/create', payload, format='json')
+        self.client.post('/api/public/orders/create', payload, format='json')
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(OrderIdempotencyKey.objects.get().scope, self.device.device_uid)
+
+    def test_different_keys_create_separate_orders(self):
+        """Claves distintas crean ordenes distintas"""
+        self.client.post('/api/public/orders/create', self.payload,
+                         format='json', HTTP_IDEMPOTENCY_KEY='key-1')
+        self.client.post('/api/public/orders/create', self.payload,
+                         format='json', HTTP_IDEMPOTENCY_KEY='key-2')
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_same_key_with_different_items_is_rejected(self):
+        """Reusar un Idempotency-Key con otro carrito devuelve 422"""
+        self.client.post('/api/public/orders/create', self.payload,
+                         format='json', HTTP_IDEMPOTENCY_KEY='abc-123')
+        payload = dict(self.payload, items=[{'product_id': self.product.id, 'quantity': 2}])
+        response = self.client.post('/api/public/orders/create', payload,
+                                    format='json', HTTP_IDEMPOTENCY_KEY='abc-123')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(InventoryBalance.objects.get(product=self.product).reserved, 1)
+
+    def test_same_items_split_across_lines_replay(self):
+        """El hash usa los items normalizados: el mismo carrito en otras lineas se reproduce"""
+        payload = dict(self.payload, items=[{'product_id': self.product.id, 'quantity': 2}])
+        first = self.client.post('/api/public/orders/create', payload,
+                                 format='json', HTTP_IDEMPOTENCY_KEY='abc-123')
+        payload = dict(self.payload, items=[{'product_id': self.product.id, 'quantity': 1}] * 2)
+        retry = self.client.post('/api/public/orders/create', payload,
+                                 format='json', HTTP_IDEMPOTENCY_KEY='abc-123')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.data['order']['id'], first.data['order']['id'])
+
+    def test_sweeper_purges_expired_keys(self):
+        """cancel_stale_orders elimina las claves vencidas sin esperar a una busqueda"""
+        self.client.post('/api/public/orders/create', self.payload,
+                         format='json', HTTP_IDEMPOTENCY_KEY='old')
+        self.client.post('/api/public/orders/create', self.payload,
+                         format='json', HTTP_IDEMPOTENCY_KEY='new')
+        OrderIdempotencyKey.objects.filter(key='old').update(expires_at=timezone.now() - timedelta(seconds=1))
+        call_command('cancel_stale_orders', stdout=io.StringIO())
+        self.assertEqual(list(OrderIdempotencyKey.objects.values_list('key', flat=True)), ['new'])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class OrderOutboxTests(KioskOrderTestCase):
+    """Tests para el outbox de notificaciones WebSocket"""
+
+    def test_new_order_event_is_published_after_commit(self):
+        """El evento new_order se publica despues del commit"""
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.create_order()
+        self.assertEqual(response.status_code, 201)
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.group, 'staff_orders')
+        self.assertEqual(event.payload['type'], 'new_order')
+        self.assertIsNotNone(event.dispatched_at)
+
+    def test_failed_order_does_not_enqueue_events(self):
+        """Una orden rechazada no deja eventos pendientes"""
+        response = self.create_order(quantity=999)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_publish_failure_is_retried_later(self):
+        """Si el channel layer falla, el evento queda pendiente con reintento"""
+        self.create_order()
+        failing_layer = mock.Mock()
+        failing_layer.group_send = mock.AsyncMock(side_effect=ConnectionError('redis down'))
+        with mock.patch('orders.outbox.get_channel_layer', return_value=failing_layer):
+            self.assertEqual(dispatch_pending(), 0)
+        event = OutboxEvent.objects.get()
+        self.assertIsNone(event.dispatched_at)
+        self.assertEqual(event.attempts, 1)
+        self.assertIn('redis down', event.last_error)
+
+        OutboxEvent.objects.update(next_attempt_at=event.created_at)
+        self.assertEqual(dispatch_pending(), 1)
+
+    def test_one_dispatch_per_transaction(self):
+        """Una transicion en lote registra un solo despacho on_commit para todos sus eventos"""
+        for _ in range(3):
+            self.create_order()
+        OutboxEvent.objects.all().delete()
+        self.client.force_authenticate(user=self.staff_user)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post('/api/orders/bulk-status/', {
+                'order_ids': list(Order.objects.values_list('id', flat=True)),
+                'to_status': 'CANCELLED'
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(OutboxEvent.objects.count(), 1)
+        self.assertEqual(len([c for c in callbacks if isinstance(c, _DispatchOnCommit)]), 1)
+        self.assertFalse(OutboxEvent.objects.filter(dispatched_at__isnull=True).exists())
+
+    def test_claimed_events_are_leased(self):
+        """Los eventos reclamados no se entregan a otro despachador hasta que vence el lease"""
+        self.create_order()
+        self.assertEqual(len(claim_pending()), 1)
+        self.assertEqual(claim_pending(), [])
+        OutboxEvent.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(dispatch_pending(), 1)
+
+    @override_settings(ORDER_OUTBOX_MAX_ATTEMPTS=3, ORDER_OUTBOX_RETENTION_DAYS=7)
+    def test_purge_removes_old_published_and_dead_events(self):
+        """La purga borra eventos viejos publicados o agotados, y conserva los pendientes"""
+        old = timezone.now() - timedelta(days=8)
+        published = OutboxEvent.objects.create(group='staff_orders', payload={}, dispatched_at=old)
+        dead = OutboxEvent.objects.create(group='staff_orders', payload={}, attempts=3)
+        retrying = OutboxEvent.objects.create(group='staff_orders', payload={}, attempts=1)
+        OutboxEvent.objects.filter(id__in=[dead.id, retrying.id]).update(created_at=old)
+        self.assertEqual(purge_events(), 2)
+        self.assertEqual(list(OutboxEvent.objects.values_list('id', flat=True)), [retrying.id])
+
+
+class OrderBulkStatusTests(KioskOrderTestCase):
+    """Tests para el cambio de estado en lote"""
+
+    def setUp(self):
+        super().setUp()
+        self.order_ids = [self.place_order(quantity) for quantity in (1, 2, 3)]
+        self.client.force_authenticate(user=self.staff_user)
+
+    def bulk(self, order_ids, to_status):
+        return self.client.post('/api/orders/bulk-status/', {
+            'order_ids': order_ids,
+            'to_status': to_status
+        }, format='json')
+
+    def test_bulk_move_to_preparing(self):
+        """Se pueden mover varias ordenes a PREPARING en una sola llamada"""
+        response = self.bulk(self.order_ids, 'PREPARING')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.data['updated']), self.order_ids)
+        self.assertEqual(Order.objects.filter(status='PREPARING').count(), 3)
+        self.assertEqual(OrderStatusEvent.objects.filter(to_status='PREPARING').count(), 3)
+
+    def test_bulk_delivery_consumes_aggregated_inventory(self):
+        """Entregar en lote consume el inventario de todas las ordenes"""
+        response = self.bulk(self.order_ids, 'DELIVERED')
+        self.assertEqual(response.status_code, 200)
+        balance = InventoryBalance.objects.get(product=self.product)
+        self.assertEqual(balance.on_hand, 4)
+        self.assertEqual(balance.reserved, 0)
+        self.assertEqual(InventoryMovement.objects.filter(movement_type='CONSUME').count(), 3)
+        self.assignment.refresh_from_db()
+        self.assertFalse(self.assignment.can_patient_order)
+
+    def test_bulk_skips_orders_that_cannot_transition(self):
+        """Las ordenes entregadas o inexistentes se reportan como errores"""
+        self.bulk(self.order_ids[:1], 'DELIVERED')
+        response = self.bulk(self.order_ids + [999999], 'READY')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.data['updated']), self.order_ids[1:])
+        self.assertEqual(
+            sorted(error['order_id'] for error in response.data['errors']),
+            [self.order_ids[0], 999999]
+        )
+        # The other orders were still active when the first one was delivered
+        self.assignment.refresh_from_db()
+        self.assertTrue(self.assignment.can_patient_order)
+
+
+# Maximum queries allowed for one transition_orders() call, whatever the
+# number of orders or items in the batch
+TRANSITION_QUERY_BUDGET = {
+    'PREPARING': 9,
+    'DELIVERED': 15,
+    'CANCELLED': 14,
+}
+
+
+class OrderStateMachineTests(KioskOrderTestCase):
+    """Tests para la maquina de estados de ordenes"""
+    order_limits = {'DRINK': 20}
+
+    def setUp(self):
+        super().setUp()
+        self.product_2 = Product.objects.create(
+            name='Te Verde', category=self.category, is_active=True, unit_label='taza'
+        )
+        InventoryBalance.objects.filter(product=self.product).update(on_hand=50)
+        InventoryBalance.objects.filter(product=self.product_2).update(on_hand=50)
+
+    def create_orders(self, count):
+        return [self.place_order(items=[(self.product, 1), (self.product_2, 1)]) for _ in range(count)]
+
+    def count_transition_queries(self, order_ids, to_status):
+        orders = lock_orders(order_ids)
+        with CaptureQueriesContext(connection) as ctx:
+            changed, errors = transition_orders(orders, to_status, changed_by=self.staff_user)
+        self.assertEqual(len(changed), len(order_ids))
+        return len(ctx.captured_queries)
+
+    def test_backward_transitions_are_rejected(self):
+        """No se permiten transiciones hacia atras como READY -> PLACED"""
+        self.assertTrue(can_transition('PLACED', 'PREPARING'))
+        self.assertFalse(can_transition('READY', 'PLACED'))
+        self.assertFalse(can_transition('DELIVERED', 'CANCELLED'))
+
+        order_id = self.create_orders(1)[0]
+        self.client.force_authenticate(user=self.staff_user)
+        self.client.patch(f'/api/orders/{order_id}/status/', {'to_status': 'READY'}, format='json')
+        response = self.client.patch(f'/api/orders/{order_id}/status/', {'to_status': 'PLACED'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.get(id=order_id).status, 'READY')
+
+    def test_query_budget_does_not_grow_with_batch_size(self):
+        """El numero de queries por transicion no depende del numero de ordenes o items"""
+        order_ids = self.create_orders(4)
+        for to_status in ('PREPARING', 'DELIVERED'):
+            single = self.count_transition_queries(order_ids[:1], to_status)
+            batch = self.count_transition_queries(order_ids[1:], to_status)
+            self.assertLessEqual(single, TRANSITION_QUERY_BUDGET[to_status])
+            self.assertLessEqual(batch, TRANSITION_QUERY_BUDGET[to_status])
+
+    def test_admin_cannot_create_orders(self):
+        """El admin no crea ordenes fuera de la maquina de estados; los cambios de estado si pasan por ella"""
+        admin_user = User.objects.create_superuser(email='admin@test.com', password='testpass123', full_name='Admin')
+        order_id = self.create_orders(1)[0]
+        self.client.force_login(admin_user)
+        self.assertEqual(self.client.get('/admin/orders/order/add/').status_code, 403)
+
+        order = Order.objects.get(id=order_id)
+        response = self.client.post(f'/admin/orders/order/{order_id}/change/', {
+            'status': 'CANCELLED',
+            'assignment': order.assignment_id,
+            'room': order.room_id,
+            'patient': order.patient_id,
+            'status_events-TOTAL_FORMS': 0, 'status_events-INITIAL_FORMS': 0,
+            'items-TOTAL_FORMS': 0, 'items-INITIAL_FORMS': 0,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Order.objects.get(id=order_id).status, 'CANCELLED')
+        self.assertEqual(InventoryBalance.objects.get(product=self.product).reserved, 0)
+
+    def test_cancel_query_budget(self):
+        """Cancelar en lote respeta el presupuesto de queries y libera el inventario"""
+        order_ids = self.create_orders(3)
+        queries = self.count_transition_queries(order_ids, 'CANCELLED')
+        self.assertLessEqual(queries, TRANSITION_QUERY_BUDGET['CANCELLED'])
+        self.assertEqual(InventoryBalance.objects.get(product=self.product).reserved, 0)
+        self.assertEqual(InventoryBalance.objects.get(product=self.product_2).reserved, 0)
+
+
+class OrderCursorPaginationTests(KioskOrderTestCase):
+    """Tests para la paginacion por cursor de la cola de ordenes"""
+
+    def setUp(self):
+        super().setUp()
+        for _ in range(5):
+            self.place_order()
+        self.client.force_authenticate(user=self.staff_user)
+
+    def test_queue_pages_follow_cursor_without_duplicates(self):
+        """La cola se recorre con cursores estables aunque lleguen ordenes nuevas"""
+        first = self.client.get('/api/orders/queue/', {'page_size': 2})
+        self.assertEqual(first.status_code, 200)
+        self.assertNotIn('count', first.data)
+        seen = [order['id'] for order in first.data['results']]
+
+        # A new order arriving between pages does not shift the next page
+        self.create_order()
+
+        next_url = first.data['next']
+        while next_url:
+            page = self.client.get(next_url)
+            seen += [order['id'] for order in page.data['results']]
+            next_url = page.data['next']
+
+        expected = list(Order.objects.order_by('-placed_at', '-id').values_list('id', flat=True))[1:]
+        self.assertEqual(seen, expected)
+
+
+class OrderSummaryViewTests(KioskOrderTestCase):
+    """Tests para la representacion compacta de la lista de ordenes"""
+
+    def setUp(self):
+        super().setUp()
+        for quantity in (1, 2):
+            self.place_order(items=[(self.product, quantity), (self.product, 1)])
+        self.client.force_authenticate(user=self.staff_user)
+
+    def test_summary_view_returns_compact_rows(self):
+        """view=summary devuelve filas compactas sin items anidados"""
+        response = self.client.get('/api/orders/queue/', {'view': 'summary'})
+        self.assertEqual(response.status_code, 200)
+        rows = response.data['results']
+        self.assertEqual(len(rows), 2)
+        self.assertNotIn('items', rows[0])
+        self.assertEqual(rows[0]['room_code'], self.room.code)
+        self.assertEqual(rows[0]['item_count'], 2)
+        self.assertEqual(rows[0]['total_quantity'], 3)
+        self.assertEqual(rows[0]['status_display'], 'Placed')
+
+    def test_fields_param_selects_fields(self):
+        """fields=... limita los campos devueltos"""
+        response = self.client.get('/api/orders/', {'fields': 'id,status,item_count'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'placed_at', 'status', 'item_count'})
+
+    def test_summary_view_query_count_is_constant(self):
+        """La vista compacta usa un numero fijo de queries"""
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/orders/queue/', {'view': 'summary'})
+        summary_queries = len(ctx.captured_queries)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/orders/queue/')
+        self.assertLess(summary_queries, len(ctx.captured_queries))
+
+
+class OrderSummaryCountersTests(KioskOrderTestCase):
+    """Tests para los contadores desnormalizados de ordenes"""
+
+    def order_with_lines(self, *quantities):
+        return Order.objects.get(id=self.place_order(items=[(self.product, q) for q in quantities]))
+
+    def test_order_counters_set_on_create(self):
+        """item_count y total_quantity se guardan al crear la orden"""
+        order = self.order_with_lines(2, 1)
+        self.assertEqual(order.item_count, 2)
+        self.assertEqual(order.total_quantity, 3)
+
+    def test_active_order_count_follows_transitions(self):
+        """active_order_count sube al crear y baja al entregar o cancelar"""
+        first = self.order_with_lines(1)
+        second = self.order_with_lines(1)
+        self.assignment.refresh_from_db()
+        self.assertEqual(self.assignment.active_order_count, 2)
+
+        self.client.force_authenticate(user=self.staff_user)
+        self.client.post(f'/api/orders/{first.id}/cancel/', {}, format='json')
+        self.assignment.refresh_from_db()
+        self.assertEqual(self.assignment.active_order_count, 1)
+        self.assertTrue(self.assignment.can_patient_order)
+
+        self.client.patch(f'/api/orders/{second.id}/status/', {'to_status': 'DELIVERED'}, format='json')
+        self.assignment.refresh_from_db()
+        self.assertEqual(self.assignment.active_order_count, 0)
+        self.assertFalse(self.assignment.can_patient_order)
+
+
+class OrderStatusCounterTests(KioskOrderTestCase):
+    """Tests para los contadores de estado usados por el dashboard"""
+
+    def setUp(self):
+        super().setUp()
+        self.order_ids = [self.place_order() for _ in range(3)]
+        self.client.force_authenticate(user=self.staff_user)
+
+    def stored_counts(self):
+        return {counter: count for counter, count in stored_counts().items() if count}
+
+    def test_counters_follow_create_and_transitions(self):
+        """Los contadores coinciden con la tabla de ordenes tras crear y transicionar"""
+        self.client.patch(f'/api/orders/{self.order_ids[0]}/status/', {'to_status': 'PREPARING'}, format='json')
+        self.client.post(f'/api/orders/{self.order_ids[1]}/cancel/', {}, format='json')
+        self.assertEqual(self.stored_counts(), compute_counts())
+        self.assertEqual(self.stored_counts()[('ROOM', str(self.room.id), 'PLACED')], 1)
+
+    def test_dashboard_reads_counters(self):
+        """El dashboard usa los contadores para el panel de ordenes"""
+        self.client.post(f'/api/orders/{self.order_ids[0]}/cancel/', {}, format='json')
+        response = self.client.get('/api/orders/dashboard/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['orders']['by_status'], {'PLACED': 2, 'CANCELLED': 1})
+        self.assertEqual(response.data['orders']['active_count'], 2)
+        self.assertEqual(sum(row['count'] for row in response.data['orders']['last_24h']), 3)
+        self.assertEqual(response.data['rooms']['occupied'][0]['order_count'], 2)
+
+    def test_dashboard_hours_are_local_over_the_last_24h(self):
+        """El panel por hora agrupa en la zona horaria actual y solo cubre las ultimas 24 horas"""
+        now = timezone.now()
+        placed = [now - timedelta(hours=24) + timedelta(minutes=1), now - timedelta(hours=2), now - timedelta(hours=30)]
+        for order_id, placed_at in zip(self.order_ids, placed):
+            Order.objects.filter(id=order_id).update(placed_at=placed_at)
+        rebuild_counters()
+
+        with timezone.override('America/Mexico_City'):
+            response = self.client.get('/api/orders/dashboard/stats/')
+            expected = [
+                timezone.localtime(placed_at).replace(minute=0, second=0, microsecond=0).isoformat()
+                for placed_at in placed[:2]
+            ]
+
+        self.assertEqual(response.status_code, 200)
+        rows = response.data['orders']['last_24h']
+        self.assertEqual([row['hour'].isoformat() for row in rows], expected)
+        self.assertEqual([row['count'] for row in rows], [1, 1])
+        self.assertTrue(all(row['hour'].utcoffset() == timedelta(hours=-6) for row in rows))
+
+    @override_settings(ORDER_COUNTER_SHARDS=4)
+    def test_writers_use_sharded_rows_without_row_locks(self):
+        """Los contadores se reparten en filas por shard y se actualizan sin SELECT FOR UPDATE"""
+        rebuild_counters()  # Folds the rows written in setUp into shard 0
+        with CaptureQueriesContext(connection) as ctx:
+            for _ in range(2):
+                self.place_order()
+        self.assertFalse([
+            q for q in ctx.captured_queries
+            if 'orders_orderstatuscounter' in q['sql'] and 'FOR UPDATE' in q['sql']
+        ])
+        self.assertLessEqual(set(OrderStatusCounter.objects.values_list('shard', flat=True)), {0, 1, 2, 3})
+        self.assertEqual(self.stored_counts(), compute_counts())
+        self.assertEqual(get_counts('GLOBAL'), {'': {'PLACED': 5}})
+
+    def test_reconcile_command_rebuilds_counters(self):
+        """reconcile_order_counters corrige contadores desincronizados"""
+        OrderStatusCounter.objects.filter(scope='GLOBAL', status='PLACED').update(count=99)
+        call_command('reconcile_order_counters', stdout=mock.MagicMock())
+        self.assertEqual(self.stored_counts(), compute_counts())
+
+
+class OrderArchiveTests(KioskOrderTestCase):
+    """Tests para el archivado de ordenes antiguas"""
+
+    def setUp(self):
+        super().setUp()
+        self.order_ids = [self.place_order() for _ in range(3)]
+        self.client.force_authenticate(user=self.staff_user)
+        self.client.patch(f'/api/orders/{self.order_ids[0]}/status/', {'to_status': 'DELIVERED'}, format='json')
+        self.client.post(f'/api/orders/{self.order_ids[1]}/cancel/', {}, format='json')
+        self.old_date = timezone.now() - timedelta(days=120)
+        Order.objects.update(placed_at=self.old_date)
+
+    def test_archive_moves_only_old_finished_orders(self):
+        """Solo se archivan ordenes entregadas/canceladas antiguas, con sus filas"""
+        call_command('archive_orders', days=90, batch_size=1, stdout=mock.MagicMock())
+
+        self.assertEqual(list(Order.objects.values_list('id', flat=True)), [self.order_ids[2]])
+        self.assertEqual(set(ArchivedOrder.objects.values_list('id', flat=True)), set(self.order_ids[:2]))
+        self.assertEqual(ArchivedOrderItem.objects.count(), 2)
+        self.assertEqual(ArchivedOrderStatusEvent.objects.filter(to_status='DELIVERED').count(), 1)
+        self.assertEqual(
+            ArchivedInventoryMovement.objects.filter(order_id=self.order_ids[0]).count(),
+            2  # RESERVE + CONSUME
+        )
+        self.assertFalse(InventoryMovement.objects.filter(order_id__in=self.order_ids[:2]).exists())
+        self.assertFalse(OrderItem.objects.filter(order_id__in=self.order_ids[:2]).exists())
+
+    def test_recent_orders_are_not_archived(self):
+        """Las ordenes mas nuevas que el limite se quedan en las tablas activas"""
+        call_command('archive_orders', days=200, stdout=mock.MagicMock())
+        self.assertEqual(Order.objects.count(), 3)
+        self.assertEqual(ArchivedOrder.objects.count(), 0)
+
+    def test_read_paths_include_archived_orders(self):
+        """Historial del paciente, reportes y contadores incluyen ordenes archivadas"""
+        call_command('archive_orders', days=90, stdout=mock.MagicMock())
+
+        response = self.client.get(f'/api/clinic/patients/{self.patient.id}/orders/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual({o['id'] for o in response.data['orders']}, set(self.order_ids))
+        delivered = next(o for o in response.data['orders'] if o['id'] == self.order_ids[0])
+        self.assertEqual(len(delivered['items']), 1)
+
+        day = self.old_date.date().isoformat()
+        response = self.client.get('/api/reports/orders/daily/', {'from': day, 'to': day})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_orders'], 3)
+        self.assertEqual(response.data['status_breakdown']['delivered'], 1)
+        self.assertEqual(response.data['status_breakdown']['cancelled'], 1)
+
+        response = self.client.get('/api/reports/products/top/', {'from': day, 'to': day})
+        self.assertEqual(response.data['products'][0]['total_quantity'], 1)
+
+        self.assertEqual(
+            {k: v for k, v in compute_counts().items() if k[0] == 'GLOBAL'},
+            {('GLOBAL', '', 'PLACED'): 1, ('GLOBAL', '', 'DELIVERED'): 1, ('GLOBAL', '', 'CANCELLED'): 1}
+        )
+
+
+class OrderQueueReadModelTests(KioskOrderTestCase):
+    """Tests para el modelo de lectura en memoria de la cola de ordenes"""
+
+    def setUp(self):
+        super().setUp()
+        self.order_ids = [self.place_order() for _ in range(3)]
+        self.client.force_authenticate(user=self.staff_user)
+        self.read_model = OrderQueueReadModel(resync_grace=0)
+        self.read_model.hydrate()
+
+    def staff_events(self):
+        return [e.payload for e in OutboxEvent.objects.filter(group='staff_orders').order_by('id')]
+
+    @skipUnless(connection.vendor == 'postgresql', 'Queue versions come from a PostgreSQL sequence')
+    def test_events_carry_consecutive_versions(self):
+        """Los eventos de staff_orders llevan versiones consecutivas"""
+        self.client.patch(f'/api/orders/{self.order_ids[0]}/status/', {'to_status': 'PREPARING'}, format='json')
+        events = self.staff_events()
+        self.assertEqual([e['type'] for e in events], ['new_order'] * 3 + ['order_updated'])
+        versions = [e['queue_version'] for e in events]
+        self.assertEqual(versions, list(range(versions[0], versions[0] + 4)))
+
+    def test_events_keep_read_model_current(self):
+        """El modelo de lectura se actualiza con los eventos de cambio de estado"""
+        self.assertEqual([e['id'] for e in self.read_model.query(['PLACED'])], self.order_ids[::-1])
+
+        self.client.patch(f'/api/orders/{self.order_ids[0]}/status/', {'to_status': 'PREPARING'}, format='json')
+        self.client.post(f'/api/orders/{self.order_ids[1]}/cancel/', {}, format='json')
+        for event in self.staff_events()[3:]:
+            self.read_model.refresh(self.read_model.apply_event(event))
+
+        self.assertEqual([e['id'] for e in self.read_model.query(['PLACED'])], [self.order_ids[2]])
+        self.assertEqual([e['id'] for e in self.read_model.query(['PREPARING'])], [self.order_ids[0]])
+        self.assertEqual(len(self.read_model.query(['PLACED', 'PREPARING'], room_id=self.room.id)), 2)
+        self.assertFalse(self.read_model.needs_resync())
+
+    @skipUnless(connection.vendor == 'postgresql', 'Queue versions come from a PostgreSQL sequence')
+    def test_missing_version_triggers_resync(self):
+        """Un evento perdido (salto de version) obliga a resincronizar"""
+        self.client.patch(f'/api/orders/{self.order_ids[0]}/status/', {'to_status': 'PREPARING'}, format='json')
+        self.client.patch(f'/api/orders/{self.order_ids[1]}/status/', {'to_status': 'PREPARING'}, format='json')
+        lost, received = self.staff_events()[3:]
+        self.read_model.refresh(self.read_model.apply_event(received))
+        self.assertTrue(self.read_model.needs_resync())
+
+        self.read_model.hydrate()
+        self.assertFalse(self.read_model.needs_resync())
+        self.assertEqual(len(self.read_model.query(['PREPARING'])), 2)
+
+    def test_queue_served_from_read_model_without_order_queries(self):
+        """La cola se sirve desde memoria sin consultar la tabla de ordenes"""
+        expected = self.client.get('/api/orders/queue/').data['results']
+        with mock.patch('orders.views.get_read_model', return_value=self.read_model):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get('/api/orders/queue/')
+            summary = self.client.get('/api/orders/queue/', {'fields': 'id,status'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], expected)
+        self.assertFalse([q for q in ctx.captured_queries if 'orders_order' in q['sql']])
+        self.assertEqual(summary.data['results'][0], {'id': self.order_ids[2], 'placed_at': expected[0]['placed_at'], 'status': 'PLACED'})
+
+
+@override_settings(INVENTORY_RESERVATION_MODE='optimistic')
+class OrderOptimisticReservationTests(KioskOrderTestCase):
+    """Tests para el modo optimista de reserva de inventario"""
+
+    def setUp(self):
+        super().setUp()
+        self.product_2 = Product.objects.create(
+            name='Agua', category=self.category, is_active=True, unit_label='vaso'
+        )
+        InventoryBalance.objects.filter(product=self.product_2).update(on_hand=1)
+
+    def test_reserves_without_row_locks_on_products_or_balances(self):
+        """La reserva usa UPDATE condicional sin SELECT ... FOR UPDATE de productos o balances"""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.create_order(2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(InventoryBalance.objects.get(product=self.product).reserved, 2)
+        self.assertEqual(InventoryMovement.objects.filter(movement_type='RESERVE').count(), 1)
+        locked = [
+            q['sql'] for q in ctx.captured_queries
+            if 'FOR UPDATE' in q['sql'] and ('inventory_inventorybalance' in q['sql'] or 'catalog_product' in q['sql'])
+        ]
+        self.assertEqual(locked, [])
+
+    def test_insufficient_stock_rolls_back_whole_order(self):
+        """Si un producto no alcanza, no se crea la orden ni quedan reservas parciales"""
+        response = self.create_order(items=[(self.product, 2), (self.product_2, 2)])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Insufficient inventory for Agua. Available: 1, Requested: 2', response.data['error'])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(InventoryBalance.objects.get(product=self.product).reserved, 0)
+        self.assertFalse(InventoryMovement.objects.exists())
+
+    def test_product_without_balance_is_rejected_in_both_modes(self):
+        """Un producto sin balance se rechaza por falta de stock en ambos motores"""
+        InventoryBalance.objects.filter(product=self.product_2).delete()
+        for mode in ('optimistic', 'pessimistic'):
+            with self.subTest(mode=mode), override_settings(INVENTORY_RESERVATION_MODE=mode):
+                response = self.create_order(items=[(self.product_2, 1)])
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('Insufficient inventory for Agua. Available: 0, Requested: 1', response.data['error'])
+        self.assertFalse(Order.objects.exists())
+
+    def test_staff_order_uses_optimistic_engine(self):
+        """La orden creada por staff tambien reserva con el motor optimista"""
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.post(
+            f'/api/orders/{self.assignment.id}/create-order/',
+            {'items': [{'product_id': self.product_2.id, 'quantity': 5}]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+@override_settings(INVENTORY_STRIPED_RESERVATIONS=True)
+class OrderStripedReservationTests(KioskOrderTestCase):
+    """Tests para los contadores de reserva en franjas (productos muy pedidos)"""
+
+    def setUp(self):
+        super().setUp()
+        call_command('stripe_inventory', products=str(self.product.id), stripes=2, stdout=mock.MagicMock())
+        self.stripe = self.device.id % 2
+        self.client.force_authenticate(user=self.staff_user)
+
+    def create_order(self, quantity):
+        """Orden creada por staff; la franja sale del dispositivo de la asignacion"""
+        return self.client.post(
+            f'/api/orders/{self.assignment.id}/create-order/',
+            {'items': [{'product_id': self.product.id, 'quantity': quantity}]},
+            format='json'
+        )
+
+    def stripes(self):
+        return {s.index: (s.capacity, s.reserved) for s in InventoryStripe.objects.filter(product=self.product)}
+
+    def test_stripes_split_free_stock(self):
+        """Cada franja recibe una parte del stock disponible"""
+        self.assertEqual(self.stripes(), {0: (5, 0), 1: (5, 0)})
+        self.assertEqual(InventoryBalance.objects.get(product=self.product).stripe_count, 2)
+
+    def test_reserves_on_device_stripe_without_balance_lock(self):
+        """La reserva va a la franja del dispositivo sin bloquear el balance"""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.create_order(3)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.stripes()[self.stripe], (5, 3))
+        balance = InventoryBalance.objects.get(product=self.product)
+        self.assertEqual(balance.reserved, 0)
+        self.assertEqual(balance.reserved_total, 3)
+        self.assertEqual(balance.available, 7)
+        self.assertFalse([
+            q['sql'] for q in ctx.captured_queries
+            if 'FOR UPDATE' in q['sql'] and 'inventory_inventorybalance' in q['sql']
+        ])
+
+    def test_balance_list_reads_annotated_stripe_totals(self):
+        """La lista de balances suma las franjas en la misma query, sin una consulta por balance"""
+        self.assertEqual(self.create_order(3).status_code, 201)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/inventory/balances/')
+        self.assertEqual(response.status_code, 200)
+        row = next(r for r in response.data['results'] if r['product'] == self.product.id)
+        self.assertEqual((row['reserved'], row['available']), (3, 7))
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('SELECT "inventory_inventorystripe"')])
+
+    def test_rebalance_moves_capacity_when_stripe_runs_dry(self):
+        """Cuando una franja se agota se mueve capacidad desde las demas"""
+        self.assertEqual(self.create_order(4).status_code, 201)
+        self.assertEqual(self.create_order(4).status_code, 201)
+        self.assertEqual(self.stripes(), {self.stripe: (8, 8), 1 - self.stripe: (2, 0)})
+
+        response = self.create_order(3)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Available: 2, Requested: 3', response.data['error'])
+        self.assertEqual(InventoryBalance.objects.get(product=self.product).reserved_total, 8)
+
+    def test_receipt_is_handed_out_by_rebalance(self):
+        """El stock recibido queda sin asignar hasta que una franja lo necesita"""
+        self.client.post('/api/inventory/stock/receipt', {'product_id': self.product.id, 'quantity': 5}, format='json')
+        self.assertEqual(self.create_order(8).status_code, 201)
+        balance = InventoryBalance.objects.get(product=self.product)
+        self.assertEqual((balance.on_hand, balance.reserved_total), (15, 8))
+        # 3 units came from the receipt, the other 2 stay unallocated
+        self.assertEqual(self.stripes(), {self.stripe: (8, 8), 1 - self.stripe: (5, 0)})
+
+    def test_deliver_and_cancel_update_stripes(self):
+        """Entregar consume stock de la franja y cancelar libera la reserva"""
+        delivered = self.create_order(2).data['order']['id']
+        cancelled = self.create_order(3).data['order']['id']
+        self.client.patch(f'/api/orders/{delivered}/status/', {'to_status': 'DELIVERED'}, format='json')
+        self.client.post(f'/api/orders/{cancelled}/cancel/', {'note': 'Test'}, format='json')
+
+        balance = InventoryBalance.objects.get(product=self.product)
+        self.assertEqual((balance.on_hand, balance.reserved_total), (8, 0))
+        self.assertEqual(self.stripes()[self.stripe], (3, 0))
+        self.assertEqual(
+            sorted(InventoryMovement.objects.values_list('movement_type', flat=True)),
+            ['CONSUME', 'RELEASE', 'RESERVE', 'RESERVE']
+        )
+
+    def test_adjustment_checks_striped_reservations(self):
+        """El ajuste no puede bajar el stock por debajo de lo reservado en las franjas"""
+        self.create_order(4)
+        response = self.client.post('/api/inventory/stock/adjust', {'product_id': self.product.id, 'delta': -7}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/api/inventory/stock/adjust', {'product_id': self.product.id, 'delta': -5}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['balance']['reserved'], 4)
+        self.assertEqual(response.data['balance']['available'], 1)
+        self.assertEqual(sum(capacity for capacity, _ in self.stripes().values()), 5)
+
+    def test_all_products_reads_aggregated_reserved(self):
+        """all_products muestra la reserva total de las franjas"""
+        self.create_order(4)
+        response = self.client.get('/api/inventory/balances/all_products/')
+        row = next(r for r in response.data['results'] if r['id'] == self.product.id)
+        self.assertEqual((row['reserved'], row['available']), (4, 6))
+
+    def test_unstripe_folds_reservations_back(self):
+        """Quitar las franjas devuelve las reservas al balance"""
+        self.create_order(4)
+        call_command('stripe_inventory', products=str(self.product.id), stripes=0, stdout=mock.MagicMock())
+        balance = InventoryBalance.objects.get(product=self.product)
+        self.assertEqual((balance.stripe_count, balance.reserved), (0, 4))
+        self.assertFalse(InventoryStripe.objects.exists())
+
+
+class StaleOrderSweeperTests(KioskOrderTestCase):
+    """Tests para la cancelacion automatica de ordenes estancadas"""
+
+    def setUp(self):
+        super().setUp()
+        self.order_ids = [self.place_order(2) for _ in range(4)]
+        self.client.force_authenticate(user=self.staff_user)
+        self.client.patch(f'/api/orders/{self.order_ids[1]}/status/', {'to_status': 'PREPARING'}, format='json')
+        self.client.patch(f'/api/orders/{self.order_ids[2]}/status/', {'to_status': 'READY'}, format='json')
+        Order.objects.filter(id__in=self.order_ids[:3]).update(updated_at=timezone.now() - timedelta(hours=13))
+        OutboxEvent.objects.all().delete()
+
+    def test_cancels_stale_placed_and_preparing_orders(self):
+        """Se cancelan las ordenes PLACED/PREPARING vencidas y se libera su reserva"""
+        call_command('cancel_stale_orders', minutes=12 * 60, stdout=mock.MagicMock())
+
+        statuses = dict(Order.objects.values_list('id', 'status'))
+        self.assertEqual(
+            [statuses[order_id] for order_id in self.order_ids],
+            ['CANCELLED', 'CANCELLED', 'READY', 'PLACED']
+        )
+        self.assertEqual(InventoryBalance.objects.get(product=self.product).reserved, 4)
+        self.assertEqual(InventoryMovement.objects.filter(movement_type='RELEASE').count(), 2)
+        self.assertEqual(
+            OrderStatusEvent.objects.filter(to_status='CANCELLED', changed_by__isnull=True).count(), 2
+        )
+
+    def test_batch_is_released_with_one_balance_update_and_one_device_broadcast(self):
+        """Un lote actualiza el balance una vez y notifica al dispositivo con un solo mensaje"""
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('cancel_stale_orders', minutes=60, stdout=mock.MagicMock())
+        balance_updates = [
+            q['sql'] for q in ctx.captured_queries
+            if q['sql'].startswith('UPDATE "inventory_inventorybalance"')
+        ]
+        self.assertEqual(len(balance_updates), 1)
+        device_events = OutboxEvent.objects.filter(group=f'device_{self.device.id}')
+        self.assertEqual(device_events.count(), 1)
+        self.assertEqual(device_events.get().payload['type'], 'orders_status_changed')
+
+    def test_small_batches_and_dry_run(self):
+        """Los lotes pequenos cancelan todo; --dry-run solo cuenta"""
+        out = mock.MagicMock()
+        call_command('cancel_stale_orders', minutes=60, dry_run=True, stdout=out)
+        self.assertFalse(Order.objects.filter(status='CANCELLED').exists())
+
+        call_command('cancel_stale_orders', minutes=60, batch_size=1, stdout=mock.MagicMock())
+        self.assertEqual(Order.objects.filter(status='CANCELLED').count(), 2)
+
+
+class OrderLimitPolicyTests(KioskOrderTestCase):
+    """Tests para las politicas de limites compiladas y cacheadas"""
+    order_limits = {'DRINK': 3, 'SNACK': 1}
+
+    def setUp(self):
+        super().setUp()
+        self.snacks = ProductCategory.objects.create(name='Snacks', category_type='SNACK', is_active=True)
+
+    def test_limit_check_uses_cached_category_map(self):
+        """El chequeo de limites no consulta categorias cuando el mapa esta en cache"""
+        category_types()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.create_order(4)
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(response.data['limit_reached'])
+        self.assertEqual((response.data['category_type'], response.data['max_allowed']), ('DRINK', 3))
+        self.assertFalse([q for q in ctx.captured_queries if 'category_type' in q['sql'] and 'catalog_product"."id"' in q['sql'] and 'WHERE' not in q['sql']])
+
+    def test_category_change_invalidates_policy(self):
+        """Cambiar la categoria de un producto invalida el mapa cacheado"""
+        self.assertEqual(category_types()[self.product.id], 'DRINK')
+        self.product.category = self.snacks
+        self.product.save()
+        self.assertEqual(category_types()[self.product.id], 'SNACK')
+        self.assertEqual(self.create_order(2).data['category_type'], 'SNACK')
+
+        self.snacks.category_type = 'DRINK'
+        self.snacks.save()
+        self.assertEqual(self.create_order(2).status_code, 201)
+
+    def test_loaded_products_win_over_stale_map(self):
+        """Un mapa desactualizado de otro proceso no permite superar los limites"""
+        category_types()
+        ProductCategory.objects.filter(id=self.snacks.id).update(category_type='SNACK')
+        Product.objects.filter(id=self.product.id).update(category=self.snacks)  # No signal: the map stays stale
+        self.assertEqual(category_types()[self.product.id], 'DRINK')
+        response = self.create_order(2)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['category_type'], 'SNACK')
+
+    def test_kiosk_reads_limits_and_consumption(self):
+        """El kiosko puede leer sus limites, el mapa de categorias y lo ya consumido"""
+        self.assertEqual(self.create_order(2).status_code, 201)
+        response = self.client.get('/api/public/orders/limits', {'device_uid': self.device.device_uid})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['order_limits'], {'DRINK': 3, 'SNACK': 1})
+        self.assertEqual(response.data['category_types'][self.product.id], 'DRINK')
+        self.assertEqual(response.data['consumed'], {'DRINK': 2})
+
+    def test_limits_endpoint_requires_device(self):
+        """El endpoint de limites exige un dispositivo valido"""
+        self.assertEqual(self.client.get('/api/public/orders/limits').status_code, 400)
+        self.assertEqual(self.client.get('/api/public/orders/limits', {'device_uid': 'nope'}).status_code, 404)
+
+
+class OrderExportTests(KioskOrderTestCase):
+    """Tests para la exportacion en streaming del historial de ordenes"""
+    order_limits = {'DRINK': 10}
+
+    def setUp(self):
+        super().setUp()
+        self.product_2 = Product.objects.create(
+            name='Agua', category=self.category, is_active=True, unit_label='vaso'
+        )
+        InventoryBalance.objects.filter(product=self.product_2).update(on_hand=10)
+        self.order_ids = [
+            self.place_order(items=items)
+            for items in ([(self.product, 1), (self.product_2, 2)], [(self.product, 3)])
+        ]
+        self.client.force_authenticate(user=self.staff_user)
+
+    def export(self, **params):
+        response = self.client.get('/api/orders/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return read_streaming(response).decode()
+
+    def test_streams_asynchronously(self):
+        """Bajo ASGI la respuesta se sirve con un iterador asincrono, sin acumularla en memoria"""
+        response = self.client.get('/api/orders/export/')
+        self.assertTrue(response.is_async)
+        with warnings.catch_warnings():
+            # Django warns when it has to collect a synchronous iterator into a list
+            warnings.simplefilter('error')
+            body = read_streaming(response).decode()
+        self.assertEqual(len(body.strip().splitlines()), 4)
+
+    def test_csv_has_one_row_per_item(self):
+        """El CSV tiene una fila por item con los datos de la orden"""
+        lines = self.export().strip().splitlines()
+        self.assertTrue(lines[0].startswith('order_id,status,placed_at'))
+        self.assertEqual(len(lines), 4)
+        self.assertIn(f'{self.order_ids[1]},PLACED,', lines[3])
+        self.assertIn(',Agua,', lines[2])
+
+    def test_ndjson_includes_archived_orders(self):
+        """NDJSON incluye las ordenes archivadas junto con las activas"""
+        self.client.post(f'/api/orders/{self.order_ids[0]}/cancel/', {}, format='json')
+        Order.objects.filter(id=self.order_ids[0]).update(placed_at=timezone.now() - timedelta(days=120))
+        call_command('archive_orders', days=90, stdout=mock.MagicMock())
+        self.assertTrue(ArchivedOrder.objects.filter(id=self.order_ids[0]).exists())
+
+        rows = [json.loads(line) for line in self.export(output='ndjson').splitlines()]
+        self.assertEqual([row['order_id'] for row in rows], [self.order_ids[0], self.order_ids[0], self.order_ids[1]])
+        self.assertEqual(rows[0]['status'], 'CANCELLED')
+        self.assertEqual(rows[2]['quantity'], 3)
+
+    def test_filters_by_status_and_date(self):
+        """Los filtros por estado y fecha se aplican"""
+        self.client.post(f'/api/orders/{self.order_ids[0]}/cancel/', {}, format='json')
+        today = timezone.now().date()
+        lines = self.export(status='PLACED', **{'from': today.isoformat()}).strip().splitlines()
+        self.assertEqual(len(lines), 2)
+        lines = self.export(to=(today - timedelta(days=1)).isoformat()).strip().splitlines()
+        self.assertEqual(len(lines), 1)
+
+    def test_invalid_parameters(self):
+        """Formato o fechas invalidas devuelven 400"""
+        self.assertEqual(self.client.get('/api/orders/export/', {'output': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/orders/export/', {'from': 'ayer'}).status_code, 400)
+
+
+@override_settings(
+    ORDER_ADMISSION_MAX_IN_FLIGHT=1,
+    ORDER_ADMISSION_MAX_QUEUE=1,
+    ORDER_ADMISSION_MAX_WAIT=0.05,
+    ORDER_ADMISSION_RETRY_AFTER=3
+)
+class OrderAdmissionControlTests(KioskOrderTestCase):
+    """Tests para el control de admision al crear ordenes"""
+
+    def setUp(self):
+        super().setUp()
+        self.controller = AdmissionController('test')
+        for target in ('orders.admission.order_admission', 'orders.views.order_admission'):
+            patcher = mock.patch(target, self.controller)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_admitted_request_releases_its_slot(self):
+        """Una orden admitida libera su lugar al terminar"""
+        self.assertEqual(self.create_order().status_code, 201)
+        self.assertEqual((self.controller.in_flight, self.controller.admitted), (0, 1))
+
+    def test_queued_request_times_out_with_503(self):
+        """Si no se libera un lugar antes del plazo, se responde 503 con Retry-After"""
+        self.assertTrue(self.controller.acquire())
+        response = self.create_order()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '3')
+        self.assertEqual(self.controller.timed_out, 1)
+        self.assertFalse(Order.objects.exists())
+
+    def test_full_queue_sheds_immediately(self):
+        """Con la cola llena, la solicitud se rechaza sin esperar"""
+        self.assertTrue(self.controller.acquire())
+        self.controller.queued = 1
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.post(
+            f'/api/orders/{self.assignment.id}/create-order/',
+            {'items': [{'product_id': self.product.id, 'quantity': 1}]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.controller.rejected, 1)
+
+    def test_waiting_request_is_admitted_when_slot_frees(self):
+        """Una solicitud en cola entra cuando se libera un lugar"""
+        self.assertTrue(self.controller.acquire())
+        timer = threading.Timer(0.01, self.controller.release)
+        timer.start()
+        with override_settings(ORDER_ADMISSION_MAX_WAIT=2.0):
+            self.assertTrue(self.controller.acquire())
+        timer.join()
+        self.assertEqual(self.controller.admitted, 2)
+        self.assertGreater(self.controller.snapshot()['max_wait_ms'], 0)
+
+    def test_metrics_endpoint(self):
+        """Las metricas de admision se exponen a staff"""
+        self.create_order()
+        self.client.force_authenticate(user=self.staff_user)
+        response = self.client.get('/api/orders/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['admission']['admitted'], 1)
+        self.assertEqual(response.data['admission']['max_in_flight'], 1)
+
+
+class _Deadlock(Exception):
+    pgcode = '40P01'
+
+
+def _deadlock_error():
+    error = OperationalError('deadlock detected')
+    error.__cause__ = _Deadlock()
+    return error
+
+
+@override_settings(
+    DB_RETRY_BACKOFF=0,
+    DB_CONTENTION_THRESHOLD_MS=0,
+    DB_LOCK_TIMEOUT_MS_BY_ENDPOINT={'stock_receipt': 750}
+)
+class TransactionRetryTests(KioskOrderTestCase):
+    """Tests para los reintentos ante deadlocks y las metricas de contencion"""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('orders.contention.contention_stats', ContentionStats())
+        self.stats = patcher.start()
+        self.addCleanup(patcher.stop)
+        views_patcher = mock.patch('orders.views.contention_stats', self.stats)
+        views_patcher.start()
+        self.addCleanup(views_patcher.stop)
+
+    def test_deadlock_is_retried(self):
+        """Un deadlock se reintenta y la orden se crea una sola vez"""
+        attempts = []
+
+        def deadlock_once(*args, **kwargs):
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise _deadlock_error()
+            return run_hooks(*args, **kwargs)
+
+        with mock.patch('orders.views.run_hooks', side_effect=deadlock_once):
+            response = self.create_order()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.stats.snapshot()['endpoints']['order_create']['retries'], 1)
+
+    def test_gives_up_with_503_after_max_attempts(self):
+        """Tras agotar los intentos se responde 503 en lugar de 500"""
+        with mock.patch('orders.views.run_hooks', side_effect=_deadlock_error()):
+            response = self.create_order()
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        stats = self.stats.snapshot()['endpoints']['order_create']
+        self.assertEqual((stats['retries'], stats['failures']), (2, 1))
+        self.assertFalse(Order.objects.exists())
+
+    @skipUnless(connection.vendor == 'postgresql', 'lock_timeout and FOR UPDATE are PostgreSQL only')
+    def test_lock_timeout_and_contended_rows_are_recorded(self):
+        """Se fija lock_timeout por endpoint y se registran las filas bloqueadas"""
+        self.client.force_authenticate(user=self.staff_user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/inventory/stock/receipt', {'product_id': self.product.id, 'quantity': 5}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue([q for q in ctx.captured_queries if "set_config('lock_timeout', '750ms'" in q['sql']])
+        self.assertEqual(ctx.captured_queries[-1]['sql'], 'RESET lock_timeout')
+
+        snapshot = self.stats.snapshot()
+        self.assertGreaterEqual(snapshot['endpoints']['stock_receipt']['lock_queries'], 2)
+        keys = [entry['key'] for entry in snapshot['hot_keys']]
+        self.assertIn(f'catalog_product:{self.product.id}', keys)
+
+        response = self.client.get('/api/orders/metrics/')
+        self.assertIn('stock_receipt', response.data['contention']['endpoints'])
+
+
+class PrepSummaryTests(KioskOrderTestCase):
+    """Tests para el resumen de preparacion por producto y habitacion"""
+    order_limits = {'DRINK': 10}
+
+    def setUp(self):
+        super().setUp()
+        self.product_2 = Product.objects.create(
+            name='Agua', category=self.category, is_active=True, unit_label='vaso'
+        )
+        InventoryBalance.objects.filter(product=self.product_2).update(on_hand=10)
+        self.order_ids = [
+            self.place_order(items=items)
+            for items in ([(self.product, 1), (self.product_2, 2)], [(self.product, 3)])
+        ]
+        self.client.force_authenticate(user=self.staff_user)
+
+    def summary(self, **params):
+        response = self.client.get('/api/orders/prep-summary/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def last_staff_event(self):
+        return OutboxEvent.objects.filter(group='staff_orders').latest('id').payload
+
+    def test_summary_by_product_and_room(self):
+        """El resumen suma las cantidades abiertas por producto y por habitacion en una query"""
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.summary()
+        self.assertEqual(len([q for q in ctx.captured_queries if 'orders_orderitem' in q['sql']]), 1)
+
+        products = {row['product_id']: row for row in data['products']}
+        self.assertEqual(products[self.product.id]['quantity'], 4)
+        self.assertEqual(products[self.product.id]['orders'], 2)
+        self.assertEqual(products[self.product_2.id]['quantity'], 2)
+        self.assertEqual(data['total_quantity'], 6)
+        self.assertEqual(data['products'][0]['product_id'], self.product.id)
+        self.assertEqual(len(data['rooms']), 1)
+        self.assertEqual(data['rooms'][0]['room_code'], self.room.code)
+        self.assertEqual(data['rooms'][0]['quantity'], 6)
+
+    def test_ready_and_closed_orders_are_excluded(self):
+        """Las ordenes listas, entregadas o canceladas no cuentan por defecto"""
+        self.client.patch(f'/api/orders/{self.order_ids[0]}/status/', {'to_status': 'READY'}, format='json')
+        self.client.post(f'/api/orders/{self.order_ids[1]}/cancel/', {}, format='json')
+        self.assertEqual(self.summary()['products'], [])
+
+        data = self.summary(status='PLACED,PREPARING,READY')
+        self.assertEqual({row['product_id']: row['quantity'] for row in data['products']}, {
+            self.product.id: 1, self.product_2.id: 2
+        })
+        self.assertEqual(self.client.get('/api/orders/prep-summary/', {'status': 'DELIVERED'}).status_code, 400)
+
+    def test_order_events_carry_deltas(self):
+        """Crear y cambiar el estado de ordenes envia los deltas del resumen"""
+        delta = self.last_staff_event()['prep_delta']
+        self.assertEqual(delta['products'], [{'product_id': self.product.id, 'quantity': 3, 'orders': 1}])
+        self.assertEqual(delta['rooms'], [{'room_id': self.room.id, 'product_id': self.product.id, 'quantity': 3}])
+
+        # PLACED -> PREPARING stays in the summary: no delta
+        self.client.patch(f'/api/orders/{self.order_ids[0]}/status/', {'to_status': 'PREPARING'}, format='json')
+        self.assertNotIn('prep_delta', self.last_staff_event())
+
+        self.client.post('/api/orders/bulk-status/', {
+            'order_ids': self.order_ids, 'to_status': 'READY'
+        }, format='json')
+        delta = self.last_staff_event()['prep_delta']
+        self.assertEqual(delta['products'], [
+            {'product_id': self.product.id, 'quantity': -4, 'orders': -2},
+            {'product_id': self.product_2.id, 'quantity': -2, 'orders': -1},
+        ])
+        self.assertEqual(self.summary()['products'], [])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class KioskOrderConsumerTests(TestCase):
+    """Tests para el WebSocket del kiosco"""
+
+    def setUp(self):
+        self.device = create_test_data()['device']
+
+    def test_status_events_are_delivered_without_closing_the_socket(self):
+        """Un cambio de estado y un cambio en lote llegan al mismo socket del kiosco"""
+        async def run():
+            communicator = WebsocketCommunicator(
+                KioskOrderConsumer.as_asgi(), f'/ws/kiosk/orders/?device_uid={self.device.device_uid}'
+            )
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            group = f'device_{self.device.id}'
+            channel_layer = get_channel_layer()
+            await channel_layer.group_send(group, {
+                'type': 'order_status_changed', 'order_id': 1, 'status': 'PREPARING', 'from_status': 'PLACED'
+            })
+            await channel_layer.group_send(group, {
+                'type': 'orders_status_changed',
+                'orders': [{'order_id': 2, 'status': 'READY', 'from_status': 'PREPARING'}]
+            })
+            first = await communicator.receive_json_from()
+            second = await communicator.receive_json_from()
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.disconnect()
+            return first, second
+
+        first, second = async_to_sync(run)()
+        self.assertEqual((first['type'], first['order_id'], first['status']), ('order_status_changed', 1, 'PREPARING'))
+        self.assertEqual((second['type'], second['order_id'], second['status']), ('order_status_changed', 2, 'READY'))
@@ -1,31 +1,84 @@
 import logging
+from datetime import date
 
-from django.db import transaction
+from django.db import IntegrityError, OperationalError, transaction
+from django.http import StreamingHttpResponse
+from django.db.models import F, prefetch_related_objects
 from django.utils import timezone
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from accounts.permissions import IsStaffOrAdmin
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
 
 logger = logging.getLogger(__name__)
 
+from .admission import admission_controlled, order_admission
+from .contention import contention_stats, transactional_retry
 from .models import Order, OrderItem, OrderStatusEvent
+from .outbox import enqueue_broadcast
+from .pagination import OrderCursorPagination
+from .prep import PREP_STATUSES, prep_summary, transition_prep_delta
+from .queue import QUEUE_STATUSES, broadcast_queue_event, current_queue_version, get_read_model
+from .state_machine import lock_orders, run_hooks, transition_orders
+from .idempotency import (
+    get_idempotency_key, find_key, remember_key, request_hash, store_response, replay_response
+)
+from .export import FORMATS, STREAMERS, export_rows
+from .limits import compile_policy, consumption
 from catalog.models import Product
 from clinic.models import Device, PatientAssignment
-from inventory.models import InventoryBalance, InventoryMovement
+from inventory.services import OPTIMISTIC, InsufficientStock, ensure_balances, lock_balances, reservation_mode
+from inventory.striping import striped_products
 from .serializers import (
     OrderSerializer,
+    OrderSummarySerializer,
     PublicOrderSerializer,
     CreateOrderSerializer,
     OrderStatusChangeSerializer,
     OrderCancelSerializer,
+    OrderBulkStatusChangeSerializer,
     StaffCreateOrderSerializer
 )
 
 
+def _create_order_items(order, items_data, products):
+    """
+    Bulk-insert the order items (one per cart line)
+    """
+    OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order,
+            product=products[item_data['product_id']],
+            quantity=int(item_data['quantity']),
+            unit_label=products[item_data['product_id']].unit_label  # Snapshot unit_label
+        )
+        for item_data in items_data
+    ])
+
+
+def _prefetch_items(order, products):
+    """
+    Load the items of a new order for the response, reusing the resolved products
+    """
+    prefetch_related_objects([order], 'items')
+    for item in order.items.all():
+        item.product = products[item.product_id]
+
+
+def _lock_products(product_ids):
+    """
+    Lock the active products of a cart in id order (the objects themselves come
+    from the serializer's resolution); raises Product.DoesNotExist if one was
+    deactivated in the meantime
+    """
+    locked = set(Product.objects.select_for_update().filter(
+        id__in=product_ids, is_active=True
+    ).order_by('id').values_list('id', flat=True))
+    if len(locked) != len(set(product_ids)):
+        raise Product.DoesNotExist()
+
+
 class PublicOrderViewSet(viewsets.ViewSet):
     """
     Public ViewSet for orders (Kiosk/iPad)
@@ -34,10 +87,14 @@ class PublicOrderViewSet(viewsets.ViewSet):
     permission_classes = [AllowAny]
 
     @action(detail=False, methods=['post'], url_path='create')
+    @admission_controlled
+    @transactional_retry('order_create')
     def create_order(self, request):
         """
         Create a new order from kiosk
         POST /api/public/orders/create
+        Optional header: Idempotency-Key (or "client_request_id" in the body)
+        replays the original response for retried requests
         {
             "device_uid": "ipad-room-101",
             "items": [
@@ -53,13 +110,39 @@ class PublicOrderViewSet(viewsets.ViewSet):
         device_uid = serializer.validated_data['device_uid']
         items_data = serializer.validated_data['items']
 
+        # Aggregate requested quantities per product (a cart may repeat a product)
+        quantities = {}
+        for item_data in items_data:
+            quantities[item_data['product_id']] = quantities.get(item_data['product_id'], 0) + int(item_data['quantity'])
+
+        # Replay retried requests without touching the order locks
+        idempotency_key = get_idempotency_key(request, serializer.validated_data)
+        fingerprint = request_hash(quantities) if idempotency_key else ''
+        if idempotency_key:
+            stored_key = find_key(device_uid, idempotency_key)
+            if stored_key:
+                return replay_response(stored_key, request, fingerprint)
+        stored_key = None
+
+        # Sort product IDs to acquire locks in deterministic order (avoid deadlocks)
+        product_ids = sorted(quantities)
+        products = serializer.resolution.products
+        optimistic = reservation_mode() == OPTIMISTIC
+
         try:
             with transaction.atomic():
-                # Get device and validate it's active
-                device = Device.objects.select_for_update().get(device_uid=device_uid, is_active=True)
+                # Lock the device resolved by the serializer and validate it's active
+                device = serializer.resolution.device
+                if not Device.objects.select_for_update().filter(pk=device.pk, is_active=True).values_list('pk', flat=True).first():
+                    raise Device.DoesNotExist()
+
+                # Re-check under the device lock: a concurrent retry may have just committed
+                if idempotency_key:
+                    stored_key = find_key(device_uid, idempotency_key)
+                    if stored_key:
+                        return replay_response(stored_key, request, fingerprint)
 
                 # Get active patient assignment for this device
-                from clinic.models import PatientAssignment
                 patient_assignment = PatientAssignment.objects.filter(
                     device=device,
                     is_active=True
@@ -82,95 +165,46 @@ class PublicOrderViewSet(viewsets.ViewSet):
                 device.last_seen_at = timezone.now()
                 device.save(update_fields=['last_seen_at'])
 
-                # VALIDATE ORDER LIMITS BY CATEGORY TYPE
-                order_limits = patient_assignment.order_limits or {}
-                category_counts = {}
+                # Products were loaded by the serializer; the pessimistic engine locks them in sorted order
+                if not optimistic:
+                    _lock_products(product_ids)
 
-                # Count items by category type
-                for item_data in items_data:
-                    product = Product.objects.select_related('category').get(
-                        id=item_data['product_id'],
-                        is_active=True
-                    )
-                    category_type = product.category.category_type
-                    if category_type not in category_counts:
-                        category_counts[category_type] = 0
-                    category_counts[category_type] += item_data['quantity']
-
-                # Check against limits
-                for category_type, count in category_counts.items():
-                    max_allowed = order_limits.get(category_type, 999)  # 999 = no limit
-                    if count > max_allowed:
-                        category_label = {
-                            'DRINK': 'bebidas',
-                            'SNACK': 'snacks',
-                            'OTHER': 'productos'
-                        }.get(category_type, 'productos')
-
-                        return Response({
-                            'error': f'Has alcanzado tu límite de {category_label}. Máximo permitido: {max_allowed}',
-                            'limit_reached': True,
-                            'category_type': category_type,
-                            'max_allowed': max_allowed,
-                            'requested': count
-                        }, status=status.HTTP_400_BAD_REQUEST)
-
-                # Sort product IDs to acquire locks in deterministic order (avoid deadlocks)
-                product_ids = sorted(set([item['product_id'] for item in items_data]))
-
-                # Acquire locks on all products in sorted order
-                products = {
-                    p.id: p
-                    for p in Product.objects.select_for_update().filter(
-                        id__in=product_ids, is_active=True
-                    ).select_related('category')
-                }
-
-                # Validate all requested products exist and are active
-                for pid in product_ids:
-                    if pid not in products:
-                        raise Product.DoesNotExist()
-
-                # Acquire locks on all inventory balances in sorted order
-                balances = {
-                    b.product_id: b
-                    for b in InventoryBalance.objects.select_for_update().filter(
-                        product_id__in=product_ids
-                    )
-                }
-
-                # Ensure balances exist for all products (create if missing)
-                for pid in product_ids:
-                    if pid not in balances:
-                        balance, _ = InventoryBalance.objects.select_for_update().get_or_create(
-                            product=products[pid],
-                            defaults={'on_hand': 0, 'reserved': 0}
-                        )
-                        balances[pid] = balance
-
-                # Validate inventory availability for all items INSIDE the lock
-                inventory_checks = []
-                for item_data in items_data:
-                    product = products[item_data['product_id']]
-                    balance = balances[item_data['product_id']]
-                    requested_qty = item_data['quantity']
-
-                    available = balance.on_hand - balance.reserved
-                    if available < requested_qty:
-                        return Response({
-                            'error': f'Insufficient inventory for {product.name}. Available: {available}, Requested: {requested_qty}'
-                        }, status=status.HTTP_400_BAD_REQUEST)
-
-                    inventory_checks.append({
-                        'product': product,
-                        'balance': balance,
-                        'quantity': requested_qty
-                    })
-
-                # Reserve inventory INSIDE the same atomic block
-                for check in inventory_checks:
-                    check['balance'].reserved += check['quantity']
-                    check['balance'].save(update_fields=['reserved', 'updated_at'])
+                # VALIDATE ORDER LIMITS BY CATEGORY TYPE (compiled policy, no queries)
+                violation = compile_policy(patient_assignment).check(quantities, products)
+                if violation:
+                    return Response({
+                        'error': violation.message,
+                        'limit_reached': True,
+                        'category_type': violation.category_type,
+                        'max_allowed': violation.max_allowed,
+                        'requested': violation.requested
+                    }, status=status.HTTP_400_BAD_REQUEST)
+
+                # Optimistic mode: availability is checked by the conditional
+                # UPDATEs of run_hooks() below (InsufficientStock), no balance locks;
+                # products without a balance get an empty one so they are rejected
+                # like in pessimistic mode
+                if optimistic:
+                    ensure_balances(product_ids)
+                else:
+                    # Acquire locks on all inventory balances in sorted order
+                    # (striped products reserve on their stripes in run_hooks())
+                    striped = striped_products(product_ids)
+                    balances = lock_balances([pid for pid in product_ids if pid not in striped])
+
+                    # Ensure balances exist for all products (create if missing)
+                    missing = [pid for pid in product_ids if pid not in balances and pid not in striped]
+                    if missing:
+                        ensure_balances(missing)
+                        balances.update(lock_balances(missing))
+
+                    # Validate inventory availability for all products INSIDE the lock
+                    for pid in balances:
+                        available = balances[pid].on_hand - balances[pid].reserved
+                        if available < quantities[pid]:
+                            return Response({
+                                'error': f'Insufficient inventory for {products[pid].name}. Available: {available}, Requested: {quantities[pid]}'
+                            }, status=status.HTTP_400_BAD_REQUEST)
 
                 # Create order
                 order = Order.objects.create(
@@ -178,30 +212,18 @@ class PublicOrderViewSet(viewsets.ViewSet):
                     patient_assignment=patient_assignment,
                     patient=patient_assignment.patient,
                     room=patient_assignment.room,
-                    status='PLACED'
+                    status='PLACED',
+                    item_count=len(items_data),
+                    total_quantity=sum(quantities.values())
                 )
 
-                # Create order items and inventory movements
-                for check in inventory_checks:
-                    product = check['product']
-                    quantity = check['quantity']
-
-                    # Create order item
-                    OrderItem.objects.create(
-                        order=order,
-                        product=product,
-                        quantity=quantity,
-                        unit_label=product.unit_label  # Snapshot unit_label
-                    )
+                if idempotency_key:
+                    stored_key = remember_key(device_uid, idempotency_key, order, fingerprint)
 
-                    # Create inventory movement for reservation
-                    InventoryMovement.objects.create(
-                        product=product,
-                        movement_type='RESERVE',
-                        quantity=quantity,
-                        order=order,
-                        note=f'Reserved for order #{order.id}'
-                    )
+                # Create order items, then reserve inventory INSIDE the same atomic block
+                # (set-based '' -> PLACED hooks: one UPDATE plus bulk RESERVE movements)
+                _create_order_items(order, items_data, products)
+                context = run_hooks('', 'PLACED', [order])
 
                 # Create initial status event
                 OrderStatusEvent.objects.create(
@@ -211,25 +233,43 @@ class PublicOrderViewSet(viewsets.ViewSet):
                     note='Order placed from kiosk'
                 )
 
-                # Broadcast new order to staff via WebSocket
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    'staff_orders',
+                # Broadcast new order to staff via WebSocket (published after commit)
+                broadcast_queue_event(
                     {
                         'type': 'new_order',
                         'order_id': order.id,
                         'room_code': order.room.code if order.room else None,
                         'device_uid': device.device_uid,
                         'placed_at': order.placed_at.isoformat(),
+                        'prep_delta': transition_prep_delta([(order, '', 'PLACED')], [context]),
                     }
                 )
 
-                return Response({
-                    'success': True,
-                    'message': 'Order created successfully',
-                    'order': PublicOrderSerializer(order).data
-                }, status=status.HTTP_201_CREATED)
-
+            # Serialize outside the transaction so row locks are released first
+            _prefetch_items(order, products)
+            response = Response({
+                'success': True,
+                'message': 'Order created successfully',
+                'order': PublicOrderSerializer(order).data
+            }, status=status.HTTP_201_CREATED)
+            if stored_key:
+                store_response(stored_key, response)
+            return response
+
+        except InsufficientStock as exc:
+            # Optimistic reservation failed: the whole order was rolled back
+            return Response({
+                'error': f'Insufficient inventory for {products[exc.product_id].name}. Available: {exc.available}, Requested: {exc.requested}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except IntegrityError:
+            # Another request with the same idempotency key won the race
+            stored_key = find_key(device_uid, idempotency_key) if idempotency_key else None
+            if stored_key:
+                return replay_response(stored_key, request, fingerprint)
+            logger.error('Error creating order from kiosk', exc_info=True)
+            return Response({
+                'error': 'Error interno del servidor. Intente nuevamente.'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         except Device.DoesNotExist:
             return Response({
                 'error': 'Device not found or inactive'
@@ -238,6 +278,8 @@ class PublicOrderViewSet(viewsets.ViewSet):
             return Response({
                 'error': 'Product not found or inactive'
             }, status=status.HTTP_404_NOT_FOUND)
+        except OperationalError:
+            raise  # Retried by @transactional_retry
         except Exception as e:
             logger.error('Error creating order from kiosk', exc_info=True)
             return Response({
@@ -296,6 +338,48 @@ class PublicOrderViewSet(viewsets.ViewSet):
                 'error': 'Error interno del servidor. Intente nuevamente.'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=False, methods=['get'], url_path='limits')
+    def order_limits(self, request):
+        """
+        Order limits of the current patient on this device (read-only), with the
+        product -> category type map and what the patient already ordered, so the
+        kiosk can reject over-limit carts before creating the order
+        GET /api/public/orders/limits?device_uid=ipad-room-101
+        """
+        device_uid = request.query_params.get('device_uid')
+        if not device_uid:
+            return Response({
+                'error': 'device_uid parameter is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            device = Device.objects.get(device_uid=device_uid)
+            assignment = PatientAssignment.objects.filter(device=device, is_active=True).first()
+            if not assignment:
+                return Response({
+                    'error': 'No active patient assigned to this device'
+                }, status=status.HTTP_404_NOT_FOUND)
+
+            policy = compile_policy(assignment)
+            return Response({
+                'success': True,
+                'assignment_id': assignment.id,
+                'can_patient_order': assignment.can_patient_order,
+                'order_limits': policy.limits,
+                'category_types': policy.types,
+                'consumed': consumption(assignment, policy),
+            }, status=status.HTTP_200_OK)
+
+        except Device.DoesNotExist:
+            return Response({
+                'error': 'Device not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            logger.error('Error fetching order limits', exc_info=True)
+            return Response({
+                'error': 'Error interno del servidor. Intente nuevamente.'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
     @action(detail=False, methods=['get'], url_path='by-assignment/(?P<assignment_id>[^/.]+)')
     def orders_by_assignment(self, request, assignment_id=None):
         """
@@ -345,6 +429,7 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
     """
     serializer_class = OrderSerializer
     permission_classes = [IsStaffOrAdmin]
+    pagination_class = OrderCursorPagination
     queryset = Order.objects.all().prefetch_related(
         'items',
         'items__product',
@@ -352,7 +437,40 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
         'assignment',
         'room',
         'patient'
-    ).order_by('-placed_at')
+    ).order_by('-placed_at', '-id')
+
+    # ?view=summary / ?fields=... : ORM expression behind each summary field
+    # (None means the model field of the same name)
+    SUMMARY_FIELDS = {
+        'id': None,
+        'status': None,
+        'room_code': F('room__code'),
+        'device_uid': F('assignment__device_uid'),
+        'patient_name': F('patient__full_name'),
+        'patient_assignment': None,
+        'placed_at': None,
+        'delivered_at': None,
+        'cancelled_at': None,
+        'item_count': None,
+        'total_quantity': None,
+    }
+    # Summary fields computed by the serializer from another column
+    DERIVED_SUMMARY_FIELDS = {'status_display': 'status'}
+
+    def is_summary_view(self):
+        """Whether the compact list representation was requested"""
+        params = self.request.query_params
+        return self.action in ('list', 'order_queue') and (
+            params.get('view') == 'summary' or bool(params.get('fields'))
+        )
+
+    def get_summary_fields(self):
+        """Requested summary fields (all of them for ?view=summary)"""
+        available = list(self.SUMMARY_FIELDS) + list(self.DERIVED_SUMMARY_FIELDS)
+        requested = [f.strip() for f in self.request.query_params.get('fields', '').split(',') if f.strip()]
+        fields = [f for f in requested if f in available] or available
+        # id and placed_at are always needed for the pagination cursor
+        return list(dict.fromkeys(['id', 'placed_at'] + fields))
 
     def get_queryset(self):
         """
@@ -361,7 +479,11 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
         """
         from clinic.models import PatientAssignment
 
-        queryset = super().get_queryset()
+        if self.is_summary_view():
+            # Compact list: no nested prefetches, rows come from .values()
+            queryset = Order.objects.order_by('-placed_at', '-id')
+        else:
+            queryset = super().get_queryset()
 
         # Superusers can see all orders, no filtering needed
         if self.request.user.is_superuser:
@@ -387,11 +509,87 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
 
         return queryset
 
+    def paginate_orders(self, queryset):
+        """
+        Paginate and serialize orders with the full or the summary representation
+        """
+        if self.is_summary_view():
+            fields = self.get_summary_fields()
+            columns = [self.DERIVED_SUMMARY_FIELDS.get(name, name) for name in fields]
+            columns = list(dict.fromkeys(columns))
+            queryset = queryset.values(
+                *[name for name in columns if self.SUMMARY_FIELDS[name] is None],
+                **{name: self.SUMMARY_FIELDS[name] for name in columns if self.SUMMARY_FIELDS[name] is not None}
+            )
+            serializer_class = OrderSummarySerializer
+            context = dict(self.get_serializer_context(), fields=fields)
+        else:
+            serializer_class = self.get_serializer_class()
+            context = self.get_serializer_context()
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = serializer_class(page, many=True, context=context)
+            return self.get_paginated_response(serializer.data)
+        serializer = serializer_class(queryset, many=True, context=context)
+        return Response(serializer.data)
+
+    def list(self, request, *args, **kwargs):
+        """
+        List orders
+        GET /api/orders/?view=summary or ?fields=id,status,room_code,item_count
+        """
+        return self.paginate_orders(self.filter_queryset(self.get_queryset()))
+
+    @action(detail=False, methods=['get'], url_path='metrics')
+    def metrics(self, request):
+        """
+        Load metrics of this server process (order admission control, lock
+        contention and retries per endpoint)
+        GET /api/orders/metrics/
+        """
+        return Response({
+            'admission': order_admission.snapshot(),
+            'contention': contention_stats.snapshot(),
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        """
+        Stream the order history flattened to one row per item (hot and archived orders)
+        GET /api/orders/export/?output=csv|ndjson&from=2026-01-01&to=2026-03-31&status=DELIVERED
+        """
+        output = request.query_params.get('output', 'csv')
+        if output not in STREAMERS:
+            return Response({
+                'error': f"output must be one of: {', '.join(STREAMERS)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        filters = {}
+        for param, lookup in (('from', 'placed_at__date__gte'), ('to', 'placed_at__date__lte')):
+            value = request.query_params.get(param)
+            if value:
+                try:
+                    filters[lookup] = date.fromisoformat(value)
+                except ValueError:
+                    return Response({
+                        'error': f'{param} must be a date (YYYY-MM-DD)'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+        statuses = [s.strip() for s in request.query_params.get('status', '').split(',') if s.strip()]
+        if statuses:
+            filters['status__in'] = statuses
+
+        response = StreamingHttpResponse(STREAMERS[output](export_rows(filters)), content_type=FORMATS[output])
+        response['Content-Disposition'] = f'attachment; filename="orders-{timezone.now():%Y%m%d-%H%M%S}.{output}"'
+        return response
+
     @action(detail=False, methods=['get'], url_path='queue')
     def order_queue(self, request):
         """
         Get orders in queue (PLACED or PREPARING)
         GET /api/orders/queue?status=PLACED,PREPARING&my_orders=true
+        Paginated by cursor: follow "next" for older orders
+        Add view=summary (or fields=id,status,...) for the compact representation
         """
         status_filter = request.query_params.get('status', 'PLACED,PREPARING')
         statuses = [s.strip() for s in status_filter.split(',')]
@@ -403,17 +601,92 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
         if not statuses:
             statuses = ['PLACED', 'PREPARING']
 
+        # First page of open orders: serve from the in-process read model when running
+        response = self.queue_from_read_model(statuses)
+        if response is not None:
+            return response
+
         # Use get_queryset() to apply my_orders filter
         orders = self.get_queryset().filter(status__in=statuses)
 
-        page = self.paginate_queryset(orders)
-        if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(orders, many=True)
-        return Response(serializer.data)
+        return self.paginate_orders(orders)
+
+    @action(detail=False, methods=['get'], url_path='prep-summary')
+    def prep_summary(self, request):
+        """
+        Quantities to prepare per product and per room (orders PLACED or PREPARING)
+        GET /api/orders/prep-summary/?room=<room_id>&status=PLACED,PREPARING,READY
+        Kept current by the prep_summary_delta messages of the staff WebSocket
+        (X-Order-Queue-Version is the last event version the summary includes)
+        """
+        statuses = [s.strip() for s in request.query_params.get('status', '').split(',') if s.strip()]
+        if not statuses:
+            statuses = list(PREP_STATUSES)
+        elif not set(statuses) <= set(QUEUE_STATUSES):
+            return Response({
+                'error': f"status must be one or more of: {', '.join(QUEUE_STATUSES)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        room_id = request.query_params.get('room')
+        if room_id is not None and not room_id.isdigit():
+            return Response({'error': 'room must be a room id'}, status=status.HTTP_400_BAD_REQUEST)
+
+        summary = prep_summary(statuses, room_id=int(room_id) if room_id else None)
+        # Read after the summary: deltas with a higher queue_version are not included in it
+        response = Response(summary)
+        response['X-Order-Queue-Version'] = str(current_queue_version())
+        return response
+
+    def queue_from_read_model(self, statuses):
+        """
+        Build the queue response from the in-process read model (orders/queue.py)
+        Returns None when the database must be used instead: read model not
+        running, closed statuses requested, cursor requested or more than one page
+        """
+        read_model = get_read_model()
+        if read_model is None or self.request.query_params.get('cursor'):
+            return None
+        if not set(statuses) <= set(QUEUE_STATUSES):
+            return None
+
+        filters = {}
+        if not self.request.user.is_superuser and self.request.query_params.get('my_orders') == 'true':
+            active_assignment = PatientAssignment.objects.filter(
+                staff=self.request.user,
+                is_active=True
+            ).first()
+            if not active_assignment:
+                return Response({'next': None, 'previous': None, 'results': []})
+            if not active_assignment.device_id:
+                return None
+            filters = {'assignment_id': active_assignment.device_id, 'patient_id': active_assignment.patient_id}
+
+        entries = read_model.query(statuses, **filters)
+        if len(entries) > self.paginator.get_page_size(self.request):
+            return None
+
+        if self.is_summary_view():
+            fields = self.get_summary_fields()
+            results = [{name: entry['summary'][name] for name in fields} for entry in entries]
+        else:
+            results = [self._absolute_image_urls(entry['data']) for entry in entries]
+
+        response = Response({'next': None, 'previous': None, 'results': results})
+        response['X-Order-Queue-Version'] = str(read_model.version)
+        return response
+
+    def _absolute_image_urls(self, data):
+        """Make the cached (relative) product image URLs absolute for this request"""
+        items = []
+        for item in data['items']:
+            url = item.get('product_image_url')
+            if url and not url.startswith('http'):
+                item = dict(item, product_image_url=self.request.build_absolute_uri(url))
+            items.append(item)
+        return dict(data, items=items)
 
     @action(detail=True, methods=['patch'], url_path='status')
+    @transactional_retry('order_status')
     def change_status(self, request, pk=None):
         """
         Change order status
@@ -432,108 +705,36 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
 
         try:
             with transaction.atomic():
-                order = Order.objects.select_for_update().get(pk=pk)
+                orders = lock_orders([pk])
+                if not orders:
+                    raise Order.DoesNotExist()
+                order = orders[0]
                 from_status = order.status
 
-                # Validate status transition
-                if from_status == 'DELIVERED':
-                    return Response({
-                        'error': 'Cannot change status of delivered order'
-                    }, status=status.HTTP_400_BAD_REQUEST)
-
-                if from_status == 'CANCELLED':
-                    return Response({
-                        'error': 'Cannot change status of cancelled order'
-                    }, status=status.HTTP_400_BAD_REQUEST)
-
-                # If changing to DELIVERED, consume inventory
-                if to_status == 'DELIVERED':
-                    # Get all order items with products
-                    items = order.items.select_related('product').all()
-
-                    for item in items:
-                        # Get inventory balance with lock
-                        balance = InventoryBalance.objects.select_for_update().get(
-                            product=item.product
-                        )
-
-                        # Consume inventory: reserved -= qty, on_hand -= qty
-                        balance.reserved -= item.quantity
-                        balance.on_hand -= item.quantity
-                        balance.save(update_fields=['reserved', 'on_hand', 'updated_at'])
-
-                        # Create inventory movement for consumption
-                        InventoryMovement.objects.create(
-                            product=item.product,
-                            movement_type='CONSUME',
-                            quantity=item.quantity,
-                            order=order,
-                            created_by=request.user if request.user.is_authenticated else None,
-                            note=f'Consumed for order #{order.id} delivery'
-                        )
-
-                    order.delivered_at = timezone.now()
-
-                    # Block patient from creating new orders when order is delivered
-                    # Check if there are any other active orders (PLACED, PREPARING, READY)
-                    from clinic.models import PatientAssignment
-                    if order.patient_assignment:
-                        other_active_orders = Order.objects.filter(
-                            patient_assignment=order.patient_assignment,
-                            status__in=['PLACED', 'PREPARING', 'READY']
-                        ).exclude(id=order.id).exists()
-                        
-                        # Only block patient orders if there are no other active orders
-                        if not other_active_orders:
-                            order.patient_assignment.can_patient_order = False
-                            order.patient_assignment.save(update_fields=['can_patient_order', 'updated_at'])
-
-                # Update order status
-                order.status = to_status
-
-                # Update timestamps
-                if to_status == 'CANCELLED':
-                    order.cancelled_at = timezone.now()
-
-                order.save(update_fields=['status', 'delivered_at', 'cancelled_at', 'updated_at'])
-
-                # Create status event
-                status_event = OrderStatusEvent.objects.create(
-                    order=order,
-                    from_status=from_status,
-                    to_status=to_status,
+                # Validate and apply the transition (inventory, patient lock, event, broadcast)
+                changed, errors = transition_orders(
+                    orders,
+                    to_status,
                     changed_by=request.user if request.user.is_authenticated else None,
                     note=note
                 )
+                if errors:
+                    return Response({
+                        'error': errors[0]['error']
+                    }, status=status.HTTP_400_BAD_REQUEST)
 
-                # Broadcast status change to kiosk via WebSocket
-                if order.assignment:
-                    channel_layer = get_channel_layer()
-                    async_to_sync(channel_layer.group_send)(
-                        f'device_{order.assignment.id}',
-                        {
-                            'type': 'order_status_changed',
-                            'order_id': order.id,
-                            'status': to_status,
-                            'from_status': from_status,
-                            'changed_at': status_event.changed_at.isoformat(),
-                        }
-                    )
-
-                return Response({
-                    'success': True,
-                    'message': f'Order status changed from {from_status} to {to_status}',
-                    'order': OrderSerializer(order).data
-                }, status=status.HTTP_200_OK)
+            return Response({
+                'success': True,
+                'message': f'Order status changed from {from_status} to {to_status}',
+                'order': OrderSerializer(order).data
+            }, status=status.HTTP_200_OK)
 
-        except Order.DoesNotExist:
+        except (Order.DoesNotExist, ValueError):
             return Response({
                 'error': 'Order not found'
             }, status=status.HTTP_404_NOT_FOUND)
-        except InventoryBalance.DoesNotExist:
-            return Response({
-                'error': 'Inventory balance not found for one or more products'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except OperationalError:
+            raise  # Retried by @transactional_retry
         except Exception as e:
             logger.error('Error changing order status', exc_info=True)
             return Response({
@@ -541,6 +742,7 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     @action(detail=True, methods=['post'], url_path='cancel')
+    @transactional_retry('order_cancel')
     def cancel_order(self, request, pk=None):
         """
         Cancel an order
@@ -557,92 +759,107 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
 
         try:
             with transaction.atomic():
-                order = Order.objects.select_for_update().get(pk=pk)
-                from_status = order.status
-
-                # Validate can cancel
-                if from_status == 'DELIVERED':
-                    return Response({
-                        'error': 'Cannot cancel delivered order'
-                    }, status=status.HTTP_400_BAD_REQUEST)
-
-                if from_status == 'CANCELLED':
+                orders = lock_orders([pk])
+                if not orders:
+                    raise Order.DoesNotExist()
+                order = orders[0]
+
+                # Validate and apply the transition (releases reserved inventory)
+                changed, errors = transition_orders(
+                    orders,
+                    'CANCELLED',
+                    changed_by=request.user if request.user.is_authenticated else None,
+                    note=note or 'Order cancelled'
+                )
+                if errors:
                     return Response({
-                        'error': 'Order is already cancelled'
+                        'error': errors[0]['error']
                     }, status=status.HTTP_400_BAD_REQUEST)
 
-                # Release reserved inventory
-                items = order.items.select_related('product').all()
+            return Response({
+                'success': True,
+                'message': 'Order cancelled successfully',
+                'order': OrderSerializer(order).data
+            }, status=status.HTTP_200_OK)
 
-                for item in items:
-                    # Get inventory balance with lock
-                    balance = InventoryBalance.objects.select_for_update().get(
-                        product=item.product
-                    )
+        except (Order.DoesNotExist, ValueError):
+            return Response({
+                'error': 'Order not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        except OperationalError:
+            raise  # Retried by @transactional_retry
+        except Exception as e:
+            logger.error('Error cancelling order', exc_info=True)
+            return Response({
+                'error': 'Error interno del servidor. Intente nuevamente.'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-                    # Release reservation: reserved -= qty
-                    balance.reserved -= item.quantity
-                    balance.save(update_fields=['reserved', 'updated_at'])
-
-                    # Create inventory movement for release
-                    InventoryMovement.objects.create(
-                        product=item.product,
-                        movement_type='RELEASE',
-                        quantity=item.quantity,
-                        order=order,
-                        created_by=request.user if request.user.is_authenticated else None,
-                        note=f'Released from cancelled order #{order.id}'
-                    )
+    @action(detail=False, methods=['post'], url_path='bulk-status')
+    @transactional_retry('order_bulk_status')
+    def bulk_change_status(self, request):
+        """
+        Change the status of several orders in one transaction
+        POST /api/orders/bulk-status
+        {
+            "order_ids": [12, 13, 15],
+            "to_status": "READY",
+            "note": "Batch ready"
+        }
+        Orders that cannot make the transition are skipped and reported in "errors"
+        """
+        serializer = OrderBulkStatusChangeSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-                # Update order status
-                order.status = 'CANCELLED'
-                order.cancelled_at = timezone.now()
-                order.save(update_fields=['status', 'cancelled_at', 'updated_at'])
+        order_ids = sorted(set(serializer.validated_data['order_ids']))
+        to_status = serializer.validated_data['to_status']
+        note = serializer.validated_data.get('note', '')
 
-                # Create status event
-                status_event = OrderStatusEvent.objects.create(
-                    order=order,
-                    from_status=from_status,
-                    to_status='CANCELLED',
+        try:
+            with transaction.atomic():
+                # Lock all orders in sorted order (avoid deadlocks)
+                orders = lock_orders(order_ids)
+
+                found_ids = {order.id for order in orders}
+                not_found = [
+                    {'order_id': order_id, 'error': 'Order not found'}
+                    for order_id in order_ids if order_id not in found_ids
+                ]
+
+                # Validate and apply the transition set-based over all orders
+                changed, errors = transition_orders(
+                    orders,
+                    to_status,
                     changed_by=request.user if request.user.is_authenticated else None,
-                    note=note or 'Order cancelled'
+                    note=note
                 )
+                errors = not_found + errors
 
-                # Broadcast cancellation to kiosk via WebSocket
-                if order.assignment:
-                    channel_layer = get_channel_layer()
-                    async_to_sync(channel_layer.group_send)(
-                        f'device_{order.assignment.id}',
-                        {
-                            'type': 'order_status_changed',
-                            'order_id': order.id,
-                            'status': 'CANCELLED',
-                            'from_status': from_status,
-                            'changed_at': status_event.changed_at.isoformat(),
-                        }
-                    )
-
-                return Response({
-                    'success': True,
-                    'message': 'Order cancelled successfully',
-                    'order': OrderSerializer(order).data
-                }, status=status.HTTP_200_OK)
+                if not changed:
+                    return Response({
+                        'error': 'No orders could be updated',
+                        'errors': errors
+                    }, status=status.HTTP_400_BAD_REQUEST)
 
-        except Order.DoesNotExist:
+            update_ids = [order.id for order, _ in changed]
             return Response({
-                'error': 'Order not found'
-            }, status=status.HTTP_404_NOT_FOUND)
-        except InventoryBalance.DoesNotExist:
-            return Response({
-                'error': 'Inventory balance not found for one or more products'
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                'success': True,
+                'message': f'{len(update_ids)} orders changed to {to_status}',
+                'updated': update_ids,
+                'errors': errors
+            }, status=status.HTTP_200_OK)
+
+        except OperationalError:
+            raise  # Retried by @transactional_retry
         except Exception as e:
-            logger.error('Error cancelling order', exc_info=True)
+            logger.error('Error changing order status in bulk', exc_info=True)
             return Response({
                 'error': 'Error interno del servidor. Intente nuevamente.'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     @action(detail=True, methods=['post'], url_path='create-order')
+    @admission_controlled
+    @transactional_retry('staff_order_create')
     def create_order_for_patient(self, request, pk=None):
         """
         Staff creates an order for their assigned patient (no limits)
@@ -660,10 +877,18 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
 
         items = serializer.validated_data['items']
 
+        # Aggregate requested quantities per product (a cart may repeat a product)
+        quantities = {}
+        for item in items:
+            quantities[item['product_id']] = quantities.get(item['product_id'], 0) + int(item['quantity'])
+
+        # Sort product IDs to acquire locks in deterministic order (avoid deadlocks)
+        product_ids = sorted(quantities)
+        products = serializer.resolution.products
+        optimistic = reservation_mode() == OPTIMISTIC
+
         try:
             with transaction.atomic():
-                from clinic.models import PatientAssignment
-
                 # Get the patient assignment
                 assignment = PatientAssignment.objects.select_related(
                     'patient', 'staff', 'room', 'device'
@@ -681,55 +906,27 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
                         'error': 'You can only create orders for your own assigned patients'
                     }, status=status.HTTP_403_FORBIDDEN)
 
-                # Sort product IDs to acquire locks in deterministic order (avoid deadlocks)
-                product_ids = sorted(set([item['product_id'] for item in items]))
-
-                # Acquire locks on all products in sorted order
-                products = {
-                    p.id: p
-                    for p in Product.objects.select_for_update().filter(
-                        id__in=product_ids, is_active=True
-                    ).select_related('category')
-                }
-
-                # Validate all requested products exist and are active
-                for pid in product_ids:
-                    if pid not in products:
-                        raise Product.DoesNotExist()
-
-                # Acquire locks on all inventory balances in sorted order
-                balances = {
-                    b.product_id: b
-                    for b in InventoryBalance.objects.select_for_update().filter(
-                        product_id__in=product_ids
-                    )
-                }
-
-                # Validate inventory availability INSIDE the lock
-                inventory_checks = []
-                for item in items:
-                    product = products[item['product_id']]
-                    quantity = int(item['quantity'])
-                    balance = balances.get(item['product_id'])
-
-                    if balance:
-                        available = balance.on_hand - balance.reserved
-                        if available < quantity:
-                            return Response({
-                                'error': f'Insufficient inventory for {product.name}. Available: {available}, Requested: {quantity}'
-                            }, status=status.HTTP_400_BAD_REQUEST)
-
-                    inventory_checks.append({
-                        'product': product,
-                        'balance': balance,
-                        'quantity': quantity,
-                    })
-
-                # Reserve inventory INSIDE the same atomic block
-                for check in inventory_checks:
-                    if check['balance']:
-                        check['balance'].reserved += check['quantity']
-                        check['balance'].save(update_fields=['reserved', 'updated_at'])
+                # Products were loaded by the serializer; the pessimistic engine locks them in sorted order
+                if not optimistic:
+                    _lock_products(product_ids)
+
+                # Optimistic mode: availability is checked by the conditional
+                # UPDATEs of run_hooks() below (InsufficientStock), no balance locks
+                if not optimistic:
+                    # Acquire locks on all inventory balances in sorted order
+                    # (striped products reserve on their stripes in run_hooks())
+                    striped = striped_products(product_ids)
+                    balances = lock_balances([pid for pid in product_ids if pid not in striped])
+
+                    # Validate inventory availability INSIDE the lock (untracked products are skipped)
+                    for pid in product_ids:
+                        balance = balances.get(pid)
+                        if balance:
+                            available = balance.on_hand - balance.reserved
+                            if available < quantities[pid]:
+                                return Response({
+                                    'error': f'Insufficient inventory for {products[pid].name}. Available: {available}, Requested: {quantities[pid]}'
+                                }, status=status.HTTP_400_BAD_REQUEST)
 
                 # Create the order
                 order = Order.objects.create(
@@ -738,32 +935,18 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
                     patient=assignment.patient,
                     patient_assignment=assignment,
                     status='PLACED',
-                    placed_at=timezone.now()
+                    placed_at=timezone.now(),
+                    item_count=len(items),
+                    total_quantity=sum(quantities.values())
                 )
 
-                # Create order items and inventory movements
-                for check in inventory_checks:
-                    product = check['product']
-                    quantity = check['quantity']
-
-                    # Create order item
-                    OrderItem.objects.create(
-                        order=order,
-                        product=product,
-                        quantity=quantity,
-                        unit_label=product.unit_label
-                    )
-
-                    # Create inventory movement if product is tracked
-                    if check['balance']:
-                        InventoryMovement.objects.create(
-                            product=product,
-                            movement_type='RESERVE',
-                            quantity=quantity,
-                            order=order,
-                            created_by=request.user,
-                            note=f'Reserved for Order #{order.id} (created by staff)'
-                        )
+                # Create order items, then reserve inventory (only for tracked products)
+                _create_order_items(order, items, products)
+                context = run_hooks(
+                    '', 'PLACED', [order],
+                    changed_by=request.user,
+                    note_template='Reserved for Order #{order_id} (created by staff)'
+                )
 
                 # Create status event
                 OrderStatusEvent.objects.create(
@@ -774,42 +957,43 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
                     note='Order created by staff for patient'
                 )
 
-                # Broadcast via WebSocket
-                try:
-                    channel_layer = get_channel_layer()
-                    if channel_layer:
-                        # Notify staff dashboard
-                        async_to_sync(channel_layer.group_send)(
-                            'staff_orders',
-                            {
-                                'type': 'new_order',
-                                'order_id': order.id,
-                                'room_code': assignment.room.code if assignment.room else None,
-                                'device_uid': assignment.device.device_uid if assignment.device else None,
-                                'placed_at': order.placed_at.isoformat()
-                            }
-                        )
-
-                        # Notify kiosk (patient device) to redirect to order status
-                        if assignment.device:
-                            async_to_sync(channel_layer.group_send)(
-                                f'device_{assignment.device.id}',
-                                {
-                                    'type': 'order_created_by_staff',
-                                    'order_id': order.id,
-                                    'placed_at': order.placed_at.isoformat()
-                                }
-                            )
-                except Exception as ws_error:
-                    # Log but don't fail the request
-                    logger.error('WebSocket broadcast failed', exc_info=True)
+                # Broadcast via WebSocket (published after commit)
+                # Notify staff dashboard
+                broadcast_queue_event(
+                    {
+                        'type': 'new_order',
+                        'order_id': order.id,
+                        'room_code': assignment.room.code if assignment.room else None,
+                        'device_uid': assignment.device.device_uid if assignment.device else None,
+                        'placed_at': order.placed_at.isoformat(),
+                        'prep_delta': transition_prep_delta([(order, '', 'PLACED')], [context]),
+                    }
+                )
 
-                return Response({
-                    'success': True,
-                    'message': 'Order created successfully for patient',
-                    'order': PublicOrderSerializer(order, context={'request': request}).data
-                }, status=status.HTTP_201_CREATED)
+                # Notify kiosk (patient device) to redirect to order status
+                if assignment.device:
+                    enqueue_broadcast(
+                        f'device_{assignment.device.id}',
+                        {
+                            'type': 'order_created_by_staff',
+                            'order_id': order.id,
+                            'placed_at': order.placed_at.isoformat()
+                        }
+                    )
+
+            # Serialize outside the transaction so row locks are released first
+            _prefetch_items(order, products)
+            return Response({
+                'success': True,
+                'message': 'Order created successfully for patient',
+                'order': PublicOrderSerializer(order, context={'request': request}).data
+            }, status=status.HTTP_201_CREATED)
 
+        except InsufficientStock as exc:
+            # Optimistic reservation failed: the whole order was rolled back
+            return Response({
+                'error': f'Insufficient inventory for {products[exc.product_id].name}. Available: {exc.available}, Requested: {exc.requested}'
+            }, status=status.HTTP_400_BAD_REQUEST)
         except PatientAssignment.DoesNotExist:
             return Response({
                 'error': 'Patient assignment not found'
@@ -818,6 +1002,8 @@ class OrderManagementViewSet(viewsets.ReadOnlyModelViewSet):
             return Response({
                 'error': 'One or more products not found or inactive'
             }, status=status.HTTP_404_NOT_FOUND)
+        except OperationalError:
+            raise  # Retried by @transactional_retry
         except Exception as e:
             logger.error('Error creating order for patient', exc_info=True)
             return Response({
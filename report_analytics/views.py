@@ -1,11 +1,12 @@
 from datetime import datetime
 from django.db.models import Count, Avg, Sum, Q
+from django.db.models.functions import TruncDate
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from accounts.permissions import IsStaffOrAdmin
 
-from orders.models import Order, OrderItem
+from orders.archive import order_item_sources, order_sources
 from feedbacks.models import Feedback
 
 
@@ -35,22 +36,32 @@ class ReportsViewSet(viewsets.ViewSet):
             from_datetime = datetime.strptime(from_date, '%Y-%m-%d')
             to_datetime = datetime.strptime(to_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
 
-            # Query orders in date range
-            orders = Order.objects.filter(
-                placed_at__gte=from_datetime,
-                placed_at__lte=to_datetime
-            )
+            # Count orders in date range by day and status (hot and archived tables)
+            status_totals = {}
+            daily_totals = {}
+            for model in order_sources():
+                rows = model.objects.filter(
+                    placed_at__gte=from_datetime,
+                    placed_at__lte=to_datetime
+                ).annotate(
+                    date=TruncDate('placed_at')
+                ).values('date', 'status').annotate(count=Count('id')).order_by()
+
+                for row in rows:
+                    status_totals[row['status']] = status_totals.get(row['status'], 0) + row['count']
+                    day = daily_totals.setdefault(row['date'], {})
+                    day[row['status']] = day.get(row['status'], 0) + row['count']
 
             # Aggregate statistics
-            total_orders = orders.count()
+            total_orders = sum(status_totals.values())
 
             # Count by status
             status_counts = {
-                'placed': orders.filter(status='PLACED').count(),
-                'preparing': orders.filter(status='PREPARING').count(),
-                'ready': orders.filter(status='READY').count(),
-                'delivered': orders.filter(status='DELIVERED').count(),
-                'cancelled': orders.filter(status='CANCELLED').count(),
+                'placed': status_totals.get('PLACED', 0),
+                'preparing': status_totals.get('PREPARING', 0),
+                'ready': status_totals.get('READY', 0),
+                'delivered': status_totals.get('DELIVERED', 0),
+                'cancelled': status_totals.get('CANCELLED', 0),
             }
 
             # Group by date
@@ -59,19 +70,13 @@ class ReportsViewSet(viewsets.ViewSet):
             end_date = to_datetime.date()
 
             while current_date <= end_date:
-                day_start = datetime.combine(current_date, datetime.min.time())
-                day_end = datetime.combine(current_date, datetime.max.time())
-
-                day_orders = orders.filter(
-                    placed_at__gte=day_start,
-                    placed_at__lte=day_end
-                )
+                day = daily_totals.get(current_date, {})
 
                 daily_breakdown.append({
                     'date': current_date.isoformat(),
-                    'total': day_orders.count(),
-                    'delivered': day_orders.filter(status='DELIVERED').count(),
-                    'cancelled': day_orders.filter(status='CANCELLED').count(),
+                    'total': sum(day.values()),
+                    'delivered': day.get('DELIVERED', 0),
+                    'cancelled': day.get('CANCELLED', 0),
                 })
 
                 current_date = datetime.fromordinal(current_date.toordinal() + 1).date()
@@ -115,22 +120,34 @@ class ReportsViewSet(viewsets.ViewSet):
             from_datetime = datetime.strptime(from_date, '%Y-%m-%d')
             to_datetime = datetime.strptime(to_date, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
 
-            # Query order items in date range
-            order_items = OrderItem.objects.filter(
-                order__placed_at__gte=from_datetime,
-                order__placed_at__lte=to_datetime,
-                order__status='DELIVERED'  # Only count delivered orders
-            ).select_related('product')
-
-            # Aggregate by product
-            product_stats = order_items.values(
-                'product__id',
-                'product__name',
-                'product__category__name'
-            ).annotate(
-                total_quantity=Sum('quantity'),
-                order_count=Count('order', distinct=True)
-            ).order_by('-total_quantity')[:limit]
+            # Aggregate order items in date range by product (hot and archived tables)
+            stats_by_product = {}
+            for model in order_item_sources():
+                rows = model.objects.filter(
+                    order__placed_at__gte=from_datetime,
+                    order__placed_at__lte=to_datetime,
+                    order__status='DELIVERED'  # Only count delivered orders
+                ).values(
+                    'product__id',
+                    'product__name',
+                    'product__category__name'
+                ).annotate(
+                    total_quantity=Sum('quantity'),
+                    order_count=Count('order', distinct=True)
+                ).order_by()
+
+                for row in rows:
+                    stats = stats_by_product.get(row['product__id'])
+                    if stats is None:
+                        stats_by_product[row['product__id']] = row
+                    else:
+                        # An order is either hot or archived, so order counts add up
+                        stats['total_quantity'] += row['total_quantity']
+                        stats['order_count'] += row['order_count']
+
+            product_stats = sorted(
+                stats_by_product.values(), key=lambda row: row['total_quantity'], reverse=True
+            )[:limit]
 
             return Response({
                 'success': True,